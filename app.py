@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask import Flask, request, jsonify, send_from_directory, make_response, Response, stream_with_context, g
 from groq import Groq
 import json
 import hashlib
+import hmac
 from datetime import datetime
-from prompts import build_intelligent_diet_prompt, validate_response_format, flag_high_risk_case
+from prompts import (build_intelligent_diet_prompt, build_section_regeneration_prompt, validate_response_format,
+                     flag_high_risk_case, format_output_sections, SECTION_NAMES)
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -13,11 +15,40 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.pdfgen import canvas
 from reportlab.platypus.tableofcontents import TableOfContents
 import io
+import gzip
 import re
 import os
+import uuid
+import time
 
 # Import our nutrition database integration
-from nutrition_db import NutritionDatabaseIntegration
+from nutrition_db import NutritionDatabaseIntegration, medication_names, PREFETCH_MAX_ITEMS
+from batch import BatchPlanGenerator, parse_batch_profiles, BATCH_MAX_ITEMS
+from metabolics import calculate_population_metrics, summarize_population_metrics
+from llm_scheduler import LLMScheduler, priority_for
+from llm_hedging import HedgedCompletion
+from model_router import ModelRouter
+from local_planner import LocalMealPlanner
+from nutrition_verifier import NutritionVerifier
+from cache_maintenance import CacheSweeper, CACHE_SWEEP_ENABLED
+from plan_sections import SectionCache, split_plan_sections, merge_plan_sections, section_token_budget, SECTION_REGEN_ENABLED
+from plan_store import PlanStore
+from plan_codec import CompressedPlanCache, PLAN_DICT_TRAIN_SAMPLES, serialize as serialize_plan
+from deadlines import (DeadlineExceeded, request_deadline, remaining, DEADLINE_HEADER, DEADLINE_LLM_RESERVE,
+                       DEADLINE_MIN_LLM)
+from weekly_plan import WeeklyPlanGenerator, WEEKLY_MAX_DAYS, PROTEIN_ROTATION, GRAIN_ROTATION
+import flight_recorder
+from flight_recorder import FlightRecorder
+
+# Brotli is optional; responses fall back to gzip without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON/text responses at least this large are compressed when the client accepts it
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv')
 
 
 app = Flask(__name__)
@@ -27,17 +58,97 @@ app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
 app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 app.config['TESTING'] = False
 
+ANALYTICS_MAX_ROWS_RETURNED = int(os.environ.get('ANALYTICS_MAX_ROWS_RETURNED', 10000))
+RESPONSE_CACHE_FIELDS = ('bmr', 'bmi', 'bmi_category', 'bmi_advice', 'daily_calories', 'calorie_adjustment',
+                         'diet_plan', 'model')
+# When set, /admin/* endpoints require it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Read-only vocabularies, patterns and PDF styles are built at import time, so under gunicorn --preload
+# the master builds them once and every worker shares them copy-on-write
+MEDICAL_CORRECTIONS = {
+    'diabetis': 'diabetes',
+    'diabetic': 'diabetes',
+    'hypertenion': 'hypertension',
+    'hypertention': 'hypertension',
+    'high bp': 'hypertension',
+    'hart disease': 'heart disease',
+    'thyroids': 'thyroid',
+    'metformine': 'metformin',
+    'lisiniprol': 'lisinopril',
+    'lactos intolerant': 'lactose intolerant',
+    'glutten': 'gluten',
+    'shelfish': 'shellfish'
+}
+
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+SPACES_PATTERN = re.compile(r'[ \t]+')
+EMOJI_PATTERN = re.compile("["
+                           u"\U0001F600-\U0001F64F"
+                           u"\U0001F300-\U0001F5FF"
+                           u"\U0001F680-\U0001F6FF"
+                           u"\U0001F1E0-\U0001F1FF"
+                           u"\U00002702-\U000027B0"
+                           u"\U000024C2-\U0001F251"
+                           "]+", flags=re.UNICODE)
+BULLET_PATTERN = re.compile(r'[•·‣⁃]')
+
+PDF_STYLES = getSampleStyleSheet()
+PDF_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=PDF_STYLES['Heading1'],
+    fontSize=24,
+    spaceAfter=30,
+    alignment=TA_CENTER,
+    textColor=HexColor('#2563eb')
+)
+PDF_HEADER_STYLE = ParagraphStyle(
+    'CustomHeader',
+    parent=PDF_STYLES['Heading2'],
+    fontSize=16,
+    spaceAfter=12,
+    spaceBefore=20,
+    textColor=HexColor('#1e40af')
+)
+PDF_NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=PDF_STYLES['Normal'],
+    fontSize=11,
+    spaceAfter=6,
+    leading=14
+)
+
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY', "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")
-client = Groq(api_key=GROQ_API_KEY)
 # Get API keys
-USDA_API_KEY = "bPS4XM0z4cbbpuA7lK5qChEpnfhMGXTfYvfnctOQ"
+USDA_API_KEY = os.environ.get('USDA_API_KEY', "bPS4XM0z4cbbpuA7lK5qChEpnfhMGXTfYvfnctOQ")
 if not USDA_API_KEY:
     print("⚠️ WARNING: USDA_API_KEY not available")
 
+def response_cache_entry(result):
+    """The part of a generated result kept in the response cache"""
+    return {
+        **{field: result.get(field) for field in RESPONSE_CACHE_FIELDS},
+        'success': True,
+        'approach': 'intelligent_llm_with_nutrition_db'
+    }
+
+
+def response_cache_seeds(stored_results=()):
+    """Samples for the response cache's compression dictionary: stored plans, else the output format itself"""
+    seeds = [serialize_plan(response_cache_entry(result)) for result in stored_results if result.get('diet_plan')]
+    return seeds or [serialize_plan(format_output_sections(calories)) for calories in (1500, 2000, 2500)]
+
+
 class IntelligentDietPlanner:
-    def __init__(self):
-        self.client = client
-        self.response_cache = {}  # Simple in-memory cache
+    def __init__(self, seed_plans=()):
+        # Retries are handled by LLMScheduler so they respect the shared rate limits
+        self.client = Groq(api_key=GROQ_API_KEY, max_retries=0)
+        self.llm = LLMScheduler(self.client)
+        self.llm_hedger = HedgedCompletion(self.llm)
+        self.router = ModelRouter()
+        # Cached plans are held dictionary-compressed; seed_plans (recent stored results) train the dictionary
+        self.response_cache = CompressedPlanCache(response_cache_seeds(seed_plans))
+        self.section_cache = SectionCache()  # Per-section reuse when only some profile fields change
 
         # Initialize nutrition database integration
         if USDA_API_KEY:
@@ -57,6 +168,15 @@ class IntelligentDietPlanner:
             print("⚠️ Warning: USDA API key not provided, running without nutrition database")
             self.nutrition_db = None
 
+        # LLM-free fast path for low-risk profiles (uses USDA values already in the nutrition cache)
+        self.local_planner = LocalMealPlanner(self.nutrition_db)
+        self.verifier = NutritionVerifier(self.nutrition_db)
+
+        # Expired-row cleanup, size caps and compaction for nutrition_cache.db
+        self.cache_sweeper = CacheSweeper(self.nutrition_db) if self.nutrition_db else None
+        if self.cache_sweeper and CACHE_SWEEP_ENABLED:
+            self.cache_sweeper.start()
+
     def calculate_bmr(self, age, weight, height, gender):
         """Calculate Basal Metabolic Rate using Harris-Benedict equation"""
         age = float(age)
@@ -142,97 +262,144 @@ class IntelligentDietPlanner:
             'allergies': user_data.get('allergies', '').lower().strip(),
             'diet-type': user_data.get('diet-type'),
             'diet-goal': user_data.get('diet-goal'),
-            'exercise': user_data.get('exercise')
+            'exercise': user_data.get('exercise'),
+            # Preferences change the meals, so an edited profile must not get the previous plan back
+            'budget': str(user_data.get('budget', '')).strip(),
+            'cuisines': sorted(c.lower().strip() for c in user_data.get('cuisines') or []),
+            'food-preference': user_data.get('food-preference'),
+            'fasting': str(user_data.get('fasting', '')).lower().strip(),
+            'fasting-details': str(user_data.get('fasting-details', '')).lower().strip(),
+            'additional-health': str(user_data.get('additional-health', '')).lower().strip()
         }
         return hashlib.md5(json.dumps(cache_data, sort_keys=True).encode()).hexdigest()
 
-    def generate_intelligent_diet_plan(self, user_data):
-        """Generate diet plan using intelligent LLM approach"""
-        try:
-            # Map and validate user data
-            mapped_data = self.map_frontend_data(user_data)
-
-            # Basic calculations
-            height = float(mapped_data.get('height', 170))
-            weight = float(mapped_data.get('weight', 70))
-            age = int(mapped_data.get('age', 30))
-            gender = mapped_data.get('gender', 'male')
-
-            # Calculate BMI and BMR
-            bmi = self.calculate_bmi(weight, height)
-            bmi_info = self.get_bmi_category_and_advice(bmi)
-            bmr = self.calculate_bmr(age, weight, height, gender)
-
-            # Calculate daily calories
-            daily_calories = self.calculate_daily_calories(
-                bmr,
-                mapped_data.get('exercise', 'moderate'),
-                mapped_data.get('diet-goal', 'balanced'),
-                bmi_info['calorie_adjustment']
-            )
+    def prepare_profile(self, user_data):
+        """Mapped form data plus BMR, BMI and the daily calorie target: (mapped_data, bmr, bmi, bmi_info, daily_calories)"""
+        # Map and validate user data
+        mapped_data = self.map_frontend_data(user_data)
+
+        # Basic calculations
+        height = float(mapped_data.get('height', 170))
+        weight = float(mapped_data.get('weight', 70))
+        age = int(mapped_data.get('age', 30))
+        gender = mapped_data.get('gender', 'male')
+
+        # Calculate BMI and BMR
+        bmi = self.calculate_bmi(weight, height)
+        bmi_info = self.get_bmi_category_and_advice(bmi)
+        bmr = self.calculate_bmr(age, weight, height, gender)
+
+        # Calculate daily calories
+        daily_calories = self.calculate_daily_calories(
+            bmr,
+            mapped_data.get('exercise', 'moderate'),
+            mapped_data.get('diet-goal', 'balanced'),
+            bmi_info['calorie_adjustment']
+        )
+
+        # Update mapped data with calculated values
+        mapped_data.update({
+            'age': age,
+            'gender': gender,
+            'weight': weight,
+            'height': height,
+            'bmi': bmi,
+            'bmi_category': bmi_info['category']
+        })
 
-            # Update mapped data with calculated values
-            mapped_data.update({
-                'age': age,
-                'gender': gender,
-                'weight': weight,
-                'height': height,
-                'bmi': bmi,
-                'bmi_category': bmi_info['category']
-            })
+        return mapped_data, bmr, bmi, bmi_info, daily_calories
+
+    def generate_intelligent_diet_plan(self, user_data, batch=False, deadline=None):
+        """
+        Generate diet plan using intelligent LLM approach (batch=True queues behind interactive requests).
+        With a deadline (time.monotonic() value) every stage runs within the remaining budget; optional
+        stages are skipped when it is short. If the LLM cannot finish, profiles without medical details get a
+        degraded local plan and everyone else a deadline_exceeded error.
+        """
+        skipped_stages = []
+        try:
+            mapped_data, bmr, bmi, bmi_info, daily_calories = self.prepare_profile(user_data)
 
             # Check for high-risk cases using imported function
             is_high_risk, risk_condition = flag_high_risk_case(mapped_data)
 
+            # Sections the user asked to have rewritten even though their inputs are unchanged
+            regenerate_sections = [name for name in user_data.get('regenerate_sections') or [] if name in SECTION_NAMES]
+
             # Check cache for similar requests (skip cache for high-risk cases)
             cache_key = self.get_cache_key(mapped_data)
-            if cache_key in self.response_cache and not is_high_risk:
-                cached_response = self.response_cache[cache_key]
+            cached_response = None
+            if not is_high_risk and not regenerate_sections:
+                cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
                 print(f"Using cached response for similar case")
+                flight_recorder.record('response_cache', hit=True)
                 return {
                     **cached_response,
                     'cached': True,
                     'cache_key': cache_key[:8]
                 }
 
-            # Build intelligent prompt using imported function
-            prompt = build_intelligent_diet_prompt(mapped_data, daily_calories)
-
-            # Enhance prompt with nutrition database data if available
-            if self.nutrition_db:
-                try:
-                    enhanced_prompt = self.nutrition_db.enhance_llm_prompt_with_nutrition_data(
-                        prompt, mapped_data
-                    )
-                    print("✅ Prompt enhanced with nutrition database data")
-                except Exception as e:
-                    print(f"⚠️ Warning: Could not enhance prompt with nutrition data: {e}")
-                    enhanced_prompt = prompt
-            else:
-                enhanced_prompt = prompt
-
-            # Call LLM with optimal settings for consistency
-            response = self.client.chat.completions.create(
-                messages=[{
-                    "role": "system",
-                    "content": "You are a senior clinical nutritionist with access to USDA FoodData Central and RxNorm databases. Use this data to provide exact nutrition information and verified drug interactions. Always follow the exact format provided."
-                }, {
-                    "role": "user",
-                    "content": enhanced_prompt
-                }],
-                model="llama3-70b-8192",
-                temperature=0.1,  # Very low for consistency
-                max_tokens=2500,  # Increased for complete responses
-                top_p=0.9,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
-
-            diet_plan_content = response.choices[0].message.content
+            # Low-risk profiles are planned locally without an LLM call
+            local_plan = self.local_planner.plan(mapped_data, daily_calories, bmi, bmi_info, is_high_risk)
+            if local_plan:
+                print(f"⚡ Local plan generated in {local_plan[1]['elapsed_ms']}ms")
+                flight_recorder.record('local_plan', local_plan[1]['elapsed_ms'])
+                return self._local_plan_result(local_plan, bmr, bmi, bmi_info, daily_calories)
+
+            # Sections whose inputs are unchanged since an earlier plan are reused; only the rest go to the LLM
+            reused_sections = {}
+            if SECTION_REGEN_ENABLED and not is_high_risk:
+                reused_sections = self.section_cache.lookup(mapped_data, daily_calories, exclude=regenerate_sections)
+            stale_sections = [name for name in SECTION_NAMES if name not in reused_sections]
+            flight_recorder.record('section_cache', reused=len(reused_sections), stale=len(stale_sections))
+
+            # Route simple cases to the small model tier, complex and high-risk ones to the large tier
+            route = self.router.route(mapped_data, is_high_risk)
+            print(f"🧭 Routed to {route['tier']} model tier (score {route['score']:g})")
+
+            diet_plan_content = None
+            if reused_sections and stale_sections:
+                print(f"♻️ Reusing {len(reused_sections)} plan sections, regenerating {', '.join(stale_sections)}")
+                prompt = build_section_regeneration_prompt(mapped_data, daily_calories, reused_sections, stale_sections)
+                content, llm_info = self._complete_plan(
+                    self._enhance_prompt(prompt, mapped_data, deadline, skipped_stages), route, is_high_risk, batch,
+                    max_tokens=section_token_budget(stale_sections), deadline=deadline
+                )
+                new_sections = split_plan_sections(content, stale_sections)
+                if new_sections is not None:
+                    diet_plan_content = merge_plan_sections(reused_sections, new_sections)
+                    self.section_cache.record(len(reused_sections), len(stale_sections))
+                else:
+                    print("⚠️ Section regeneration response incomplete, generating the full plan")
+
+            if diet_plan_content is None:
+                reused_sections = {}
+                # Build intelligent prompt using imported function
+                prompt = build_intelligent_diet_prompt(mapped_data, daily_calories)
+                diet_plan_content, llm_info = self._complete_plan(
+                    self._enhance_prompt(prompt, mapped_data, deadline, skipped_stages), route, is_high_risk, batch,
+                    max_tokens=2500,  # Increased for complete responses
+                    deadline=deadline
+                )
 
             # Validate response format using imported function
             validation = validate_response_format(diet_plan_content)
 
+            # Check the plan's portions against cached nutrition data (cache hits only for interactive requests)
+            verification = None
+            if deadline is not None and remaining(deadline) <= 0:
+                skipped_stages.append('nutrition_verification')
+            elif self.nutrition_db and self.verifier.enabled:
+                try:
+                    with flight_recorder.stage('nutrition_verification'):
+                        verification = self.verifier.verify(diet_plan_content, daily_calories, batch=batch,
+                                                            deadline=deadline)
+                    if verification['discrepancies']:
+                        print(f"⚠️ Nutrition verification found {len(verification['discrepancies'])} discrepancies")
+                except Exception as e:
+                    print(f"⚠️ Warning: Nutrition verification failed: {e}")
+
             result = {
                 'success': True,
                 'bmr': int(bmr),
@@ -246,23 +413,23 @@ class IntelligentDietPlanner:
                 'risk_condition': risk_condition if is_high_risk else None,
                 'validation': validation,
                 'generated_at': datetime.now().isoformat(),
-                'approach': 'intelligent_llm_with_nutrition_db',
-                'nutrition_db_used': self.nutrition_db is not None
+                'approach': 'section_regeneration' if reused_sections else 'intelligent_llm_with_nutrition_db',
+                'nutrition_db_used': self.nutrition_db is not None,
+                'model': llm_info['model'],
+                'model_tier': route['tier'],
+                'complexity_score': route['score'],
+                'hedged': llm_info['hedged'],
+                'nutrition_verification': verification,
+                'reused_sections': list(reused_sections),
+                'regenerated_sections': stale_sections if reused_sections else SECTION_NAMES
             }
+            if skipped_stages:
+                result['skipped_stages'] = skipped_stages
 
             # Cache successful responses (except high-risk cases)
             if not is_high_risk and validation['valid']:
-                self.response_cache[cache_key] = {
-                    'success': True,
-                    'bmr': int(bmr),
-                    'bmi': bmi,
-                    'bmi_category': bmi_info['category'],
-                    'bmi_advice': bmi_info['advice'],
-                    'daily_calories': daily_calories,
-                    'calorie_adjustment': f"{int((bmi_info['calorie_adjustment'] - 1) * 100):+d}% based on BMI",
-                    'diet_plan': diet_plan_content,
-                    'approach': 'intelligent_llm_with_nutrition_db'
-                }
+                self.section_cache.store(mapped_data, daily_calories, diet_plan_content)
+                self.response_cache[cache_key] = response_cache_entry(result)
 
             # Add warnings for high-risk cases
             if is_high_risk:
@@ -276,6 +443,29 @@ class IntelligentDietPlanner:
 
             return result
 
+        except DeadlineExceeded as e:
+            # Only profiles that pass the local planner's medical checks get a degraded plan
+            local_plan = self.local_planner.plan(mapped_data, daily_calories, bmi, bmi_info, is_high_risk,
+                                                 degraded=True)
+            flight_recorder.annotate(degraded=bool(local_plan), degraded_reason=str(e))
+            print(f"⏱️ Deadline reached before the plan was generated ({e}), "
+                  f"{'serving a degraded plan' if local_plan else 'no degraded plan for this profile'}")
+            if not local_plan:
+                return {
+                    'success': False,
+                    'error': f'Plan could not be generated within the time budget: {e}',
+                    'error_type': 'deadline_exceeded'
+                }
+            return {
+                **self._local_plan_result(local_plan, bmr, bmi, bmi_info, daily_calories),
+                'approach': 'degraded_local',
+                'degraded': True,
+                'degraded_reason': str(e),
+                'skipped_stages': skipped_stages + ['llm_generation'],
+                'medical_warning': 'This simplified plan was issued because the full clinical analysis could not '
+                                   'finish in time. Please request a full plan or consult your healthcare provider.'
+            }
+
         except Exception as e:
             print(f"Error in generate_intelligent_diet_plan: {str(e)}")
             return {
@@ -284,29 +474,94 @@ class IntelligentDietPlanner:
                 'error_type': 'generation_error'
             }
 
+    def _local_plan_result(self, local_plan, bmr, bmi, bmi_info, daily_calories):
+        diet_plan_content, plan_details = local_plan
+        return {
+            'success': True,
+            'bmr': int(bmr),
+            'bmi': bmi,
+            'bmi_category': bmi_info['category'],
+            'bmi_advice': bmi_info['advice'],
+            'daily_calories': daily_calories,
+            'calorie_adjustment': f"{int((bmi_info['calorie_adjustment'] - 1) * 100):+d}% based on BMI",
+            'diet_plan': diet_plan_content,
+            'high_risk': False,
+            'risk_condition': None,
+            'validation': validate_response_format(diet_plan_content),
+            'generated_at': datetime.now().isoformat(),
+            'approach': 'local_optimizer',
+            'nutrition_db_used': False,
+            'model': None,
+            'plan_totals': plan_details['totals'],
+            'plan_targets': plan_details['targets']
+        }
+
+    def _enhance_prompt(self, prompt, mapped_data, deadline=None, skipped_stages=None):
+        """Enhance prompt with nutrition database data if available (and if it fits before the LLM reserve)"""
+        if not self.nutrition_db:
+            return prompt
+        enrich_deadline = None if deadline is None else deadline - DEADLINE_LLM_RESERVE
+        if enrich_deadline is not None and remaining(enrich_deadline) <= 0:
+            print("⏱️ Skipping nutrition enrichment, budget is reserved for the LLM call")
+            if skipped_stages is not None:
+                skipped_stages.append('nutrition_enrichment')
+            return prompt
+        try:
+            with flight_recorder.stage('nutrition_enrichment'):
+                enhanced_prompt = self.nutrition_db.enhance_llm_prompt_with_nutrition_data(prompt, mapped_data,
+                                                                                           enrich_deadline)
+            print("✅ Prompt enhanced with nutrition database data")
+            return enhanced_prompt
+        except Exception as e:
+            print(f"⚠️ Warning: Could not enhance prompt with nutrition data: {e}")
+            return prompt
+
+    def _complete_plan(self, prompt, route, is_high_risk, batch, max_tokens, deadline=None):
+        """Run one plan completion on the routed tier; returns (content, llm_info)"""
+        if deadline is not None and remaining(deadline) < DEADLINE_MIN_LLM:
+            raise DeadlineExceeded(f'{max(remaining(deadline), 0):.1f}s left, not enough for an LLM call')
+
+        # Call LLM with optimal settings for consistency, queued by priority under the rate limits
+        # (hedged when the primary model is slower than its p95)
+        llm_started = time.perf_counter()
+        try:
+            with flight_recorder.stage('llm', tier=route['tier'], max_tokens=max_tokens) as llm_stage:
+                response, llm_info = self.llm_hedger.create(
+                    priority=priority_for(is_high_risk, batch),
+                    models=route['models'],
+                    deadline=deadline,
+                    messages=[{
+                        "role": "system",
+                        "content": "You are a senior clinical nutritionist with access to USDA FoodData Central and RxNorm databases. Use this data to provide exact nutrition information and verified drug interactions. Always follow the exact format provided."
+                    }, {
+                        "role": "user",
+                        "content": prompt
+                    }],
+                    temperature=0.1,  # Very low for consistency
+                    max_tokens=max_tokens,
+                    top_p=0.9,
+                    frequency_penalty=0,
+                    presence_penalty=0
+                )
+                usage = getattr(response, 'usage', None)
+                llm_stage.update(model=llm_info['model'], hedged=llm_info['hedged'],
+                                 prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                                 completion_tokens=getattr(usage, 'completion_tokens', None))
+        except Exception:
+            self.router.record(route['tier'], time.perf_counter() - llm_started, success=False)
+            raise
+        self.router.record(route['tier'], time.perf_counter() - llm_started, success=True)
+
+        return response.choices[0].message.content, llm_info
+
     def preprocess_medical_text(self, text):
         """Preprocess medical text to handle common typos"""
         if not text or not isinstance(text, str):
             return text
 
-        medical_corrections = {
-            'diabetis': 'diabetes',
-            'diabetic': 'diabetes',
-            'hypertenion': 'hypertension',
-            'hypertention': 'hypertension',
-            'high bp': 'hypertension',
-            'hart disease': 'heart disease',
-            'thyroids': 'thyroid',
-            'metformine': 'metformin',
-            'lisiniprol': 'lisinopril',
-            'lactos intolerant': 'lactose intolerant',
-            'glutten': 'gluten',
-            'shelfish': 'shellfish'
-        }
-
         corrected_text = text.lower()
-        for typo, correction in medical_corrections.items():
-            corrected_text = corrected_text.replace(typo.lower(), correction.lower())
+        for typo, correction in MEDICAL_CORRECTIONS.items():
+            corrected_text = corrected_text.replace(typo, correction)
 
         if text and text[0].isupper():
             corrected_text = corrected_text.capitalize()
@@ -361,20 +616,10 @@ class IntelligentDietPlanner:
         if not text:
             return ""
 
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = re.sub(r'[ \t]+', ' ', text)
-
-        emoji_pattern = re.compile("["
-                                   u"\U0001F600-\U0001F64F"
-                                   u"\U0001F300-\U0001F5FF"
-                                   u"\U0001F680-\U0001F6FF"
-                                   u"\U0001F1E0-\U0001F1FF"
-                                   u"\U00002702-\U000027B0"
-                                   u"\U000024C2-\U0001F251"
-                                   "]+", flags=re.UNICODE)
-        text = emoji_pattern.sub('', text)
-
-        text = re.sub(r'[•·‣⁃]', '-', text)
+        text = BLANK_LINES_PATTERN.sub('\n\n', text)
+        text = SPACES_PATTERN.sub(' ', text)
+        text = EMOJI_PATTERN.sub('', text)
+        text = BULLET_PATTERN.sub('-', text)
 
         return text.strip()
 
@@ -392,33 +637,8 @@ class IntelligentDietPlanner:
                 bottomMargin=18
             )
 
-            styles = getSampleStyleSheet()
-
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                spaceAfter=30,
-                alignment=TA_CENTER,
-                textColor=HexColor('#2563eb')
-            )
-
-            header_style = ParagraphStyle(
-                'CustomHeader',
-                parent=styles['Heading2'],
-                fontSize=16,
-                spaceAfter=12,
-                spaceBefore=20,
-                textColor=HexColor('#1e40af')
-            )
-
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=11,
-                spaceAfter=6,
-                leading=14
-            )
+            styles = PDF_STYLES
+            title_style, header_style, normal_style = PDF_TITLE_STYLE, PDF_HEADER_STYLE, PDF_NORMAL_STYLE
 
             story = []
 
@@ -460,6 +680,15 @@ class IntelligentDietPlanner:
             ]
 
             for title, start, end in sections:
+                if title == 'Daily Meal Plan' and result.get('days'):
+                    # Multi-day plans get one block per day instead of a single run-on paragraph
+                    story.append(Paragraph(f"{len(result['days'])}-Day Meal Plan", header_style))
+                    for day in result['days']:
+                        story.append(Paragraph(f"{day['label']} - {day['focus']}", normal_style))
+                        story.append(Paragraph(self.clean_text_for_pdf(day['meal_plan']), normal_style))
+                        story.append(Spacer(1, 10))
+                    story.append(Spacer(1, 5))
+                    continue
                 section_text = self.extract_section_text(diet_plan_text, start, end)
                 if section_text and section_text != "Section not found":
                     story.append(Paragraph(title, header_style))
@@ -489,8 +718,30 @@ class IntelligentDietPlanner:
             return None
 
 
-# Initialize diet planner
-diet_planner = IntelligentDietPlanner()
+# Per-process state: the Groq client's connection pool, SQLite connections and background threads
+# must not cross fork(), so with gunicorn --preload these are created in each worker (gunicorn.conf.py)
+diet_planner = None
+batch_generator = None
+plan_store = None
+weekly_generator = None
+recorder = None
+
+
+def init_worker():
+    """Create this process's planner, stores and background threads"""
+    global diet_planner, batch_generator, plan_store, weekly_generator, recorder
+    plan_store = PlanStore()
+    diet_planner = IntelligentDietPlanner(seed_plans=plan_store.recent(PLAN_DICT_TRAIN_SAMPLES))
+    batch_generator = BatchPlanGenerator(diet_planner)
+    weekly_generator = WeeklyPlanGenerator(diet_planner)
+    recorder = FlightRecorder()
+    print(f"✅ Worker {os.getpid()} initialized")
+
+
+# gunicorn.conf.py sets DEFER_WORKER_INIT and calls init_worker() after fork; everything else
+# (python app.py, gunicorn without the config, scripts importing app) initializes on import
+if os.environ.get('DEFER_WORKER_INIT', '').lower() != 'true':
+    init_worker()
 
 
 # Routes
@@ -511,12 +762,13 @@ def generate_diet():
         user_data = request.json
         print("Received data:", {k: v for k, v in user_data.items() if k not in ['diagnosis', 'medicines']})
 
-        result = diet_planner.generate_intelligent_diet_plan(user_data)
+        deadline = request_deadline('generate_diet', request.headers.get(DEADLINE_HEADER))
+        result = diet_planner.generate_intelligent_diet_plan(user_data, deadline=deadline)
 
         print(
             f"Generated result - Success: {result.get('success', False)}, High Risk: {result.get('high_risk', False)}")
 
-        return jsonify(result)
+        return stored_plan_response(result)
 
     except Exception as e:
         print("Error in generate_diet endpoint:", str(e))
@@ -527,15 +779,190 @@ def generate_diet():
         })
 
 
-@app.route('/download_pdf', methods=['POST'])
+@app.route('/generate_weekly_plan', methods=['POST'])
+def generate_weekly_plan():
+    """Multi-day rotating plan: clinical sections once, each day's meals generated concurrently"""
+    try:
+        user_data = request.json
+        days = user_data.get('days', WEEKLY_MAX_DAYS)
+        try:
+            days = int(days)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'days must be a number'}), 400
+
+        deadline = request_deadline('generate_weekly_plan', request.headers.get(DEADLINE_HEADER))
+        result = weekly_generator.generate(user_data, days=days, deadline=deadline)
+        print(f"Generated weekly plan - Success: {result.get('success', False)}, Days: {result.get('plan_days')}")
+
+        return stored_plan_response(result)
+
+    except Exception as e:
+        print("Error in generate_weekly_plan endpoint:", str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': 'endpoint_error'
+        })
+
+
+def stored_plan_response(result):
+    """JSON response for a generated plan, saved to the plan store and tagged with its plan ID"""
+    if not result.get('success'):
+        return jsonify(result)
+
+    # Keep the plan server-side so the client can fetch it or its PDF by ID later
+    with flight_recorder.stage('plan_store_save'):
+        result['plan_id'] = plan_store.save(result)
+    # A client re-submitting for a plan it already holds gets 304 instead of the whole plan again
+    if request.if_none_match.contains_weak(result['plan_id']):
+        response = make_response('', 304)
+    else:
+        response = jsonify(result)
+    response.set_etag(result['plan_id'], weak=True)
+    response.headers['X-Plan-Id'] = result['plan_id']
+    return response
+
+
+@app.route('/generate_diet_batch', methods=['POST'])
+def generate_diet_batch():
+    """
+    Batch endpoint: accepts JSONL or CSV profiles and streams one NDJSON line per result as it completes.
+    Pass ?batch_id=<id> from a previous response to resume a batch without regenerating finished items.
+    """
+    try:
+        items = parse_batch_profiles(request.get_data(as_text=True), request.content_type)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Could not parse batch: {e}'}), 400
+
+    if not items:
+        return jsonify({'success': False, 'error': 'No profiles provided'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            'success': False,
+            'error': f'Batch too large: {len(items)} profiles (max {BATCH_MAX_ITEMS})'
+        }), 413
+
+    batch_id = request.args.get('batch_id') or uuid.uuid4().hex
+    print(f"Batch {batch_id[:8]}: {len(items)} profiles received")
+
+    def generate():
+        for event in batch_generator.stream(items, batch_id):
+            yield json.dumps(event) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Batch-Id'] = batch_id
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/prefetch', methods=['POST'])
+def prefetch():
+    """
+    Warm the caches from a partly filled form so the final submit finds its lookups cached.
+    Accepts any of medicines (comma-separated), diet-type and foods (list or comma-separated); returns at once.
+    """
+    if not diet_planner.nutrition_db:
+        return jsonify({'success': False, 'error': 'Nutrition database not initialized'}), 503
+
+    try:
+        data = request.json or {}
+        foods = data.get('foods') or []
+        if isinstance(foods, str):
+            foods = foods.split(',')
+        # Staple proteins and grains the plan is likely to use for this diet type
+        diet_type = str(data.get('diet-type', '')).lower()
+        if diet_type in PROTEIN_ROTATION:
+            foods = list(foods) + PROTEIN_ROTATION[diet_type] + GRAIN_ROTATION
+
+        report = diet_planner.nutrition_db.prefetch(medication_names(data.get('medicines', '')), foods)
+        return jsonify({'success': True, **report}), 202
+
+    except Exception as e:
+        print("Error in prefetch endpoint:", str(e))
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/analytics/cohort_metrics', methods=['POST'])
+def cohort_metrics():
+    """
+    Vectorized BMR/BMI/category/target-calorie analytics for a cohort.
+    Accepts columnar JSON ({"age": [...], "weight": [...], ...}), a JSON list of profiles,
+    or JSONL/CSV profiles. Add ?rows=1 to include per-profile values.
+    """
+    try:
+        if request.is_json:
+            payload = request.get_json()
+            profiles = payload.get('profiles') if isinstance(payload, dict) else payload
+        else:
+            items = parse_batch_profiles(request.get_data(as_text=True), request.content_type)
+            profiles = [profile for _, profile, error in items if not error]
+            payload = None
+
+        # Form defaults match map_frontend_data
+        if profiles is not None:
+            columns = {
+                'age': [p.get('age', '30') for p in profiles],
+                'weight': [p.get('weight', '70') for p in profiles],
+                'height': [p.get('height', '170') for p in profiles],
+                'gender': [p.get('gender', 'male') for p in profiles],
+                'exercise': [p.get('exercise', 'moderate') for p in profiles],
+                'diet-goal': [p.get('diet-goal', 'balanced') for p in profiles]
+            }
+        else:
+            columns = payload
+
+        count = len(columns.get('age', []))
+        metrics = calculate_population_metrics(
+            columns['age'],
+            columns['weight'],
+            columns['height'],
+            columns.get('gender') or ['male'] * count,
+            columns.get('exercise'),
+            columns.get('diet-goal')
+        )
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'error': f'Invalid cohort data: {e}'}), 400
+
+    response = {'success': True, 'summary': summarize_population_metrics(metrics)}
+
+    if request.args.get('rows', '').lower() in ('1', 'true', 'yes'):
+        limit = min(count, ANALYTICS_MAX_ROWS_RETURNED)
+        response['rows'] = {
+            'bmr': [int(v) for v in metrics['bmr'][:limit]],
+            'bmi': metrics['bmi'][:limit].tolist(),
+            'bmi_category': metrics['bmi_category'][:limit].tolist(),
+            'daily_calories': metrics['daily_calories'][:limit].tolist()
+        }
+        response['rows_truncated'] = count > limit
+
+    return jsonify(response)
+
+
+@app.route('/download_pdf', methods=['GET', 'POST'])
 def download_pdf():
-    """Generate and download PDF diet plan"""
+    """Generate and download PDF diet plan, from a stored plan_id or a posted result"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
+        plan_id = request.args.get('plan_id') or data.get('plan_id')
         user_data = data.get('user_data', {})
-        result = data.get('result', {})
 
-        pdf_data = diet_planner.generate_pdf_diet_plan(user_data, result)
+        if plan_id:
+            # The PDF also prints the posted user_data, so the same plan with other details is another PDF
+            user_data_hash = hashlib.sha256(json.dumps(user_data, sort_keys=True, default=str).encode()).hexdigest()
+            etag = f'{plan_id}-pdf-{user_data_hash[:16]}'
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+                response.set_etag(etag, weak=True)
+                return response
+            result = plan_store.get(plan_id)
+            if result is None:
+                return jsonify({'success': False, 'error': 'Plan not found'}), 404
+        else:
+            result = data.get('result', {})
+
+        with flight_recorder.stage('pdf_render', stored=bool(plan_id)) as render:
+            pdf_data = diet_planner.generate_pdf_diet_plan(user_data, result)
+            render['bytes'] = len(pdf_data) if pdf_data else 0
 
         if pdf_data is None:
             return jsonify({
@@ -547,6 +974,9 @@ def download_pdf():
         response.headers['Content-Type'] = 'application/pdf'
         response.headers[
             'Content-Disposition'] = f'attachment; filename="diet_plan_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
+        if plan_id:
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, max-age=86400'
 
         return response
 
@@ -558,6 +988,33 @@ def download_pdf():
         }), 500
 
 
+@app.route('/plans/<plan_id>', methods=['GET'])
+def get_plan(plan_id):
+    """Stored plan by ID; supports If-None-Match and is served from the stored gzip bytes when accepted"""
+    if request.if_none_match.contains_weak(plan_id):
+        # Only a plan that is still stored may be revalidated
+        if not plan_store.exists(plan_id):
+            return jsonify({'success': False, 'error': 'Plan not found'}), 404
+        response = make_response('', 304)
+    else:
+        compressed = plan_store.get_compressed(plan_id)
+        if compressed is None:
+            return jsonify({'success': False, 'error': 'Plan not found'}), 404
+
+        if request.accept_encodings['gzip'] and not (brotli and request.accept_encodings['br']):
+            response = make_response(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = make_response(gzip.decompress(compressed))
+        response.mimetype = 'application/json'
+        response.vary.add('Accept-Encoding')
+
+    # A plan ID names immutable content
+    response.set_etag(plan_id, weak=True)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
 @app.route('/test_nutrition_db', methods=['GET'])
 def test_nutrition_db():
     """Test nutrition database connections"""
@@ -586,6 +1043,14 @@ def test_nutrition_db():
                 'restrictions_count': len(aspirin_interactions.get('food_restrictions', []))
             },
             'api_status': api_status,
+            'cache_lookups': dict(diet_planner.nutrition_db.lookup_stats),
+            'indexed_foods': len(diet_planner.nutrition_db.food_index),
+            'l1_cache': {
+                'foods': diet_planner.nutrition_db.food_l1.get_stats(),
+                'drugs': diet_planner.nutrition_db.drug_l1.get_stats(),
+                'drug_names': diet_planner.nutrition_db.drug_name_l1.get_stats()
+            },
+            'drug_resolution': diet_planner.nutrition_db.get_drug_resolution_stats(),
             'database_ready': True
         })
 
@@ -597,6 +1062,67 @@ def test_nutrition_db():
         })
 
 
+@app.route('/nutrition/foods', methods=['GET'])
+def query_cached_foods():
+    """Query cached foods by nutrient limits, e.g. /nutrition/foods?max_sodium_mg=100"""
+    if not diet_planner.nutrition_db:
+        return jsonify({'success': False, 'error': 'Nutrition database not initialized'}), 503
+
+    filters = {}
+    for name in ('max_sodium_mg', 'max_calories', 'min_protein_g', 'min_fiber_g', 'max_potassium_mg'):
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                filters[name] = float(value)
+            except ValueError:
+                return jsonify({'success': False, 'error': f'{name} must be a number'}), 400
+
+    foods = diet_planner.nutrition_db.query_foods(limit=min(request.args.get('limit', 50, type=int), 500), **filters)
+    return jsonify({'success': True, 'filters': filters, 'count': len(foods), 'foods': foods})
+
+
+@app.route('/nutrition/drug_interactions', methods=['GET'])
+def drug_interactions():
+    """Interactions between medications taken together, e.g. /nutrition/drug_interactions?medicines=warfarin,aspirin"""
+    if not diet_planner.nutrition_db:
+        return jsonify({'success': False, 'error': 'Nutrition database not initialized'}), 503
+
+    medications = medication_names(request.args.get('medicines', ''))
+    if len(medications) < 2:
+        return jsonify({'success': False, 'error': 'At least two medicines are needed'}), 400
+    if len(medications) > PREFETCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'At most {PREFETCH_MAX_ITEMS} medicines per request'}), 400
+
+    return jsonify({'success': True, **diet_planner.nutrition_db.get_drug_drug_interactions(medications)})
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Nutrition cache size, expired rows and sweeper activity; ?sweep=true runs a pass first"""
+    if not diet_planner.cache_sweeper:
+        return jsonify({'success': False, 'error': 'Nutrition database not initialized'}), 503
+
+    try:
+        last_sweep = None
+        if request.args.get('sweep', '').lower() == 'true':
+            last_sweep = diet_planner.cache_sweeper.sweep()
+        return jsonify({
+            'success': True,
+            'swept': last_sweep is not None,
+            **diet_planner.cache_sweeper.get_stats(),
+            'l1_cache': {
+                'foods': diet_planner.nutrition_db.food_l1.get_stats(),
+                'drugs': diet_planner.nutrition_db.drug_l1.get_stats(),
+                'drug_names': diet_planner.nutrition_db.drug_name_l1.get_stats()
+            },
+            'drug_resolution': diet_planner.nutrition_db.get_drug_resolution_stats(),
+            'cache_lookups': dict(diet_planner.nutrition_db.lookup_stats),
+            'background_refresh': diet_planner.nutrition_db.refresher.get_stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -604,16 +1130,118 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'cache_size': len(diet_planner.response_cache),
-        'nutrition_db_active': diet_planner.nutrition_db is not None
+        'response_cache': diet_planner.response_cache.get_stats(),
+        'nutrition_db_active': diet_planner.nutrition_db is not None,
+        'llm_scheduler': diet_planner.llm.get_stats(),
+        'llm_hedging': diet_planner.llm_hedger.get_stats(),
+        'local_planner': diet_planner.local_planner.get_stats(),
+        'section_cache': diet_planner.section_cache.get_stats(),
+        'plan_store': plan_store.get_stats()
     })
 
 
+@app.route('/metrics/routing', methods=['GET'])
+def routing_metrics():
+    """Model routing split and per-tier LLM latency"""
+    return jsonify(diet_planner.router.get_stats())
+
+
+def admin_denied():
+    """Error response for an admin call that may not proceed, else None.
+    The admin endpoints exist only when ADMIN_TOKEN is set, and then need it in X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'success': False, 'error': 'Admin token required'}), 403
+    return None
+
+
+@app.route('/admin/flight_recorder', methods=['GET'])
+def flight_recorder_status():
+    """This worker's slowest recent requests with their stage timelines (?limit=N)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be a number'}), 400
+    return jsonify({'success': True, 'worker_pid': os.getpid(), **recorder.get_stats(limit)})
+
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def profiler():
+    """
+    GET: aggregated profiler samples (?format=collapsed for flamegraph.pl input).
+    POST {"sample_percent": 0-100, "interval_ms": N, "reset": bool}: switch sampling on/off for this worker.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            recorder.profiler.configure(data.get('sample_percent'), data.get('interval_ms'), bool(data.get('reset')))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'sample_percent and interval_ms must be numbers'}), 400
+        print(f"🔬 Profiler sampling {recorder.profiler.sample_percent:g}% of requests on worker {os.getpid()}")
+
+    if request.args.get('format') == 'collapsed':
+        return Response(recorder.profiler.collapsed(), mimetype='text/plain')
+    return jsonify({'success': True, 'worker_pid': os.getpid(), **recorder.profiler.get_stats()})
+
+
+# Every request gets a flight recorder timeline, finished (and logged if slow) on teardown
+@app.before_request
+def start_timeline():
+    if recorder is not None:
+        g.flight_recorder_timeline = recorder.start(request.endpoint, request.method, request.path)
+
+
+@app.teardown_request
+def finish_timeline(exc):
+    timeline = g.pop('flight_recorder_timeline', None)
+    if timeline is not None:
+        if exc is not None:
+            timeline.attributes['error'] = str(exc)
+        recorder.finish(timeline)
+
+
 # Add CORS headers for production
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', f'Content-Type,Authorization,If-None-Match,{DEADLINE_HEADER}')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag,X-Plan-Id,X-Batch-Id,X-Request-Id')
+    timeline = flight_recorder.current()
+    if timeline is not None:
+        response.headers['X-Request-Id'] = timeline.request_id
+        flight_recorder.annotate(status=response.status_code)
+    with flight_recorder.stage('compress'):
+        return compress_response(response)
+
+
+def compress_response(response):
+    """Brotli- or gzip-encode buffered JSON/text responses for clients that accept it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if brotli and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
     return response
 
 
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+
+# CSV columns that hold lists in the JSON form payload
+CSV_LIST_FIELDS = ('cuisines',)
+
+
+def parse_batch_profiles(body, content_type=''):
+    """
+    Parse a JSONL or CSV request body into profiles.
+    Returns a list of (index, profile, error) tuples; malformed lines get an error instead of a profile.
+    """
+    content_type = (content_type or '').lower()
+    is_csv = 'csv' in content_type or (not content_type.startswith('application/') and _looks_like_csv(body))
+
+    items = []
+    if is_csv:
+        reader = csv.DictReader(io.StringIO(body))
+        for index, row in enumerate(reader):
+            profile = {k.strip(): (v or '').strip() for k, v in row.items() if k}
+            for field in CSV_LIST_FIELDS:
+                if field in profile:
+                    profile[field] = [c.strip() for c in profile[field].replace('|', ';').split(';') if c.strip()]
+            items.append((index, profile, None))
+    else:
+        index = 0
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                profile = json.loads(line)
+                if not isinstance(profile, dict):
+                    raise ValueError('each line must be a JSON object')
+                items.append((index, profile, None))
+            except ValueError as e:
+                items.append((index, None, f'Invalid JSON line: {e}'))
+            index += 1
+
+    return items
+
+
+def _looks_like_csv(body):
+    first_line = body.lstrip().split('\n', 1)[0]
+    return not first_line.startswith('{') and ',' in first_line
+
+
+class BatchProgressStore:
+    """
+    SQLite record of finished batch items, keyed by batch ID and profile cache key.
+    Lets a client resubmit the same batch with its batch ID and only pay for the items that did not finish.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.environ.get('BATCH_PROGRESS_DB', 'batch_progress.db')
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT,
+                cache_key TEXT,
+                result_data TEXT,
+                completed_date TEXT,
+                PRIMARY KEY (batch_id, cache_key)
+            )
+        ''')
+        self.conn.commit()
+
+    def get_completed(self, batch_id):
+        """Map of cache_key -> stored result for a batch"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT cache_key, result_data FROM batch_items WHERE batch_id = ?", (batch_id,)
+            )
+            return {row[0]: json.loads(row[1]) for row in cursor}
+
+    def mark_completed(self, batch_id, cache_key, result):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO batch_items VALUES (?, ?, ?, ?)",
+                (batch_id, cache_key, json.dumps(result), datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+
+class BatchPlanGenerator:
+    """Deduplicates a batch of profiles and generates plans with bounded concurrency"""
+
+    def __init__(self, planner, progress_store=None, concurrency=None):
+        self.planner = planner
+        self.progress = progress_store or BatchProgressStore()
+        self.concurrency = concurrency or BATCH_CONCURRENCY
+
+    def _generate(self, batch_id, cache_key, profile):
+        """Runs in a pool thread; persists successful results so progress survives a dropped stream"""
+        # Batch priority: the LLM scheduler serves interactive requests first
+        result = self.planner.generate_intelligent_diet_plan(profile, batch=True)
+
+        if result.get('success'):
+            self.progress.mark_completed(batch_id, cache_key, result)
+        return result
+
+    def stream(self, items, batch_id=None):
+        """
+        Generate plans for parsed batch items, yielding one dict per event as soon as it is available:
+        a 'batch' header, one 'item' per input profile (in completion order) and a final 'summary'.
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        started = time.time()
+        completed = self.progress.get_completed(batch_id)
+
+        # Group input indices by cache key so identical profiles are generated once
+        groups = {}
+        parse_errors = []
+        for index, profile, error in items:
+            if error:
+                parse_errors.append((index, error))
+                continue
+            try:
+                cache_key = self.planner.get_cache_key(self.planner.map_frontend_data(profile))
+            except (AttributeError, TypeError, ValueError) as e:
+                # A row with wrongly typed fields (e.g. "diagnosis": null) fails alone, not the whole stream
+                parse_errors.append((index, f'Invalid profile: {e}'))
+                continue
+            group = groups.setdefault(cache_key, {'profile': profile, 'items': []})
+            group['items'].append((index, profile.get('id')))
+
+        yield {
+            'type': 'batch',
+            'batch_id': batch_id,
+            'total': len(items),
+            'unique': len(groups),
+            'resumed': sum(1 for key in groups if key in completed)
+        }
+
+        counts = {'succeeded': 0, 'failed': 0, 'duplicates': 0}
+
+        for index, error in parse_errors:
+            counts['failed'] += 1
+            yield {'type': 'item', 'index': index, 'status': 'error', 'success': False, 'error': error}
+
+        def emit(cache_key, result, resumed=False):
+            first_index = groups[cache_key]['items'][0][0]
+            for position, (index, client_id) in enumerate(groups[cache_key]['items']):
+                event = {
+                    'type': 'item',
+                    'index': index,
+                    'id': client_id,
+                    'cache_key': cache_key[:8],
+                    'status': 'ok' if result.get('success') else 'error',
+                    'success': bool(result.get('success'))
+                }
+                if position:
+                    event['duplicate_of'] = first_index
+                    counts['duplicates'] += 1
+                if resumed:
+                    event['resumed'] = True
+                if result.get('success'):
+                    event['result'] = result
+                    counts['succeeded'] += 1
+                else:
+                    event['error'] = result.get('error', 'Generation failed')
+                    counts['failed'] += 1
+                yield event
+
+        for cache_key in groups:
+            if cache_key in completed:
+                yield from emit(cache_key, completed[cache_key], resumed=True)
+
+        pending = [key for key in groups if key not in completed]
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        futures = {}
+        try:
+            for key in pending:
+                futures[executor.submit(self._generate, batch_id, key, groups[key]['profile'])] = key
+            for future in as_completed(futures):
+                cache_key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'success': False, 'error': str(e), 'error_type': 'generation_error'}
+                yield from emit(cache_key, result)
+        finally:
+            # If the client disconnects, drop queued work; in-flight items still finish and are persisted
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        yield {
+            'type': 'summary',
+            'batch_id': batch_id,
+            **counts,
+            'elapsed_seconds': round(time.time() - started, 2)
+        }
@@ -0,0 +1,203 @@
+"""
+Background maintenance for nutrition_cache.db.
+
+Expired rows are only skipped at read time, so without a sweeper the file
+grows forever. CacheSweeper periodically deletes expired rows in small
+batches, evicts least-recently-used rows past the size caps and hands freed
+pages back to the filesystem with incremental vacuum.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from nutrition_db import FOOD_STALE_GRACE, DRUG_STALE_GRACE
+
+
+CACHE_SWEEP_ENABLED = os.environ.get('CACHE_SWEEP_ENABLED', 'true').lower() == 'true'
+CACHE_SWEEP_INTERVAL = float(os.environ.get('CACHE_SWEEP_INTERVAL_SECONDS', 300))
+# Rows deleted per transaction; the cache lock is released between batches so lookups are not stalled
+CACHE_SWEEP_BATCH = int(os.environ.get('CACHE_SWEEP_BATCH', 200))
+CACHE_MAX_FOOD_ROWS = int(os.environ.get('CACHE_MAX_FOOD_ROWS', 50000))
+CACHE_MAX_DRUG_ROWS = int(os.environ.get('CACHE_MAX_DRUG_ROWS', 10000))
+CACHE_MAX_DRUG_PAIR_ROWS = int(os.environ.get('CACHE_MAX_DRUG_PAIR_ROWS', 20000))
+CACHE_MAX_DRUG_NAME_ROWS = int(os.environ.get('CACHE_MAX_DRUG_NAME_ROWS', 20000))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 100 * 1024 * 1024))
+# Free pages released per sweep; the rest stay in the freelist for the next one
+CACHE_VACUUM_PAGES = int(os.environ.get('CACHE_VACUUM_PAGES', 1000))
+
+TABLE_KEYS = {'food_nutrition': 'food_name', 'drug_cache': 'drug_name', 'drug_pair_cache': 'pair_key',
+              'drug_name_map': 'name'}
+# Rows are only deleted once they are past expiry and the stale-while-revalidate grace window
+# (drug pairs and name mappings are not served stale; an expired one is looked up again when next needed)
+TABLE_GRACE = {'food_nutrition': FOOD_STALE_GRACE, 'drug_cache': DRUG_STALE_GRACE, 'drug_pair_cache': 0,
+               'drug_name_map': 0}
+
+
+class CacheSweeper:
+    """Daemon thread that expires, caps and compacts the nutrition cache"""
+
+    def __init__(self, nutrition_db, interval=None, batch_size=None, max_rows=None, max_bytes=None):
+        self.nutrition_db = nutrition_db
+        self.interval = CACHE_SWEEP_INTERVAL if interval is None else interval
+        self.batch_size = CACHE_SWEEP_BATCH if batch_size is None else batch_size
+        self.max_rows = max_rows or {'food_nutrition': CACHE_MAX_FOOD_ROWS, 'drug_cache': CACHE_MAX_DRUG_ROWS,
+                                     'drug_pair_cache': CACHE_MAX_DRUG_PAIR_ROWS,
+                                     'drug_name_map': CACHE_MAX_DRUG_NAME_ROWS}
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.sweeps = 0
+        self.totals = {'expired_deleted': 0, 'evicted': 0, 'pages_vacuumed': 0}
+        self.last_sweep = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='cache-sweeper', daemon=True)
+        self.thread.start()
+        print(f"🧹 Cache sweeper started (every {self.interval:.0f}s)")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Cache sweep failed: {e}")
+
+    def sweep(self):
+        """One full maintenance pass; returns its report"""
+        started = time.monotonic()
+        accessed = self.nutrition_db.flush_access_times()
+
+        expired = {table: self._delete_expired(table) for table in TABLE_KEYS}
+        evicted = {table: self._evict_over_row_cap(table) for table in TABLE_KEYS}
+        evicted_for_size = self._evict_over_byte_cap()
+        pages = self._incremental_vacuum()
+
+        report = {
+            'finished_at': datetime.now().isoformat(),
+            'duration_ms': round((time.monotonic() - started) * 1000, 2),
+            'access_times_flushed': accessed,
+            'expired_deleted': expired,
+            'evicted_row_cap': evicted,
+            'evicted_byte_cap': evicted_for_size,
+            'pages_vacuumed': pages
+        }
+        with self.lock:
+            self.sweeps += 1
+            self.totals['expired_deleted'] += sum(expired.values())
+            self.totals['evicted'] += sum(evicted.values()) + sum(evicted_for_size.values())
+            self.totals['pages_vacuumed'] += pages
+            self.last_sweep = report
+
+        removed = sum(expired.values()) + sum(evicted.values()) + sum(evicted_for_size.values())
+        if removed:
+            print(f"🧹 Cache sweep removed {removed} rows, released {pages} pages")
+        return report
+
+    def _delete_batches(self, table, select_sql, params, limit=None):
+        """Delete rows chosen by select_sql (which must end in LIMIT ?) one batch per lock hold"""
+        db = self.nutrition_db
+        deleted = 0
+        while not self.stop_event.is_set():
+            batch = self.batch_size if limit is None else min(self.batch_size, limit - deleted)
+            if batch <= 0:
+                break
+            with db.lock:
+                keys = [row[0] for row in db.conn.execute(select_sql, params + [batch])]
+                deleted += db.delete_cached_rows(table, keys)
+            if len(keys) < batch:
+                break
+            # Let queued lookups take the lock before the next batch
+            time.sleep(0)
+        return deleted
+
+    def _delete_expired(self, table):
+        key = TABLE_KEYS[table]
+        return self._delete_batches(
+            table, f"SELECT {key} FROM {table} WHERE expires_at <= ? LIMIT ?", [int(time.time()) - TABLE_GRACE[table]]
+        )
+
+    def _evict_lru(self, table, count):
+        key = TABLE_KEYS[table]
+        return self._delete_batches(
+            table, f"SELECT {key} FROM {table} ORDER BY last_accessed, {key} LIMIT ?", [], limit=count
+        )
+
+    def _evict_over_row_cap(self, table):
+        cap = self.max_rows.get(table)
+        if not cap:
+            return 0
+        rows = self._count(table)
+        return self._evict_lru(table, rows - cap) if rows > cap else 0
+
+    def _evict_over_byte_cap(self):
+        """Evict food rows (then drug and drug pair rows) oldest-access-first until live pages fit in max_bytes"""
+        evicted = {table: 0 for table in TABLE_KEYS}
+        if not self.max_bytes:
+            return evicted
+        for table in ('food_nutrition', 'drug_cache', 'drug_pair_cache'):
+            while self._storage()['used_bytes'] > self.max_bytes and not self.stop_event.is_set():
+                removed = self._evict_lru(table, self.batch_size)
+                evicted[table] += removed
+                if not removed:
+                    break
+        return evicted
+
+    def _incremental_vacuum(self):
+        db = self.nutrition_db
+        with db.lock:
+            free_before = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_before:
+                return 0
+            # executescript steps the pragma to completion; execute() would free a single page
+            db.conn.executescript(f"PRAGMA incremental_vacuum({int(CACHE_VACUUM_PAGES)})")
+            free_after = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return free_before - free_after
+
+    def _count(self, table, where='', params=()):
+        db = self.nutrition_db
+        with db.lock:
+            return db.conn.execute(f"SELECT COUNT(*) FROM {table} {where}", params).fetchone()[0]
+
+    def _storage(self):
+        db = self.nutrition_db
+        with db.lock:
+            page_size = db.conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = db.conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {
+            'file_bytes': page_size * page_count,
+            'used_bytes': page_size * (page_count - free_pages),
+            'free_bytes': page_size * free_pages
+        }
+
+    def get_stats(self):
+        now = int(time.time())
+        tables = {
+            table: {
+                'rows': self._count(table),
+                'stale_rows': self._count(table, 'WHERE expires_at <= ? AND expires_at > ?',
+                                          (now, now - TABLE_GRACE[table])),
+                'expired_rows': self._count(table, 'WHERE expires_at <= ?', (now - TABLE_GRACE[table],)),
+                'max_rows': self.max_rows.get(table)
+            }
+            for table in TABLE_KEYS
+        }
+        with self.lock:
+            sweeps, totals, last_sweep = self.sweeps, dict(self.totals), self.last_sweep
+        return {
+            'enabled': self.thread is not None,
+            'interval_seconds': self.interval,
+            'batch_size': self.batch_size,
+            'tables': tables,
+            'storage': {**self._storage(), 'max_bytes': self.max_bytes},
+            'sweeps': sweeps,
+            'totals': totals,
+            'last_sweep': last_sweep
+        }
@@ -0,0 +1,68 @@
+"""
+Background re-fetching of cache entries for stale-while-revalidate.
+
+Readers serve a stale entry immediately and hand its key to the refresher,
+which re-fetches it off the request path. Keys are deduplicated while a
+refresh is queued or running, and upstream calls are rate-limited so a burst
+of stale reads cannot flood USDA or RxNorm.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_scheduler import TokenBucket
+
+
+REFRESH_WORKERS = int(os.environ.get('CACHE_REFRESH_WORKERS', 2))
+REFRESH_PER_MINUTE = float(os.environ.get('CACHE_REFRESH_PER_MINUTE', 60))
+
+
+class BackgroundRefresher:
+    """Runs refresh(key) jobs on a small pool, at most one per key and REFRESH_PER_MINUTE overall"""
+
+    def __init__(self, workers=None, per_minute=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or REFRESH_WORKERS,
+                                           thread_name_prefix='cache-refresh')
+        self.bucket = TokenBucket(per_minute or REFRESH_PER_MINUTE)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'rate_limited': 0, 'succeeded': 0, 'failed': 0}
+
+    def submit(self, key, refresh, *args):
+        """Queue refresh(*args) unless key is already pending; returns True if it was queued.
+        Rate-limited submissions are dropped: the entry is still stale, so the next read retries."""
+        with self.lock:
+            if key in self.pending:
+                self.stats['deduplicated'] += 1
+                return False
+            if self.bucket.wait_time(1, time.monotonic()) > 0:
+                self.stats['rate_limited'] += 1
+                return False
+            self.bucket.consume(1)
+            self.pending.add(key)
+            self.stats['submitted'] += 1
+
+        self.executor.submit(self._run, key, refresh, args)
+        return True
+
+    def _run(self, key, refresh, args):
+        try:
+            refresh(*args)
+            outcome = 'succeeded'
+        except Exception as e:
+            print(f"⚠️ Background refresh of {key} failed: {e}")
+            outcome = 'failed'
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def is_pending(self, key):
+        with self.lock:
+            return key in self.pending
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'pending': len(self.pending), 'per_minute': self.bucket.capacity}
@@ -0,0 +1,395 @@
+"""
+Cohort plan generation from the patient-records schema (db/data_setup.sql).
+
+Patients are streamed through a single SQLite cursor ordered by patient_id,
+so memory stays flat however large the cohort is. Each patient's diagnoses
+and medications are assembled into the same user_data the web form sends,
+plans are deduplicated by get_cache_key and generated with bounded
+concurrency, and a per-run checkpoint makes interrupted runs resumable.
+
+The schema records no height or weight, so a run needs them stated explicitly
+(--height-cm/--weight-kg, or "height"/"weight" in --defaults). They apply to
+every patient; BMI and calorie targets are computed from them, and each stored
+plan carries them under "assumed_measurements" so they are not mistaken for
+measured values.
+
+Usage:
+    python cohort_pipeline.py init --db cohort.db [--synthesize 20000]
+    python cohort_pipeline.py run --db cohort.db --out cohort_plans.db --run-id nightly --height-cm 170 --weight-kg 75
+    python cohort_pipeline.py run --db cohort.db --out cohort_plans.db --run-id nightly --height-cm 170 --weight-kg 75 --retry-failed
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime
+
+DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db')
+SQLITE_SCHEMA = os.path.join(DB_DIR, 'sqlite_schema.sql')
+SEED_DATA = os.path.join(DB_DIR, 'data_setup.sql')
+
+GENDER_MAP = {'M': 'male', 'F': 'female', 'Other': 'other'}
+# Form fields the patient records have no column for; a run must supply them
+REQUIRED_PROFILE_DEFAULTS = ('height', 'weight')
+
+# One row per patient/diagnosis/medication; LEFT JOINs keep patients without diagnoses or medications
+PATIENT_STREAM_QUERY = '''
+    SELECT p.patient_id, p.date_of_birth, p.gender,
+           d.icd10_code, d.diagnosis_description, m.medication_name
+    FROM patients p
+    LEFT JOIN visits v ON v.patient_id = p.patient_id
+    LEFT JOIN diagnoses d ON d.visit_id = v.visit_id
+    LEFT JOIN medications m ON m.diagnosis_id = d.diagnosis_id
+    WHERE p.patient_id > ? {extra_filter}
+    ORDER BY p.patient_id, v.visit_date, d.diagnosis_id, m.medication_id
+'''
+
+
+def init_cohort_db(db_path, seed=True, synthesize=0):
+    """Create the SQLite port of the schema and load the sample records from data_setup.sql"""
+    conn = sqlite3.connect(db_path)
+    with open(SQLITE_SCHEMA) as f:
+        conn.executescript(f.read())
+
+    if seed and not conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]:
+        with open(SEED_DATA) as f:
+            seed_sql = f.read()
+        # The INSERT statements are portable; the MySQL DDL and views are replaced by sqlite_schema.sql
+        inserts = re.findall(r'^INSERT INTO .*?;\s*$', seed_sql, flags=re.MULTILINE | re.DOTALL)
+        conn.executescript('\n'.join(inserts))
+
+    if synthesize:
+        _synthesize_patients(conn, synthesize)
+
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    conn.close()
+    return count
+
+
+def _synthesize_patients(conn, count, rng=None):
+    """Add synthetic patients that reuse the seed diagnoses and medications, for scale testing"""
+    rng = rng or random.Random(42)
+    templates = {}
+    for icd10, description, medication, dosage, frequency in conn.execute('''
+        SELECT d.icd10_code, d.diagnosis_description, m.medication_name, m.dosage, m.frequency
+        FROM diagnoses d LEFT JOIN medications m ON m.diagnosis_id = d.diagnosis_id
+    '''):
+        template = templates.setdefault(icd10, {'description': description, 'medications': []})
+        if medication:
+            template['medications'].append((medication, dosage, frequency))
+    template_list = list(templates.items())
+
+    for start in range(0, count, 1000):
+        for _ in range(min(1000, count - start)):
+            dob = date(rng.randint(1940, 2005), rng.randint(1, 12), rng.randint(1, 28)).isoformat()
+            cursor = conn.execute(
+                "INSERT INTO patients (first_name, last_name, date_of_birth, gender) VALUES (?, ?, ?, ?)",
+                ('Synthetic', f'Patient{start}', dob, rng.choice(['M', 'F']))
+            )
+            patient_id = cursor.lastrowid
+            for icd10, template in rng.sample(template_list, rng.randint(0, 2)):
+                visit_date = date(2024, rng.randint(1, 12), rng.randint(1, 28)).isoformat()
+                visit_id = conn.execute(
+                    "INSERT INTO visits (patient_id, visit_date, doctor_name) VALUES (?, ?, ?)",
+                    (patient_id, visit_date, 'Dr. Synthetic')
+                ).lastrowid
+                diagnosis_id = conn.execute(
+                    "INSERT INTO diagnoses (visit_id, icd10_code, diagnosis_description, diagnosis_date) "
+                    "VALUES (?, ?, ?, ?)",
+                    (visit_id, icd10, template['description'], visit_date)
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO medications (diagnosis_id, medication_name, dosage, frequency, duration, "
+                    "prescribed_date) VALUES (?, ?, ?, ?, '30 days', ?)",
+                    [(diagnosis_id, name, dosage, frequency, visit_date) for name, dosage, frequency in
+                     template['medications']]
+                )
+        conn.commit()
+
+
+def age_on(date_of_birth, as_of):
+    dob = datetime.strptime(str(date_of_birth)[:10], '%Y-%m-%d').date()
+    return as_of.year - dob.year - ((as_of.month, as_of.day) < (dob.month, dob.day))
+
+
+class CohortPlanPipeline:
+    """Streams patients from the records DB and bulk-generates plans with dedup and checkpointing"""
+
+    def __init__(self, planner, source_db, output_db, concurrency=4, max_window=500,
+                 fetch_size=500, as_of=None, profile_defaults=None):
+        self.planner = planner
+        self.source_db = source_db
+        self.output_db = output_db
+        self.concurrency = concurrency
+        self.max_window = max_window
+        self.fetch_size = fetch_size
+        self.as_of = as_of or date.today()
+        self.profile_defaults = profile_defaults or {}
+        missing = [field for field in REQUIRED_PROFILE_DEFAULTS if not self.profile_defaults.get(field)]
+        if missing:
+            # map_frontend_data would silently use 170 cm / 70 kg for every patient
+            raise ValueError(f"patient records have no {' or '.join(missing)}; supply them as profile defaults")
+        self.assumed_measurements = {field: self.profile_defaults[field] for field in REQUIRED_PROFILE_DEFAULTS}
+
+        # All writes happen on the pipeline thread; generation threads only return results
+        self.out = sqlite3.connect(output_db)
+        self.out.executescript('''
+            CREATE TABLE IF NOT EXISTS cohort_plans (
+                cache_key TEXT PRIMARY KEY,
+                result_data TEXT,
+                generated_date TEXT
+            );
+            CREATE TABLE IF NOT EXISTS cohort_patient_plans (
+                patient_id INTEGER PRIMARY KEY,
+                cache_key TEXT,
+                status TEXT,
+                error TEXT,
+                run_id TEXT,
+                updated_date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_cohort_patient_status ON cohort_patient_plans(status);
+            CREATE TABLE IF NOT EXISTS cohort_checkpoints (
+                run_id TEXT PRIMARY KEY,
+                last_patient_id INTEGER,
+                updated_date TEXT
+            );
+        ''')
+        self.out.commit()
+
+    def build_user_data(self, patient_id, date_of_birth, gender, diagnoses, medications):
+        """Assemble the /generate_diet form payload for one patient"""
+        return {
+            **self.profile_defaults,
+            'patient_id': patient_id,
+            'age': str(age_on(date_of_birth, self.as_of)),
+            'gender': GENDER_MAP.get(gender, 'other'),
+            'diagnosis': '; '.join(f"{description} ({code})" for code, description in diagnoses),
+            'medicines': ', '.join(medications),
+        }
+
+    def iter_patient_profiles(self, after_patient_id=0, failed_only=False):
+        """Yield (patient_id, user_data) in patient_id order, holding only one patient's rows at a time"""
+        conn = sqlite3.connect(self.source_db)
+        extra_filter = ''
+        if failed_only:
+            conn.execute("ATTACH DATABASE ? AS out", (self.output_db,))
+            extra_filter = "AND p.patient_id IN (SELECT patient_id FROM out.cohort_patient_plans WHERE status = 'error')"
+
+        cursor = conn.execute(PATIENT_STREAM_QUERY.format(extra_filter=extra_filter), (after_patient_id,))
+        current = None
+        try:
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                for patient_id, dob, gender, icd10, description, medication in rows:
+                    if current is None or current['patient_id'] != patient_id:
+                        if current is not None:
+                            yield current['patient_id'], self._finish(current)
+                        current = {'patient_id': patient_id, 'dob': dob, 'gender': gender,
+                                   'diagnoses': {}, 'medications': {}}
+                    # dicts keep first-seen order and drop repeats across visits
+                    if icd10:
+                        current['diagnoses'].setdefault(icd10, description)
+                    if medication:
+                        current['medications'].setdefault(medication.lower(), medication)
+
+            if current is not None:
+                yield current['patient_id'], self._finish(current)
+        finally:
+            conn.close()
+
+    def _finish(self, patient):
+        return self.build_user_data(
+            patient['patient_id'], patient['dob'], patient['gender'],
+            list(patient['diagnoses'].items()), list(patient['medications'].values())
+        )
+
+    def get_checkpoint(self, run_id):
+        row = self.out.execute(
+            "SELECT last_patient_id FROM cohort_checkpoints WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _plan_exists(self, cache_key):
+        return self.out.execute(
+            "SELECT 1 FROM cohort_plans WHERE cache_key = ?", (cache_key,)
+        ).fetchone() is not None
+
+    def _generate(self, user_data):
+        return self.planner.generate_intelligent_diet_plan(user_data, batch=True)
+
+    def run(self, run_id='default', limit=None, retry_failed=False, dry_run=False):
+        """
+        Process every patient after the run's checkpoint (or only previously failed patients).
+        Returns counters for patients seen, plans generated, deduplicated and failed.
+        """
+        started = time.time()
+        start_after = 0 if retry_failed else self.get_checkpoint(run_id)
+        stats = {'patients': 0, 'generated': 0, 'deduplicated': 0, 'failed': 0, 'resumed_after': start_after}
+
+        window = deque()   # (patient_id, cache_key) in patient order, awaiting their plan
+        in_flight = {}     # cache_key -> future
+        resolved = {}      # cache_key -> (status, error) for keys referenced by the window
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        try:
+            for patient_id, user_data in self.iter_patient_profiles(start_after, failed_only=retry_failed):
+                cache_key = self.planner.get_cache_key(self.planner.map_frontend_data(user_data))
+                window.append((patient_id, cache_key))
+                stats['patients'] += 1
+
+                if cache_key in in_flight or cache_key in resolved:
+                    stats['deduplicated'] += 1
+                elif self._plan_exists(cache_key):
+                    resolved[cache_key] = ('ok', None)
+                    stats['deduplicated'] += 1
+                elif dry_run:
+                    resolved[cache_key] = ('ok', None)
+                    stats['generated'] += 1
+                else:
+                    in_flight[cache_key] = executor.submit(self._generate, user_data)
+                    stats['generated'] += 1
+
+                self._collect(in_flight, resolved, stats, block=False)
+                while len(in_flight) >= self.concurrency * 2 or len(window) >= self.max_window:
+                    self._collect(in_flight, resolved, stats, block=True)
+                    self._flush(window, resolved, run_id, retry_failed, dry_run)
+                self._flush(window, resolved, run_id, retry_failed, dry_run)
+
+                if limit and stats['patients'] >= limit:
+                    break
+
+            while in_flight:
+                self._collect(in_flight, resolved, stats, block=True)
+            self._flush(window, resolved, run_id, retry_failed, dry_run)
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        stats['elapsed_seconds'] = round(time.time() - started, 2)
+        stats['checkpoint'] = self.get_checkpoint(run_id)
+        return stats
+
+    def _collect(self, in_flight, resolved, stats, block):
+        """Store finished generations; with block=True wait for at least one"""
+        if not in_flight:
+            return
+        if block:
+            wait(list(in_flight.values()), return_when=FIRST_COMPLETED)
+
+        for cache_key, future in list(in_flight.items()):
+            if not future.done():
+                continue
+            del in_flight[cache_key]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+
+            if result.get('success'):
+                # BMI and calorie targets came from run-wide measurements, not the patient's own
+                result['assumed_measurements'] = self.assumed_measurements
+                self.out.execute(
+                    "INSERT OR REPLACE INTO cohort_plans VALUES (?, ?, ?)",
+                    (cache_key, json.dumps(result), datetime.now().isoformat())
+                )
+                resolved[cache_key] = ('ok', None)
+            else:
+                resolved[cache_key] = ('error', result.get('error', 'Generation failed'))
+                stats['failed'] += 1
+
+    def _flush(self, window, resolved, run_id, retry_failed, dry_run):
+        """Record patients at the head of the window whose plans are done and advance the checkpoint"""
+        last_patient_id = None
+        rows = []
+        while window and window[0][1] in resolved:
+            patient_id, cache_key = window.popleft()
+            status, error = resolved[cache_key]
+            rows.append((patient_id, cache_key, status, error, run_id, datetime.now().isoformat()))
+            last_patient_id = patient_id
+
+        if not rows:
+            return
+
+        live_keys = {key for _, key in window}
+        for cache_key in [key for key in resolved if key not in live_keys]:
+            del resolved[cache_key]
+
+        if dry_run:
+            return
+
+        self.out.executemany("INSERT OR REPLACE INTO cohort_patient_plans VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if not retry_failed:
+            self.out.execute(
+                "INSERT OR REPLACE INTO cohort_checkpoints VALUES (?, ?, ?)",
+                (run_id, last_patient_id, datetime.now().isoformat())
+            )
+        self.out.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate diet plans for a patient cohort')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = subparsers.add_parser('init', help='create a local SQLite copy of the patient schema')
+    init_parser.add_argument('--db', default='cohort.db')
+    init_parser.add_argument('--no-seed', action='store_true', help='skip the sample records in data_setup.sql')
+    init_parser.add_argument('--synthesize', type=int, default=0, help='add N synthetic patients')
+
+    run_parser = subparsers.add_parser('run', help='generate plans for every patient')
+    run_parser.add_argument('--db', default='cohort.db')
+    run_parser.add_argument('--out', default='cohort_plans.db')
+    run_parser.add_argument('--run-id', default='default')
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--limit', type=int, default=None)
+    run_parser.add_argument('--as-of', default=None, help='date used to compute ages (YYYY-MM-DD)')
+    run_parser.add_argument('--height-cm', default=None,
+                            help='height used for every patient (the records have none)')
+    run_parser.add_argument('--weight-kg', default=None,
+                            help='weight used for every patient (the records have none)')
+    run_parser.add_argument('--defaults', default='{}',
+                            help='JSON form fields applied to every patient, e.g. \'{"diet-type": "vegetarian"}\'')
+    run_parser.add_argument('--retry-failed', action='store_true')
+    run_parser.add_argument('--dry-run', action='store_true', help='assemble and deduplicate without calling the LLM')
+
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        count = init_cohort_db(args.db, seed=not args.no_seed, synthesize=args.synthesize)
+        print(f"✅ {args.db} ready with {count} patients")
+        return
+
+    profile_defaults = json.loads(args.defaults)
+    if args.height_cm:
+        profile_defaults['height'] = args.height_cm
+    if args.weight_kg:
+        profile_defaults['weight'] = args.weight_kg
+    missing = [field for field in REQUIRED_PROFILE_DEFAULTS if not profile_defaults.get(field)]
+    if missing:
+        parser.error(f"the patient records have no {' or '.join(missing)}; pass --height-cm and --weight-kg "
+                     f"(applied to every patient and recorded with each plan)")
+
+    if args.dry_run:
+        os.environ.setdefault('USDA_API_KEY', '')
+    from app import diet_planner
+
+    pipeline = CohortPlanPipeline(
+        diet_planner, args.db, args.out,
+        concurrency=args.concurrency,
+        as_of=datetime.strptime(args.as_of, '%Y-%m-%d').date() if args.as_of else None,
+        profile_defaults=profile_defaults
+    )
+    stats = pipeline.run(args.run_id, limit=args.limit, retry_failed=args.retry_failed, dry_run=args.dry_run)
+    print(f"✅ Cohort run '{args.run_id}' finished: {json.dumps(stats)}")
+
+
+if __name__ == '__main__':
+    main()
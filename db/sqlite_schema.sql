@@ -0,0 +1,102 @@
+-- SQLite port of the patient-records schema in data_setup.sql
+-- (AUTO_INCREMENT -> INTEGER PRIMARY KEY, ENUM -> CHECK, CONCAT -> ||)
+
+-- Create the main patient table
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(50) NOT NULL,
+    last_name VARCHAR(50) NOT NULL,
+    date_of_birth DATE NOT NULL,
+    gender TEXT NOT NULL CHECK (gender IN ('M', 'F', 'Other')),
+    phone VARCHAR(15),
+    email VARCHAR(100),
+    address TEXT,
+    emergency_contact VARCHAR(100),
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create the visits table to track each doctor visit
+CREATE TABLE IF NOT EXISTS visits (
+    visit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INT NOT NULL,
+    visit_date DATE NOT NULL,
+    doctor_name VARCHAR(100) NOT NULL,
+    visit_type VARCHAR(50) DEFAULT 'Regular Checkup',
+    notes TEXT,
+    FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+);
+
+-- Create the diagnoses table with ICD-10 codes
+CREATE TABLE IF NOT EXISTS diagnoses (
+    diagnosis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    visit_id INT NOT NULL,
+    icd10_code VARCHAR(10) NOT NULL,
+    diagnosis_description TEXT NOT NULL,
+    severity TEXT DEFAULT 'Moderate' CHECK (severity IN ('Mild', 'Moderate', 'Severe')),
+    diagnosis_date DATE NOT NULL,
+    FOREIGN KEY (visit_id) REFERENCES visits(visit_id)
+);
+
+-- Create the medications table
+CREATE TABLE IF NOT EXISTS medications (
+    medication_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    diagnosis_id INT NOT NULL,
+    medication_name VARCHAR(100) NOT NULL,
+    dosage VARCHAR(50) NOT NULL,
+    frequency VARCHAR(50) NOT NULL,
+    duration VARCHAR(50) NOT NULL,
+    instructions TEXT,
+    prescribed_date DATE NOT NULL,
+    FOREIGN KEY (diagnosis_id) REFERENCES diagnoses(diagnosis_id)
+);
+
+-- Foreign-key indexes (MySQL creates these implicitly; SQLite does not)
+CREATE INDEX IF NOT EXISTS idx_visits_patient ON visits(patient_id);
+CREATE INDEX IF NOT EXISTS idx_diagnoses_visit ON diagnoses(visit_id);
+CREATE INDEX IF NOT EXISTS idx_medications_diagnosis ON medications(diagnosis_id);
+
+-- Create useful views for reporting
+CREATE VIEW IF NOT EXISTS patient_summary AS
+SELECT
+    p.patient_id,
+    p.first_name || ' ' || p.last_name AS patient_name,
+    p.date_of_birth,
+    p.gender,
+    COUNT(DISTINCT v.visit_id) AS total_visits,
+    COUNT(DISTINCT d.diagnosis_id) AS total_diagnoses,
+    COUNT(DISTINCT m.medication_id) AS total_medications
+FROM patients p
+LEFT JOIN visits v ON p.patient_id = v.patient_id
+LEFT JOIN diagnoses d ON v.visit_id = d.visit_id
+LEFT JOIN medications m ON d.diagnosis_id = m.diagnosis_id
+GROUP BY p.patient_id, p.first_name, p.last_name, p.date_of_birth, p.gender;
+
+CREATE VIEW IF NOT EXISTS diagnosis_medication_view AS
+SELECT
+    p.patient_id,
+    p.first_name || ' ' || p.last_name AS patient_name,
+    v.visit_date,
+    v.doctor_name,
+    d.icd10_code,
+    d.diagnosis_description,
+    d.severity,
+    m.medication_name,
+    m.dosage,
+    m.frequency,
+    m.duration,
+    m.instructions
+FROM patients p
+JOIN visits v ON p.patient_id = v.patient_id
+JOIN diagnoses d ON v.visit_id = d.visit_id
+JOIN medications m ON d.diagnosis_id = m.diagnosis_id
+ORDER BY p.patient_id, v.visit_date;
+
+CREATE VIEW IF NOT EXISTS common_diagnoses AS
+SELECT
+    d.icd10_code,
+    d.diagnosis_description,
+    COUNT(*) as frequency,
+    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM diagnoses), 2) as percentage
+FROM diagnoses d
+GROUP BY d.icd10_code, d.diagnosis_description
+ORDER BY frequency DESC;
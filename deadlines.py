@@ -0,0 +1,65 @@
+"""
+Per-request latency budgets.
+
+A request's deadline is fixed when it arrives (a time.monotonic() value) and
+passed down through every stage: prompt enrichment, the RxNorm/USDA calls, the
+LLM queue and the Groq call. Each stage uses only what is left; optional work
+is skipped when too little remains. When the LLM call cannot finish in time,
+only a profile that passes the local planner's medical checks (no diagnosis,
+conditions, medications or fasting; normal or overweight BMI) and whose
+targets the catalog can meet gets a degraded local plan - and with the local
+planner enabled such profiles are planned locally without reaching the LLM.
+Every other profile gets a deadline_exceeded error rather than a plan that
+ignores its medical details.
+"""
+import os
+import time
+
+
+# Header a caller can send to ask for a different budget (milliseconds), capped at REQUEST_BUDGET_MAX_SECONDS
+DEADLINE_HEADER = 'X-Request-Budget-Ms'
+REQUEST_BUDGET_MAX_SECONDS = float(os.environ.get('REQUEST_BUDGET_MAX_SECONDS', 300))
+
+# Default budget per endpoint; 0 disables the deadline for that endpoint
+REQUEST_BUDGETS = {
+    'generate_diet': float(os.environ.get('REQUEST_BUDGET_GENERATE_DIET_SECONDS', 30)),
+    'generate_weekly_plan': float(os.environ.get('REQUEST_BUDGET_GENERATE_WEEKLY_PLAN_SECONDS', 90)),
+}
+
+# Time kept back for the LLM call; enrichment only runs if it can finish before that
+DEADLINE_LLM_RESERVE = float(os.environ.get('DEADLINE_LLM_RESERVE_SECONDS', 10))
+# Below this the LLM call is not attempted (degraded plan or deadline_exceeded, see above)
+DEADLINE_MIN_LLM = float(os.environ.get('DEADLINE_MIN_LLM_SECONDS', 2))
+# Shortest timeout handed to an HTTP call; anything less is not worth the round trip
+DEADLINE_MIN_HTTP = float(os.environ.get('DEADLINE_MIN_HTTP_SECONDS', 0.2))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the request's remaining budget"""
+
+
+def request_deadline(endpoint, header_value=None):
+    """Deadline for a request to `endpoint`, from the caller's header if valid, else the endpoint default"""
+    budget = REQUEST_BUDGETS.get(endpoint, 0)
+    if header_value:
+        try:
+            budget = min(float(header_value) / 1000, REQUEST_BUDGET_MAX_SECONDS)
+        except (TypeError, ValueError):
+            pass
+    return time.monotonic() + budget if budget > 0 else None
+
+
+def remaining(deadline):
+    """Seconds left before deadline (None when there is no deadline)"""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def stage_timeout(default, deadline, minimum=None):
+    """A stage's usual timeout cut down to the remaining budget; raises if not even `minimum` is left"""
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    minimum = DEADLINE_MIN_HTTP if minimum is None else minimum
+    if left < minimum:
+        raise DeadlineExceeded(f'{max(left, 0):.2f}s left, stage needs {minimum:g}s')
+    return min(default, left)
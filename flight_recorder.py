@@ -0,0 +1,370 @@
+"""
+Per-request flight recorder and sampling profiler.
+
+Every request carries a timeline of stages (cache tiers hit, upstream calls
+with their timings, LLM tokens, PDF rendering, ...). Requests slower than
+FLIGHT_RECORDER_SLOW_MS are appended to a size-rotated JSONL log and kept in
+memory for /admin/flight_recorder.
+
+The profiler is off by default. Switched on at runtime (POST /admin/profiler)
+it samples the stack of a percentage of requests every few milliseconds with
+sys._current_frames(), and aggregates the samples into collapsed stacks
+(flamegraph.pl input) served by GET /admin/profiler.
+
+Patient-supplied names (medications, foods) go on timelines only as keyed
+hashes (fingerprint()), and query strings are cut from recorded errors, so
+neither the admin endpoint nor the log holds them in clear.
+
+Stages are recorded through module-level helpers that do nothing outside a
+request, so library code can call them unconditionally. The timeline lives in
+a contextvar; work handed to thread pools keeps it when submitted with
+run_in_context().
+"""
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+
+FLIGHT_RECORDER_ENABLED = os.environ.get('FLIGHT_RECORDER_ENABLED', 'true').lower() == 'true'
+FLIGHT_RECORDER_SLOW_MS = float(os.environ.get('FLIGHT_RECORDER_SLOW_MS', 10000))
+FLIGHT_RECORDER_LOG = os.environ.get('FLIGHT_RECORDER_LOG', 'flight_recorder.jsonl')
+FLIGHT_RECORDER_MAX_BYTES = int(os.environ.get('FLIGHT_RECORDER_MAX_BYTES', 10 * 1024 * 1024))
+FLIGHT_RECORDER_BACKUPS = int(os.environ.get('FLIGHT_RECORDER_BACKUPS', 3))
+# Slow requests kept in memory for the admin endpoint
+FLIGHT_RECORDER_RECENT = int(os.environ.get('FLIGHT_RECORDER_RECENT', 50))
+# A timeline stops growing past this many stages (e.g. a long batch)
+FLIGHT_RECORDER_MAX_STAGES = int(os.environ.get('FLIGHT_RECORDER_MAX_STAGES', 500))
+
+# Key for fingerprint(); random per process unless set, so set it to compare fingerprints across workers/restarts
+FLIGHT_RECORDER_HASH_KEY = os.environ.get('FLIGHT_RECORDER_HASH_KEY', '').encode() or os.urandom(16)
+QUERY_STRING = re.compile(r'\?[^\s\'"]*')
+
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+PROFILER_MAX_DEPTH = int(os.environ.get('PROFILER_MAX_DEPTH', 64))
+PROFILER_RECENT = int(os.environ.get('PROFILER_RECENT', 20))
+
+_current = contextvars.ContextVar('flight_recorder_timeline', default=None)
+
+
+class RequestTimeline:
+    """Stages and attributes of one request"""
+
+    def __init__(self, endpoint, method=None, path=None):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now().isoformat()
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = []
+        self.dropped_stages = 0
+        self.attributes = {}
+        self.profile = None
+        self.profiler = None
+        self.samples = None
+        self.duration_ms = None
+        self.token = None
+
+    def offset_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def add(self, name, start_ms, duration_ms=None, attributes=None):
+        entry = {'name': name, 'start_ms': start_ms}
+        if duration_ms is not None:
+            entry['duration_ms'] = round(duration_ms, 2)
+        if threading.current_thread() is not threading.main_thread():
+            entry['thread'] = threading.current_thread().name
+        entry.update(attributes or {})
+        with self.lock:
+            if len(self.stages) >= FLIGHT_RECORDER_MAX_STAGES:
+                self.dropped_stages += 1
+            else:
+                self.stages.append(entry)
+
+    def to_dict(self):
+        with self.lock:
+            stages = list(self.stages)
+        record = {
+            'request_id': self.request_id,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'attributes': dict(self.attributes),
+            'stages': stages
+        }
+        if self.dropped_stages:
+            record['dropped_stages'] = self.dropped_stages
+        if self.profile is not None:
+            record['profile'] = self.profile
+        return record
+
+
+def current():
+    """The running request's timeline, or None"""
+    return _current.get()
+
+
+def fingerprint(value):
+    """Stand-in for a patient-supplied name on a timeline: equal names give equal fingerprints"""
+    return hmac.new(FLIGHT_RECORDER_HASH_KEY, str(value).strip().lower().encode(), hashlib.sha256).hexdigest()[:12]
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Time a block as a stage of the current request; yields a dict for attributes known only at the end"""
+    timeline = _current.get()
+    extra = {}
+    if timeline is None:
+        yield extra
+        return
+    start_ms = timeline.offset_ms()
+    started = time.perf_counter()
+    try:
+        yield extra
+    except BaseException as e:
+        # requests errors quote the full URL, whose query holds food names and the USDA key
+        extra['error'] = QUERY_STRING.sub('?...', f'{type(e).__name__}: {e}')[:300]
+        raise
+    finally:
+        timeline.add(name, start_ms, (time.perf_counter() - started) * 1000, {**attributes, **extra})
+
+
+def record(name, duration_ms=None, **attributes):
+    """Record a stage (or, without duration_ms, a point event) on the current request"""
+    timeline = _current.get()
+    if timeline is None:
+        return
+    start_ms = timeline.offset_ms() - (duration_ms or 0)
+    timeline.add(name, round(max(start_ms, 0), 2), duration_ms, attributes)
+
+
+def annotate(**attributes):
+    """Set request-level attributes (status, cache outcome, ...)"""
+    timeline = _current.get()
+    if timeline is not None:
+        timeline.attributes.update(attributes)
+
+
+def run_in_context(executor, fn, *args, **kwargs):
+    """executor.submit(fn, ...) keeping the caller's timeline (and profiling, if sampled) in the worker thread"""
+    timeline = _current.get()
+    context = contextvars.copy_context()
+    if timeline is None or timeline.profiler is None:
+        return executor.submit(context.run, fn, *args, **kwargs)
+    return executor.submit(context.run, timeline.profiler.sampled, timeline, fn, *args, **kwargs)
+
+
+class SamplingProfiler:
+    """Samples the stacks of profiled requests' threads (request thread and pool workers) on one background thread"""
+
+    def __init__(self, interval_ms=None):
+        self.interval = (interval_ms or PROFILER_INTERVAL_MS) / 1000
+        self.sample_percent = 0.0
+        self.lock = threading.Lock()
+        self.active = {}  # thread id -> Counter of collapsed stacks of the request it is working for
+        self.stacks = Counter()
+        self.recent = deque(maxlen=PROFILER_RECENT)
+        self.samples = 0
+        self.profiled_requests = 0
+        self.thread = None
+
+    def configure(self, sample_percent=None, interval_ms=None, reset=False):
+        with self.lock:
+            if sample_percent is not None:
+                self.sample_percent = max(0.0, min(100.0, float(sample_percent)))
+            if interval_ms is not None:
+                self.interval = max(1.0, float(interval_ms)) / 1000
+            if reset:
+                self.stacks.clear()
+                self.recent.clear()
+                self.samples = 0
+                self.profiled_requests = 0
+            if self.sample_percent > 0 and self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self.thread.start()
+
+    def should_sample(self):
+        return self.sample_percent > 0 and random.random() * 100 < self.sample_percent
+
+    def begin(self, timeline):
+        timeline.profiler = self
+        timeline.samples = Counter()
+        with self.lock:
+            self.active[threading.get_ident()] = timeline.samples
+
+    def sampled(self, timeline, fn, *args, **kwargs):
+        """Run fn on this pool thread with its samples counted towards timeline's request"""
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.active[thread_id] = timeline.samples
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                if self.active.get(thread_id) is timeline.samples:
+                    del self.active[thread_id]
+
+    def end(self, timeline):
+        """Stop sampling the request thread; returns the request's profile summary"""
+        with self.lock:
+            counts = timeline.samples
+            if counts is None:
+                return None
+            self.active.pop(threading.get_ident(), None)
+            counts = Counter(counts)
+            self.stacks.update(counts)
+            self.profiled_requests += 1
+            summary = {
+                'samples': sum(counts.values()),
+                'interval_ms': round(self.interval * 1000, 2),
+                'top_stacks': [{'stack': stack, 'samples': n} for stack, n in counts.most_common(10)]
+            }
+            self.recent.append({
+                'request_id': timeline.request_id,
+                'endpoint': timeline.endpoint,
+                'duration_ms': timeline.duration_ms,
+                **summary
+            })
+        return summary
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, counts in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == own:
+                        continue
+                    counts[_collapse(frame)] += 1
+                    self.samples += 1
+
+    def get_stats(self, top=30):
+        with self.lock:
+            return {
+                'enabled': self.sample_percent > 0,
+                'sample_percent': self.sample_percent,
+                'interval_ms': round(self.interval * 1000, 2),
+                'profiled_requests': self.profiled_requests,
+                'samples': self.samples,
+                'top_stacks': [{'stack': stack, 'samples': n} for stack, n in self.stacks.most_common(top)],
+                'recent': list(self.recent)
+            }
+
+    def collapsed(self):
+        """All aggregated samples as 'frame;frame;frame count' lines (flamegraph.pl input)"""
+        with self.lock:
+            return '\n'.join(f'{stack} {n}' for stack, n in self.stacks.most_common())
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < PROFILER_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class FlightRecorder:
+    """Starts and finishes request timelines; writes slow ones to the rotating JSONL log"""
+
+    def __init__(self, log_path=None, slow_ms=None, enabled=None):
+        self.enabled = FLIGHT_RECORDER_ENABLED if enabled is None else enabled
+        self.log_path = log_path or FLIGHT_RECORDER_LOG
+        self.slow_ms = FLIGHT_RECORDER_SLOW_MS if slow_ms is None else slow_ms
+        self.profiler = SamplingProfiler()
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=FLIGHT_RECORDER_RECENT)
+        self.stats = {'requests': 0, 'slow': 0, 'written': 0, 'write_errors': 0}
+
+    def start(self, endpoint, method=None, path=None):
+        """Begin a request's timeline and make it current; pass it to finish() at the end of the request"""
+        if not self.enabled:
+            return None
+        timeline = RequestTimeline(endpoint, method, path)
+        if self.profiler.should_sample():
+            self.profiler.begin(timeline)
+        timeline.token = _current.set(timeline)
+        return timeline
+
+    def finish(self, timeline):
+        """Close the timeline; slow requests are kept in memory and appended to the log"""
+        if timeline is None:
+            return None
+        try:
+            _current.reset(timeline.token)
+        except ValueError:
+            # Finished from a different context than it started in
+            _current.set(None)
+        timeline.duration_ms = timeline.offset_ms()
+        if timeline.profiler is not None:
+            timeline.profile = self.profiler.end(timeline)
+
+        slow = timeline.duration_ms >= self.slow_ms
+        with self.lock:
+            self.stats['requests'] += 1
+            if slow:
+                self.stats['slow'] += 1
+        if slow:
+            entry = timeline.to_dict()
+            with self.lock:
+                self.recent.append(entry)
+            self._write(entry)
+        return timeline
+
+    def _write(self, entry):
+        line = json.dumps(entry, default=str) + '\n'
+        try:
+            with self.lock:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) + len(line) > FLIGHT_RECORDER_MAX_BYTES:
+                    self._rotate()
+                with open(self.log_path, 'a') as f:
+                    f.write(line)
+                self.stats['written'] += 1
+        except OSError as e:
+            with self.lock:
+                self.stats['write_errors'] += 1
+            print(f"⚠️ Flight recorder could not write {self.log_path}: {e}")
+
+    def _rotate(self):
+        """flight_recorder.jsonl -> .1 -> .2 ...; the oldest backup is dropped (caller holds the lock)"""
+        for index in range(FLIGHT_RECORDER_BACKUPS - 1, 0, -1):
+            source = f'{self.log_path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.log_path}.{index + 1}')
+        if FLIGHT_RECORDER_BACKUPS > 0:
+            os.replace(self.log_path, f'{self.log_path}.1')
+        else:
+            os.remove(self.log_path)
+
+    def get_stats(self, limit=None):
+        with self.lock:
+            recent = list(self.recent)
+            stats = dict(self.stats)
+        if limit is not None:
+            recent = recent[-limit:]
+        return {
+            **stats,
+            'enabled': self.enabled,
+            'slow_threshold_ms': self.slow_ms,
+            'log_path': self.log_path,
+            'recent_slow': list(reversed(recent))
+        }
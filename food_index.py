@@ -0,0 +1,98 @@
+"""
+In-memory trigram index over cached food names.
+
+Lets "rice, brown", "Brown Rice" and "brwn rice" resolve to the same cached
+USDA entry instead of each costing a network round trip.
+"""
+import os
+import re
+import threading
+
+
+FUZZY_MATCH_THRESHOLD = float(os.environ.get('FUZZY_MATCH_THRESHOLD', 0.6))
+
+
+def normalize_food_name(name):
+    """Lowercase, punctuation-free and token-sorted so word order doesn't matter"""
+    tokens = re.sub(r'[^a-z0-9 ]+', ' ', str(name).lower()).split()
+    return ' '.join(sorted(tokens))
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodNameIndex:
+    """Trigram postings over canonical cached names; lookups return the most similar name above the threshold"""
+
+    def __init__(self, threshold=None):
+        self.threshold = FUZZY_MATCH_THRESHOLD if threshold is None else threshold
+        self.lock = threading.Lock()
+        self.names = {}       # canonical name -> (normalized form, trigram set)
+        self.normalized = {}  # normalized form -> canonical name
+        self.postings = {}    # trigram -> set of canonical names
+
+    def add(self, name):
+        normalized = normalize_food_name(name)
+        if not normalized:
+            return
+        grams = trigrams(normalized)
+        with self.lock:
+            if name in self.names:
+                return
+            self.names[name] = (normalized, grams)
+            self.normalized.setdefault(normalized, name)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(name)
+
+    def remove(self, name):
+        with self.lock:
+            entry = self.names.pop(name, None)
+            if entry is None:
+                return
+            normalized, grams = entry
+            if self.normalized.get(normalized) == name:
+                del self.normalized[normalized]
+            for gram in grams:
+                names = self.postings.get(gram)
+                if names:
+                    names.discard(name)
+                    if not names:
+                        del self.postings[gram]
+
+    def lookup(self, name):
+        """(canonical_name, similarity) of the closest indexed name, or (None, best_similarity)"""
+        normalized = normalize_food_name(name)
+        if not normalized:
+            return None, 0.0
+        query_grams = trigrams(normalized)
+        token_count = len(normalized.split())
+
+        with self.lock:
+            exact = self.normalized.get(normalized)
+            if exact is not None:
+                return exact, 1.0
+
+            shared = {}
+            for gram in query_grams:
+                for candidate in self.postings.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+
+            best_name, best_score = None, 0.0
+            for candidate, count in shared.items():
+                candidate_normalized, candidate_grams = self.names[candidate]
+                # "rice" must not resolve to "rice noodles": the word count has to agree
+                if len(candidate_normalized.split()) != token_count:
+                    continue
+                score = count / (len(query_grams) + len(candidate_grams) - count)
+                if score > best_score or (score == best_score and best_name is not None and candidate < best_name):
+                    best_name, best_score = candidate, score
+
+        if best_score >= self.threshold:
+            return best_name, best_score
+        return None, best_score
+
+    def __len__(self):
+        with self.lock:
+            return len(self.names)
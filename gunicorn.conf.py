@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the diet planner.
+
+The app is preloaded in the master so the read-only parts (Flask app, drug
+knowledge base, vocabularies, compiled patterns, PDF styles, food catalog) are
+built once and shared copy-on-write. Anything that must not cross fork() - the
+Groq client, SQLite connections, the cache sweeper and thread pools - is
+created in each worker after fork, via app.init_worker() in post_worker_init.
+
+Requests spend most of their time waiting on Groq, USDA and RxNorm, so gthread
+workers are the default; perf/results/loadtest_history.jsonl holds the sync /
+gthread comparison (python -m perf.loadtest --config gunicorn.conf.py). gevent
+is supported but unmeasured: it needs the gevent package, which is not in
+requirements.txt.
+Every setting can be overridden with the environment variables below.
+"""
+import multiprocessing
+import os
+
+# Tells app.py not to initialize on import; post_worker_init does it in each worker instead
+os.environ['DEFER_WORKER_INIT'] = 'true'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+preload_app = True
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2)))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# gevent only: concurrent connections per worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+# Full plan generation can take most of a minute when Groq is slow
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so the in-memory caches cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def post_worker_init(worker):
+    """Per-worker resources: Groq client, SQLite connections, background threads.
+    Runs after fork and after the worker class's own setup (gevent's monkey-patching), before serving."""
+    # GROQ_RPM/GROQ_TPM are account-wide; each worker's scheduler admits its share (cfg.workers includes --workers)
+    os.environ['GROQ_WORKER_COUNT'] = str(worker.cfg.workers)
+    import app
+    app.init_worker()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class L1Cache:
+    """
+    Bounded in-process cache of decoded objects in front of the SQLite cache.
+    Reads are a single dict lookup and take no lock; writes and evictions are serialized.
+    Each entry expires at the same epoch second as the L2 row it was read from.
+    Values are shared between callers and must be treated as read-only.
+    Hits are also recorded per L2 row so the sweeper can evict least-recently-used rows.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = {}     # key -> (value, expires_at, source_key)
+        self.aliases = {}     # source_key -> keys holding a copy of that row (alias lookups)
+        self.accessed = {}    # source_key -> epoch second of the last read, drained by drain_accessed()
+        self.write_lock = threading.Lock()
+        # Approximate counters: incremented without a lock on the read path
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        now = time.time()
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            self.accessed[entry[2]] = int(now)
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, expires_at, source_key=None):
+        """Cache value until expires_at; source_key names the L2 row when key is an alias of it"""
+        source_key = source_key or key
+        with self.write_lock:
+            if key not in self.entries:
+                # Dict order is insertion order, so this evicts the oldest entries first
+                while len(self.entries) >= self.max_entries:
+                    self._drop(next(iter(self.entries)))
+            self.entries[key] = (value, expires_at, source_key)
+            if source_key != key:
+                self.aliases.setdefault(source_key, set()).add(key)
+        self.accessed[source_key] = int(time.time())
+
+    def touch(self, source_key):
+        """Record a read of an L2 row that was served without going through L1"""
+        self.accessed[source_key] = int(time.time())
+
+    def drain_accessed(self):
+        """{source_key: last_accessed} recorded since the previous drain"""
+        with self.write_lock:
+            accessed, self.accessed = self.accessed, {}
+        return accessed
+
+    def alias(self, key, source_key):
+        """Serve key from source_key's entry until that row expires or is invalidated"""
+        entry = self.entries.get(source_key)
+        if entry is not None:
+            self.set(key, entry[0], entry[1], source_key=source_key)
+
+    def invalidate(self, source_key):
+        """Drop an L2 row's entry and every alias entry copied from it"""
+        with self.write_lock:
+            self._drop(source_key)
+            for key in self.aliases.pop(source_key, ()):
+                self._drop(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry[2] != key:
+            keys = self.aliases.get(entry[2])
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.aliases[entry[2]]
+
+    def clear(self):
+        with self.write_lock:
+            self.entries.clear()
+            self.aliases.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
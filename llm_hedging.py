@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from deadlines import DeadlineExceeded
+import flight_recorder
+
+
+DEFAULT_MODELS = "llama3-70b-8192,llama3-8b-8192"
+
+# 'fallback': hedge to the next model in the chain, 'same': hedge to the primary model, 'off': never hedge
+HEDGE_MODE = os.environ.get('HEDGE_MODE', 'fallback')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 95))
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', 4.0))
+HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', 10.0))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+
+
+def configured_models():
+    """Model fallback chain from GROQ_MODELS (comma-separated, primary first)"""
+    models = [m.strip() for m in os.environ.get('GROQ_MODELS', DEFAULT_MODELS).split(',') if m.strip()]
+    return models or [m.strip() for m in DEFAULT_MODELS.split(',')]
+
+
+class LatencyTracker:
+    """Sliding window of recent completion latencies per model"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self.lock:
+            self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model, pct):
+        with self.lock:
+            values = sorted(self.samples.get(model, ()))
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values))) - 1))
+        return values[index]
+
+    def count(self, model):
+        with self.lock:
+            return len(self.samples.get(model, ()))
+
+    def summary(self):
+        with self.lock:
+            models = list(self.samples)
+        return {
+            model: {
+                'samples': self.count(model),
+                'p50_seconds': round(self.percentile(model, 50) or 0, 3),
+                'p95_seconds': round(self.percentile(model, 95) or 0, 3)
+            }
+            for model in models
+        }
+
+
+class HedgedCompletion:
+    """
+    Runs a chat completion against a model chain with hedging.
+    If the primary call is still running after its p95-derived threshold, a second request is
+    fired (to the fallback model or the same one) and whichever succeeds first is used.
+    If a call fails, the next model in the chain is tried.
+    """
+
+    def __init__(self, scheduler, models=None, hedge_mode=None, latency=None):
+        self.scheduler = scheduler
+        self.models = models or configured_models()
+        self.hedge_mode = hedge_mode or HEDGE_MODE
+        self.latency = latency or LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=int(os.environ.get('HEDGE_POOL_SIZE', 32)))
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'fallbacks': 0, 'deadline_exceeded': 0,
+                      'served_by': {}}
+
+    def hedge_delay(self, model):
+        """Seconds to wait on a model before hedging: its recent p95, floored at HEDGE_MIN_DELAY"""
+        if self.latency.count(model) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.latency.percentile(model, HEDGE_PERCENTILE))
+
+    def _hedge_model(self, models, primary):
+        if self.hedge_mode == 'same':
+            return primary
+        if self.hedge_mode == 'fallback':
+            return models[1] if len(models) > 1 else primary
+        return None
+
+    def _call(self, model, priority, cancel_event, deadline, kwargs):
+        started = time.perf_counter()
+        response = self.scheduler.create(priority=priority, cancel_event=cancel_event, deadline=deadline,
+                                         model=model, **kwargs)
+        # Losers that complete still count: the latency window has to reflect every completion
+        self.latency.record(model, time.perf_counter() - started)
+        return response
+
+    def create(self, priority, models=None, deadline=None, **kwargs):
+        """
+        Returns (response, info) where info records the serving model and whether hedging/fallback happened.
+        `models` overrides the configured chain for this call. Raises DeadlineExceeded if no model
+        answers before `deadline` (a time.monotonic() value).
+        """
+        chain = list(models or self.models)
+        primary = chain[0]
+        cancel_event = threading.Event()
+        pending = {}
+        untried = list(chain)
+        errors = []
+        hedge_checked = False
+        hedged = False
+
+        def launch(model, role):
+            if model in untried:
+                untried.remove(model)
+            future = flight_recorder.run_in_context(self.executor, self._call, model, priority, cancel_event,
+                                                    deadline, kwargs)
+            pending[future] = (model, role)
+
+        with self.lock:
+            self.stats['requests'] += 1
+
+        launch(primary, 'primary')
+        try:
+            while pending:
+                timeout = None
+                if not hedge_checked and self.hedge_mode != 'off':
+                    timeout = self.hedge_delay(primary)
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        raise self._deadline_exceeded(errors)
+                    timeout = left if timeout is None else min(timeout, left)
+
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done and deadline is not None and time.monotonic() >= deadline:
+                    continue
+                if not done:
+                    # Primary is slow; hedge only when the queue is empty, otherwise hedges just add load
+                    hedge_checked = True
+                    hedge_model = self._hedge_model(chain, primary)
+                    if hedge_model and self.scheduler.get_stats()['waiting'] == 0:
+                        hedged = True
+                        launch(hedge_model, 'hedge')
+                        with self.lock:
+                            self.stats['hedged'] += 1
+                    continue
+
+                for future in done:
+                    model, role = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        errors.append(f"{model}: {e}")
+                        continue
+
+                    with self.lock:
+                        self.stats['served_by'][model] = self.stats['served_by'].get(model, 0) + 1
+                        if role == 'hedge':
+                            self.stats['hedge_wins'] += 1
+                        if role == 'fallback':
+                            self.stats['fallbacks'] += 1
+
+                    return response, {
+                        'model': model,
+                        'role': role,
+                        'hedged': hedged,
+                        'errors': errors
+                    }
+
+                # Everything launched so far failed: move down the chain
+                if not pending and untried and (deadline is None or time.monotonic() < deadline):
+                    launch(untried[0], 'fallback')
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise self._deadline_exceeded(errors)
+            raise RuntimeError('All models failed: ' + '; '.join(errors))
+        finally:
+            # Withdraw the loser if it is still queued; an in-flight HTTP call is left to finish and discarded
+            cancel_event.set()
+            self.scheduler.wake()
+            for future in pending:
+                future.cancel()
+
+    def _deadline_exceeded(self, errors):
+        with self.lock:
+            self.stats['deadline_exceeded'] += 1
+        return DeadlineExceeded('No model answered before the request deadline' +
+                                (': ' + '; '.join(errors) if errors else ''))
+
+    def get_stats(self):
+        with self.lock:
+            stats = {**self.stats, 'served_by': dict(self.stats['served_by'])}
+        stats['models'] = self.models
+        stats['hedge_mode'] = self.hedge_mode
+        stats['latency'] = self.latency.summary()
+        return stats
@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from groq import RateLimitError, InternalServerError, APIConnectionError
+
+from deadlines import DeadlineExceeded
+import flight_recorder
+
+
+# Lower value = served first
+PRIORITY_HIGH_RISK = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BATCH_HIGH_RISK = 2
+PRIORITY_BATCH = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_HIGH_RISK: 'high_risk',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BATCH_HIGH_RISK: 'batch_high_risk',
+    PRIORITY_BATCH: 'batch'
+}
+
+# Rough chars-per-token ratio used to estimate prompt size before the call
+CHARS_PER_TOKEN = 4
+
+
+def priority_for(is_high_risk, batch=False):
+    """Queue priority for a request: interactive before batch, high-risk first within each"""
+    if batch:
+        return PRIORITY_BATCH_HIGH_RISK if is_high_risk else PRIORITY_BATCH
+    return PRIORITY_HIGH_RISK if is_high_risk else PRIORITY_INTERACTIVE
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a request waited longer than allowed for rate-limit capacity"""
+
+
+class LLMRequestCancelled(Exception):
+    """Raised when a queued request is cancelled before it was dispatched"""
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe on its own (LLMScheduler holds its lock)"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Return over-estimated tokens (positive) or charge for under-estimated ones (negative)"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMScheduler:
+    """
+    Admission control in front of client.chat.completions.create.
+    Requests wait in a priority queue until the requests-per-minute and tokens-per-minute
+    buckets have room, so bursts queue at the provider ceiling instead of turning into 429s.
+    429/5xx responses pause dispatch (honoring Retry-After) and the request is retried.
+    GROQ_RPM/GROQ_TPM are the account's limits; every process has its own scheduler, so each admits
+    1/GROQ_WORKER_COUNT of them (gunicorn.conf.py sets that to the worker count). A 429 pauses only the
+    worker that received it.
+    """
+
+    def __init__(self, client, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None,
+                 max_retries=None, max_queue_wait=None):
+        self.client = client
+        # Read when the worker initializes, after gunicorn.conf.py has set it
+        self.worker_count = max(1, int(os.environ.get('GROQ_WORKER_COUNT', 1)))
+        self.request_bucket = TokenBucket(requests_per_minute or
+                                          int(os.environ.get('GROQ_RPM', 30)) / self.worker_count)
+        self.token_bucket = TokenBucket(tokens_per_minute or
+                                        int(os.environ.get('GROQ_TPM', 60000)) / self.worker_count)
+        self.max_concurrency = max_concurrency or int(os.environ.get('GROQ_MAX_CONCURRENCY', 8))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('GROQ_MAX_RETRIES', 4))
+        self.max_queue_wait = max_queue_wait or float(os.environ.get('GROQ_MAX_QUEUE_WAIT', 120))
+        self.base_backoff = 1.0
+        self.max_backoff = 30.0
+
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {
+            'completed': 0,
+            'failed': 0,
+            'rate_limited': 0,
+            'retries': 0,
+            'queue_timeouts': 0,
+            'deadline_exceeded': 0,
+            'tokens_used': 0,
+            'submitted_by_priority': {name: 0 for name in PRIORITY_NAMES.values()}
+        }
+
+    def estimate_tokens(self, messages, max_tokens):
+        prompt_chars = sum(len(m.get('content') or '') for m in messages)
+        return prompt_chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+    def create(self, priority=PRIORITY_INTERACTIVE, cancel_event=None, deadline=None, **kwargs):
+        """
+        Drop-in for client.chat.completions.create that waits for capacity by priority.
+        Setting cancel_event (then calling wake()) withdraws the request while it is still queued.
+        With a deadline (time.monotonic() value) queueing, the HTTP call and retries all stop there
+        and DeadlineExceeded is raised.
+        """
+        estimate = self.estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+        entry = [priority, next(self.sequence)]
+        attempt = 0
+        with self.condition:
+            self.stats['submitted_by_priority'][PRIORITY_NAMES.get(priority, str(priority))] += 1
+
+        while True:
+            with flight_recorder.stage('llm_queue', model=kwargs.get('model'), attempt=attempt,
+                                       priority=PRIORITY_NAMES.get(priority, str(priority))):
+                self._acquire(entry, estimate, cancel_event, deadline)
+            call_kwargs = kwargs
+            if deadline is not None:
+                call_kwargs = {**kwargs, 'timeout': max(0.0, deadline - time.monotonic())}
+            try:
+                with flight_recorder.stage('llm_call', model=kwargs.get('model'), attempt=attempt,
+                                           url=str(getattr(self.client, 'base_url', ''))) as call:
+                    response = self.client.chat.completions.create(**call_kwargs)
+                    usage = getattr(response, 'usage', None)
+                    call['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+                    call['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+            except (RateLimitError, InternalServerError, APIConnectionError) as e:
+                self._release(estimate)
+                attempt += 1
+                if attempt > self.max_retries:
+                    with self.condition:
+                        self.stats['failed'] += 1
+                    raise
+                if deadline is not None and time.monotonic() >= deadline:
+                    # Includes the SDK's own timeout firing at the deadline; no time left to retry
+                    self._deadline_exceeded()
+                    raise DeadlineExceeded(f'LLM call did not finish before the deadline: {e}') from e
+                self._back_off(e, attempt, deadline)
+                continue
+            except Exception:
+                self._release(estimate)
+                with self.condition:
+                    self.stats['failed'] += 1
+                raise
+
+            self._release(estimate, actual_tokens=getattr(usage, 'total_tokens', None), succeeded=True)
+            return response
+
+    def _acquire(self, entry, estimate, cancel_event=None, deadline=None):
+        """Block until this entry is at the head of the queue and both buckets have room"""
+        give_up_at = time.monotonic() + self.max_queue_wait
+        with self.condition:
+            heapq.heappush(self.queue, entry)
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise LLMRequestCancelled('Request cancelled while queued')
+                    now = time.monotonic()
+                    at_head = self.queue[0] is entry and self.in_flight < self.max_concurrency
+                    if at_head:
+                        wait = max(
+                            self.paused_until - now,
+                            self.request_bucket.wait_time(1, now),
+                            self.token_bucket.wait_time(estimate, now)
+                        )
+                        if wait <= 0:
+                            heapq.heappop(self.queue)
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(estimate)
+                            self.in_flight += 1
+                            # The next entry may now be able to go
+                            self.condition.notify_all()
+                            return
+                    else:
+                        wait = 1.0
+
+                    if now + wait > give_up_at:
+                        self.stats['queue_timeouts'] += 1
+                        raise LLMQueueTimeout(f'LLM capacity not available within {self.max_queue_wait:.0f}s')
+                    if deadline is not None:
+                        # At the head the wait is known; further back, keep waiting until the deadline itself
+                        if now >= deadline or (at_head and now + wait > deadline):
+                            self.stats['deadline_exceeded'] += 1
+                            raise DeadlineExceeded('LLM capacity not available before the request deadline')
+                        wait = min(wait, deadline - now)
+                    self.condition.wait(timeout=wait)
+            except BaseException:
+                if entry in self.queue:
+                    self.queue.remove(entry)
+                    heapq.heapify(self.queue)
+                    self.condition.notify_all()
+                raise
+
+    def _release(self, estimate, actual_tokens=None, succeeded=False):
+        with self.condition:
+            self.in_flight -= 1
+            if succeeded:
+                self.stats['completed'] += 1
+            if actual_tokens is not None:
+                self.token_bucket.adjust(estimate - actual_tokens)
+                self.stats['tokens_used'] += actual_tokens
+            self.condition.notify_all()
+
+    def _deadline_exceeded(self):
+        with self.condition:
+            self.stats['failed'] += 1
+            self.stats['deadline_exceeded'] += 1
+
+    def _back_off(self, error, attempt, deadline=None):
+        """Pause all dispatch for Retry-After (or exponential backoff with jitter)"""
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                retry_after = None
+
+        delay = retry_after if retry_after is not None else min(
+            self.max_backoff, self.base_backoff * (2 ** (attempt - 1))
+        )
+        delay += random.uniform(0, delay * 0.1)
+
+        with self.condition:
+            if isinstance(error, RateLimitError):
+                self.stats['rate_limited'] += 1
+                # The provider is saturated: nobody should dispatch until it recovers
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.stats['retries'] += 1
+
+        if not isinstance(error, RateLimitError):
+            # Past the deadline the next _acquire raises, so there is no point sleeping beyond it
+            time.sleep(delay if deadline is None else max(0.0, min(delay, deadline - time.monotonic())))
+
+    def wake(self):
+        """Wake queued requests so they re-check cancellation"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                **self.stats,
+                'submitted_by_priority': dict(self.stats['submitted_by_priority']),
+                'waiting': len(self.queue),
+                'in_flight': self.in_flight,
+                'paused_for_seconds': round(max(0.0, self.paused_until - time.monotonic()), 2),
+                'worker_count': self.worker_count,
+                'requests_per_minute': round(self.request_bucket.capacity, 2),
+                'tokens_per_minute': int(self.token_bucket.capacity),
+                'tokens_available': int(self.token_bucket.tokens),
+                'requests_available': int(self.request_bucket.tokens)
+            }
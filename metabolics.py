@@ -0,0 +1,150 @@
+"""
+Vectorized population metabolics.
+
+NumPy counterparts of IntelligentDietPlanner.calculate_bmr, calculate_bmi,
+get_bmi_category_and_advice and calculate_daily_calories that process whole
+cohorts in one pass. The arithmetic is performed in the same order as the
+scalar code so every row matches the per-profile result exactly, including
+Python's round() and int() semantics.
+"""
+import numpy as np
+
+# Keep in sync with IntelligentDietPlanner.calculate_daily_calories
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very_active': 1.9
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.55
+GOAL_FACTORS = {'lose_fat': 0.9, 'gain_muscle': 1.1}
+
+# Keep in sync with IntelligentDietPlanner.get_bmi_category_and_advice
+BMI_THRESHOLDS = np.array([18.5, 25.0, 30.0])
+BMI_CATEGORIES = np.array(['Underweight', 'Normal weight', 'Overweight', 'Obese'])
+BMI_ADJUSTMENTS = np.array([1.15, 1.0, 0.85, 0.75])
+
+
+def _map_values(values, mapping, default, dtype, normalize=None):
+    """Map an array of labels through a dict; each distinct label is normalized and looked up once"""
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    table = {}
+    for value in set(values):
+        key = normalize(value) if normalize else value
+        table[value] = mapping.get(key, default)
+    return np.fromiter(map(table.__getitem__, values), dtype=dtype, count=len(values))
+
+
+def round_half_even_like_python(values, ndigits=1):
+    """
+    Element-wise equivalent of Python's round(x, ndigits).
+    np.round scales by 10**ndigits first, which can land on the wrong side of a .5 tie;
+    the few elements that sit on a tie are re-rounded with round() itself.
+    """
+    scale = 10.0 ** ndigits
+    rounded = np.round(values, ndigits)
+    scaled = values * scale
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(float(v), ndigits) for v in values[near_tie]]
+    return rounded
+
+
+def calculate_bmr_array(ages, weights, heights, is_male):
+    """Harris-Benedict BMR for arrays of profiles"""
+    male = 88.362 + (13.397 * weights) + (4.799 * heights) - (5.677 * ages)
+    female = 447.593 + (9.247 * weights) + (3.098 * heights) - (4.330 * ages)
+    return np.where(is_male, male, female)
+
+
+def calculate_bmi_array(weights, heights):
+    """BMI rounded to one decimal exactly as calculate_bmi does"""
+    height_m = heights / 100
+    return round_half_even_like_python(weights / (height_m * height_m), 1)
+
+
+def bmi_category_indices(bmi):
+    """Index into BMI_CATEGORIES/BMI_ADJUSTMENTS for each (already rounded) BMI"""
+    return np.searchsorted(BMI_THRESHOLDS, bmi, side='right')
+
+
+def calculate_daily_calories_array(bmr, activity_multipliers, goal_factors, bmi_adjustments):
+    """Daily calories with the same multiplication order and int() truncation as the scalar version"""
+    calories = bmr * activity_multipliers
+    calories = calories * bmi_adjustments
+    calories = np.where(goal_factors != 1.0, calories * goal_factors, calories)
+    return np.trunc(calories).astype(np.int64)
+
+
+def calculate_population_metrics(ages, weights, heights, genders, activity_levels=None, goals=None):
+    """
+    Compute BMR, BMI, BMI category and target calories for a cohort in one pass.
+    Inputs are equal-length sequences; genders/activity levels/goals use the same labels as the form.
+    Returns a dict of NumPy arrays plus the category labels.
+    """
+    ages = np.asarray(ages, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    count = len(ages)
+
+    if not (len(weights) == len(heights) == len(genders) == count):
+        raise ValueError('ages, weights, heights and genders must have the same length')
+
+    is_male = _map_values(genders, {'male': True}, False, bool, normalize=lambda g: str(g).lower())
+
+    if activity_levels is None:
+        multipliers = np.full(count, DEFAULT_ACTIVITY_MULTIPLIER)
+    else:
+        multipliers = _map_values(activity_levels, ACTIVITY_MULTIPLIERS, DEFAULT_ACTIVITY_MULTIPLIER, np.float64)
+
+    if goals is None:
+        goal_factors = np.ones(count)
+    else:
+        goal_factors = _map_values(goals, GOAL_FACTORS, 1.0, np.float64)
+
+    bmr = calculate_bmr_array(ages, weights, heights, is_male)
+    bmi = calculate_bmi_array(weights, heights)
+    category_index = bmi_category_indices(bmi)
+    bmi_adjustments = BMI_ADJUSTMENTS[category_index]
+    daily_calories = calculate_daily_calories_array(bmr, multipliers, goal_factors, bmi_adjustments)
+
+    return {
+        'bmr': bmr,
+        'bmi': bmi,
+        'category_index': category_index,
+        'bmi_category': BMI_CATEGORIES[category_index],
+        'calorie_adjustment': bmi_adjustments,
+        'daily_calories': daily_calories
+    }
+
+
+def summarize_population_metrics(metrics):
+    """Cohort-level summary suitable for a JSON response"""
+    count = len(metrics['bmr'])
+    if not count:
+        return {'count': 0}
+
+    def describe(values):
+        p10, p50, p90 = np.percentile(values, [10, 50, 90])
+        return {
+            'mean': round(float(np.mean(values)), 1),
+            'p10': round(float(p10), 1),
+            'median': round(float(p50), 1),
+            'p90': round(float(p90), 1),
+            'min': round(float(np.min(values)), 1),
+            'max': round(float(np.max(values)), 1)
+        }
+
+    category_counts = np.bincount(metrics['category_index'], minlength=len(BMI_CATEGORIES))
+    return {
+        'count': count,
+        'bmr': describe(metrics['bmr']),
+        'bmi': describe(metrics['bmi']),
+        'daily_calories': describe(metrics['daily_calories']),
+        'bmi_categories': {
+            str(name): {'count': int(n), 'percentage': round(100.0 * int(n) / count, 2)}
+            for name, n in zip(BMI_CATEGORIES, category_counts)
+        }
+    }
@@ -0,0 +1,122 @@
+import os
+import threading
+
+from llm_hedging import LatencyTracker, configured_models
+
+
+ROUTER_ENABLED = os.environ.get('ROUTER_ENABLED', 'true').lower() == 'true'
+
+# Each tier is a model chain (primary first). The large tier defaults to the GROQ_MODELS chain, which is
+# also the small tier's fallback.
+SMALL_TIER_MODELS = os.environ.get('ROUTER_SMALL_MODELS', 'llama3-8b-8192')
+LARGE_TIER_MODELS = os.environ.get('ROUTER_LARGE_MODELS', '')
+
+# Cases scoring at or above the threshold go to the large model; high-risk cases always do
+ROUTER_THRESHOLD = float(os.environ.get('ROUTER_THRESHOLD', 2))
+ROUTER_WEIGHTS = {
+    'medication': float(os.environ.get('ROUTER_WEIGHT_MEDICATION', 1)),
+    'diagnosis': float(os.environ.get('ROUTER_WEIGHT_DIAGNOSIS', 2)),
+    'preexisting': float(os.environ.get('ROUTER_WEIGHT_PREEXISTING', 1)),
+    'fasting': float(os.environ.get('ROUTER_WEIGHT_FASTING', 1)),
+}
+
+EMPTY_ANSWERS = {'', 'none', 'nil', 'no', 'n/a', 'na', 'nothing'}
+
+
+def _has_content(text):
+    return bool(text) and str(text).strip().lower() not in EMPTY_ANSWERS
+
+
+def count_medications(medicines):
+    if not medicines:
+        return 0
+    return sum(1 for med in str(medicines).split(',') if _has_content(med))
+
+
+def _parse_chain(value):
+    return [m.strip() for m in value.split(',') if m.strip()]
+
+
+class ModelRouter:
+    """Scores each case from its mapped_data and routes simple ones to a small, fast model"""
+
+    def __init__(self, threshold=None, weights=None, enabled=None):
+        self.threshold = ROUTER_THRESHOLD if threshold is None else threshold
+        self.weights = {**ROUTER_WEIGHTS, **(weights or {})}
+        self.enabled = ROUTER_ENABLED if enabled is None else enabled
+        large = _parse_chain(LARGE_TIER_MODELS) or configured_models()
+        small = _parse_chain(SMALL_TIER_MODELS)
+        self.tiers = {'small': small + [model for model in large if model not in small], 'large': large}
+        self.latency = LatencyTracker()
+        self.lock = threading.Lock()
+        self.counts = {tier: {'routed': 0, 'succeeded': 0, 'failed': 0} for tier in self.tiers}
+
+    def score(self, mapped_data, is_high_risk=False):
+        """Complexity score and the factors that contributed to it"""
+        reasons = []
+        score = 0.0
+
+        medication_count = count_medications(mapped_data.get('medicines'))
+        if medication_count:
+            score += medication_count * self.weights['medication']
+            reasons.append(f'{medication_count} medication(s)')
+
+        if _has_content(mapped_data.get('diagnosis')):
+            score += self.weights['diagnosis']
+            reasons.append('diagnosis')
+
+        if _has_content(mapped_data.get('preexisting')):
+            score += self.weights['preexisting']
+            reasons.append('pre-existing conditions')
+
+        if _has_content(mapped_data.get('fasting')):
+            score += self.weights['fasting']
+            reasons.append('fasting')
+
+        if is_high_risk:
+            reasons.append('high risk')
+
+        return score, reasons
+
+    def route(self, mapped_data, is_high_risk=False):
+        """Returns the tier, its model chain and the scoring details for one case
+        (no chain when routing is disabled, so the caller's GROQ_MODELS chain applies)"""
+        score, reasons = self.score(mapped_data, is_high_risk)
+        if not self.enabled or is_high_risk or score >= self.threshold:
+            tier = 'large'
+        else:
+            tier = 'small'
+
+        with self.lock:
+            self.counts[tier]['routed'] += 1
+
+        return {'tier': tier, 'models': self.tiers[tier] if self.enabled else None, 'score': score,
+                'reasons': reasons}
+
+    def record(self, tier, seconds, success):
+        """Record the LLM latency and outcome for a routed case"""
+        self.latency.record(tier, seconds)
+        with self.lock:
+            self.counts[tier]['succeeded' if success else 'failed'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            counts = {tier: dict(values) for tier, values in self.counts.items()}
+        total = sum(values['routed'] for values in counts.values())
+
+        latency = self.latency.summary()
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'weights': self.weights,
+            'tiers': {
+                tier: {
+                    **counts[tier],
+                    'models': self.tiers[tier] if self.enabled else configured_models(),
+                    'share_percentage': round(100.0 * counts[tier]['routed'] / total, 1) if total else 0.0,
+                    'latency': latency.get(tier, {'samples': 0, 'p50_seconds': 0, 'p95_seconds': 0})
+                }
+                for tier in self.tiers
+            },
+            'total_routed': total
+        }
@@ -2,8 +2,268 @@ import requests
 import json
 import sqlite3
 import re
-from datetime import datetime, timedelta
+import difflib
+from datetime import datetime
 import threading
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from itertools import combinations
+
+from food_index import FoodNameIndex
+from l1_cache import L1Cache
+from cache_refresh import BackgroundRefresher
+from deadlines import DeadlineExceeded, stage_timeout, remaining, DEADLINE_MIN_HTTP
+import flight_recorder
+
+
+VERIFY_FETCH_WORKERS = int(os.environ.get('VERIFY_FETCH_WORKERS', 4))
+L1_FOOD_MAX_ENTRIES = int(os.environ.get('L1_FOOD_MAX_ENTRIES', 4096))
+L1_DRUG_MAX_ENTRIES = int(os.environ.get('L1_DRUG_MAX_ENTRIES', 1024))
+
+FOOD_CACHE_TTL = 30 * 24 * 3600
+DRUG_CACHE_TTL = 90 * 24 * 3600
+# Past its TTL an entry is still served for this long while a background refresh replaces it
+FOOD_STALE_GRACE = int(float(os.environ.get('FOOD_CACHE_STALE_GRACE_DAYS', 7)) * 24 * 3600)
+DRUG_STALE_GRACE = int(float(os.environ.get('DRUG_CACHE_STALE_GRACE_DAYS', 14)) * 24 * 3600)
+# Most drugs + foods one prefetch call may warm
+PREFETCH_MAX_ITEMS = int(os.environ.get('PREFETCH_MAX_ITEMS', 20))
+# Names RxNorm does not know are asked again after this long (a typo may be fixed upstream, or RxNav was wrong)
+RXCUI_UNRESOLVED_TTL = int(float(os.environ.get('RXCUI_UNRESOLVED_TTL_HOURS', 24)) * 3600)
+# How close approximateTerm.json's best candidate has to be to a misspelled name (0-1, difflib ratio against
+# the candidate's RxNorm name) to be accepted; RxNav's own scores are not comparable across versions
+RXNORM_APPROX_MIN_SIMILARITY = float(os.environ.get('RXNORM_APPROX_MIN_SIMILARITY', 0.8))
+
+FOOD_COLUMNS = ("food_name, description, usda_verified, calories_per_100g, protein_g, carbs_g, fat_g, "
+                "fiber_g, sodium_mg, potassium_mg, error, expires_at")
+DRUG_GUIDANCE_CATEGORIES = ('food_restrictions', 'timing_recommendations', 'special_considerations')
+
+# Built-in drug knowledge base, used when RxNorm has no answer. Module-level so that
+# gunicorn --preload builds it once and workers share it copy-on-write.
+KNOWN_DRUG_GUIDANCE = {
+    'metformin': {
+        'food_restrictions': [
+            'Take with meals to reduce stomach upset',
+            'Limit alcohol consumption',
+            'Avoid large amounts of vitamin B12 inhibiting foods long-term'
+        ],
+        'timing_recommendations': [
+            'Take with breakfast and dinner if twice daily',
+            'Take with largest meal if once daily',
+            'Consistent meal timing helps with blood sugar control'
+        ],
+        'special_considerations': [
+            'Monitor for lactic acidosis symptoms',
+            'Regular B12 level monitoring recommended'
+        ]
+    },
+    'lisinopril': {
+        'food_restrictions': [
+            'Monitor potassium intake (avoid excessive high-potassium foods)',
+            'Limit alcohol consumption',
+            'Avoid salt substitutes containing potassium'
+        ],
+        'timing_recommendations': [
+            'Can be taken with or without food',
+            'Take at the same time each day',
+            'Morning dosing preferred to avoid nighttime hypotension'
+        ],
+        'special_considerations': [
+            'Watch for signs of hyperkalemia',
+            'Monitor blood pressure regularly'
+        ]
+    },
+    'warfarin': {
+        'food_restrictions': [
+            'Maintain consistent vitamin K intake',
+            'Limit leafy green vegetables to consistent amounts',
+            'Avoid cranberry juice and large amounts of cranberries',
+            'Limit alcohol consumption significantly'
+        ],
+        'timing_recommendations': [
+            'Take at the same time each day (usually evening)',
+            'Consistent diet pattern crucial for INR stability',
+            'Take on empty stomach for consistent absorption'
+        ],
+        'special_considerations': [
+            'Regular INR monitoring essential',
+            'Many food and drug interactions - consult pharmacist'
+        ]
+    },
+    'levothyroxine': {
+        'food_restrictions': [
+            'Avoid soy products within 4 hours',
+            'Avoid calcium supplements within 4 hours',
+            'Avoid iron supplements within 4 hours',
+            'Avoid high-fiber meals within 1 hour'
+        ],
+        'timing_recommendations': [
+            'Take on empty stomach 30-60 minutes before breakfast',
+            'Wait 4 hours before calcium or iron supplements',
+            'Consistent timing critical for hormone levels'
+        ],
+        'special_considerations': [
+            'Coffee may affect absorption - wait 1 hour',
+            'Regular thyroid function monitoring needed'
+        ]
+    },
+    'atorvastatin': {
+        'food_restrictions': [
+            'Avoid grapefruit and grapefruit juice completely',
+            'Limit alcohol consumption',
+            'Can be taken with or without food'
+        ],
+        'timing_recommendations': [
+            'Evening dosing preferred (cholesterol synthesis highest at night)',
+            'Can take with dinner',
+            'Consistent daily timing recommended'
+        ],
+        'special_considerations': [
+            'Monitor for muscle pain or weakness',
+            'Regular liver function tests recommended'
+        ]
+    },
+    'amlodipine': {
+        'food_restrictions': [
+            'Avoid grapefruit and grapefruit juice',
+            'Limit alcohol consumption',
+            'Can be taken with or without food'
+        ],
+        'timing_recommendations': [
+            'Same time each day',
+            'Morning dosing typically preferred',
+            'Can take with breakfast'
+        ],
+        'special_considerations': [
+            'Monitor for ankle swelling',
+            'Rise slowly from sitting/lying to prevent dizziness'
+        ]
+    }
+}
+
+# Well-known drug-food interactions added on top of RxNorm results
+KNOWN_DRUG_INTERACTIONS = {
+    'warfarin': {
+        'food_restrictions': [
+            'Maintain consistent vitamin K intake (leafy greens)',
+            'Avoid cranberry juice and large amounts of cranberries',
+            'Limit alcohol consumption'
+        ],
+        'timing_recommendations': [
+            'Take at the same time each day',
+            'Consistent diet pattern important for INR stability'
+        ]
+    },
+    'metformin': {
+        'food_restrictions': [
+            'Take with meals to reduce stomach upset',
+            'Limit alcohol intake'
+        ],
+        'timing_recommendations': [
+            'Take with breakfast and dinner if twice daily',
+            'Take with largest meal if once daily'
+        ]
+    },
+    'levothyroxine': {
+        'food_restrictions': [
+            'Avoid soy products within 4 hours',
+            'Avoid calcium and iron supplements within 4 hours',
+            'Avoid high-fiber meals within 1 hour'
+        ],
+        'timing_recommendations': [
+            'Take on empty stomach 30-60 minutes before breakfast',
+            'Wait at least 4 hours before calcium or iron supplements'
+        ]
+    },
+    'lisinopril': {
+        'food_restrictions': [
+            'Monitor potassium intake (avoid excessive potassium-rich foods)',
+            'Limit alcohol consumption'
+        ],
+        'timing_recommendations': [
+            'Can be taken with or without food',
+            'Take at the same time each day'
+        ]
+    }
+}
+
+
+def _split_amount(value):
+    """'3.1 mg' -> (3.1, 'mg'); unparseable values are kept as the unit text"""
+    parts = str(value).split(None, 1)
+    try:
+        return float(parts[0]), parts[1] if len(parts) > 1 else ''
+    except (ValueError, IndexError):
+        return None, str(value)
+
+
+def medication_names(medicines):
+    """Medication names from the comma-separated form field, without 'none'/'nil' placeholders"""
+    names = (med.strip() for med in (medicines or '').split(','))
+    return [med for med in names if med and med.lower() not in ['none', 'nil']]
+
+
+# Strengths ("500mg", "0.5 mg/ml", "10 units") and dosage-form/schedule words in typed medication names
+DOSE_PATTERN = re.compile(r'\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|ug|g|ml|iu|units?|meq|%)(?:\s*/\s*\d*\s*(?:ml|h|hr|day))?(?![a-z])')
+MEDICATION_FORM_WORDS = frozenset((
+    'tablet', 'tablets', 'tab', 'tabs', 'capsule', 'capsules', 'cap', 'caps', 'pill', 'pills', 'oral', 'solution',
+    'suspension', 'syrup', 'injection', 'injectable', 'cream', 'ointment', 'gel', 'patch', 'drops', 'spray',
+    'inhaler', 'chewable', 'film', 'coated', 'extended', 'delayed', 'immediate', 'release', 'er', 'xr', 'sr', 'xl',
+    'cr', 'dr', 'ir', 'daily', 'once', 'twice', 'od', 'bd', 'bid', 'tid', 'qd', 'mg', 'mcg'
+))
+
+
+def normalize_medication_name(name):
+    """'Metformin 500mg Tablets' -> 'metformin': lowercase, without strengths, dosage forms or bare numbers"""
+    text = DOSE_PATTERN.sub(' ', str(name).lower())
+    words = [word for word in re.split(r'[^a-z0-9]+', text)
+             if word and not word.isdigit() and word not in MEDICATION_FORM_WORDS]
+    return ' '.join(words) or str(name).strip().lower()
+
+
+def drug_guidance_key(rxcui, normalized_name):
+    """drug_cache key: one row per RxCUI, so every spelling of a drug shares it; per name when RxNorm has none"""
+    return f'rxcui:{rxcui}' if rxcui else normalized_name
+
+
+def pair_key(rxcui_a, rxcui_b):
+    """Cache key of an (unordered) drug pair"""
+    return '+'.join(sorted((rxcui_a, rxcui_b)))
+
+
+def _food_row_to_dict(row):
+    """Nutrition dict in the shape _fetch_usda_nutrition returns, from a FOOD_COLUMNS row"""
+    (food_name, description, usda_verified, calories, protein, carbs, fat, fiber, sodium, potassium, error,
+     expires_at) = row
+    if error:
+        return {
+            'food_name': description or food_name,
+            'error': error,
+            'calories_per_100g': 'Unknown',
+            'protein_g': 'Unknown',
+            'carbs_g': 'Unknown',
+            'fat_g': 'Unknown'
+        }
+    return {
+        'food_name': description,
+        'usda_verified': bool(usda_verified),
+        'calories_per_100g': calories,
+        'protein_g': protein,
+        'carbs_g': carbs,
+        'fat_g': fat,
+        'fiber_g': fiber,
+        'sodium_mg': sodium,
+        'potassium_mg': potassium,
+        'key_vitamins': {},
+        'key_minerals': {}
+    }
+
+
+def _parse_legacy_date(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
 
 
 class NutritionDatabaseIntegration:
@@ -14,21 +274,88 @@ class NutritionDatabaseIntegration:
 
     def __init__(self, usda_api_key):
         self.usda_api_key = usda_api_key
-        self.usda_base = "https://api.nal.usda.gov/fdc/v1"
-        self.rxnorm_base = "https://rxnav.nlm.nih.gov/REST"
-        self.setup_database()
+        # Base URLs can be overridden to point at local stand-ins (see perf/fakes.py)
+        self.usda_base = os.environ.get('USDA_API_BASE', "https://api.nal.usda.gov/fdc/v1")
+        self.rxnorm_base = os.environ.get('RXNORM_API_BASE', "https://rxnav.nlm.nih.gov/REST")
+        self.db_path = os.environ.get('NUTRITION_CACHE_DB', 'nutrition_cache.db')
         self.lock = threading.Lock()
+        self.lookup_stats = {'exact': 0, 'alias': 0, 'fuzzy': 0, 'miss': 0, 'stale': 0, 'deadline_fallback': 0,
+                             'pair_hit': 0, 'pair_miss': 0, 'interaction_list_calls': 0,
+                             'drug_hit': 0, 'drug_rxcui_hit': 0, 'drug_miss': 0,
+                             'name_hit': 0, 'name_exact': 0, 'name_approximate': 0, 'name_unresolved': 0,
+                             'rxcui_calls': 0, 'approximate_term_calls': 0, 'interaction_calls': 0}
+        # Fuzzy index so spelling/word-order variants resolve to an existing cached entry
+        self.food_index = FoodNameIndex()
+        # Decoded results above SQLite; warm lookups are a dict read without the lock
+        self.food_l1 = L1Cache(L1_FOOD_MAX_ENTRIES)
+        self.drug_l1 = L1Cache(L1_DRUG_MAX_ENTRIES)
+        # Normalized medication name -> (rxcui or None, match method, RxNorm name), mirroring drug_name_map
+        self.drug_name_l1 = L1Cache(L1_DRUG_MAX_ENTRIES)
+        # Re-fetches entries served stale, off the request path
+        self.refresher = BackgroundRefresher()
+        self.setup_database()
+
+        for (food_name,) in self.conn.execute(
+                "SELECT food_name FROM food_nutrition WHERE error IS NULL"):
+            self.food_index.add(food_name)
 
     def setup_database(self):
         """Setup SQLite database for caching API responses"""
-        self.conn = sqlite3.connect('nutrition_cache.db', check_same_thread=False)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+
+        # Incremental auto-vacuum lets the sweeper return freed pages to the filesystem a few at a time.
+        # Switching an existing file needs one full VACUUM; new files are empty so it is instant.
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("VACUUM")
+
+        # Files written before the typed schema keep JSON blobs; move them aside and convert below
+        legacy_food = self._rename_legacy_table('food_nutrition', 'nutrition_data')
+        legacy_drug = self._rename_legacy_table('drug_cache', 'interaction_data')
 
-        # Food nutrition cache table
+        # Food nutrition cache: one typed column per nutrient, expiry as epoch seconds
         self.conn.execute('''
             CREATE TABLE IF NOT EXISTS food_nutrition (
                 food_name TEXT PRIMARY KEY,
-                nutrition_data TEXT,
-                cached_date TEXT
+                description TEXT,
+                usda_verified INTEGER NOT NULL DEFAULT 0,
+                calories_per_100g REAL,
+                protein_g REAL,
+                carbs_g REAL,
+                fat_g REAL,
+                fiber_g REAL,
+                sodium_mg REAL,
+                potassium_mg REAL,
+                error TEXT,
+                cached_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                last_accessed INTEGER
+            )
+        ''')
+        self._add_last_accessed_column('food_nutrition')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_food_nutrition_expires ON food_nutrition (expires_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_food_nutrition_accessed ON food_nutrition (last_accessed)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_food_nutrition_sodium ON food_nutrition (sodium_mg)")
+
+        for table in ('food_vitamins', 'food_minerals'):
+            self.conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    food_name TEXT NOT NULL REFERENCES food_nutrition (food_name) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    amount REAL,
+                    unit TEXT,
+                    PRIMARY KEY (food_name, name)
+                )
+            ''')
+
+        # Alternative spellings resolved to a cached food_name
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS food_alias (
+                alias TEXT PRIMARY KEY,
+                food_name TEXT,
+                similarity REAL,
+                created_date TEXT
             )
         ''')
 
@@ -36,27 +363,151 @@ class NutritionDatabaseIntegration:
         self.conn.execute('''
             CREATE TABLE IF NOT EXISTS drug_cache (
                 drug_name TEXT PRIMARY KEY,
-                interaction_data TEXT,
-                cached_date TEXT
+                medication TEXT,
+                rxnorm_found INTEGER,
+                built_in_guidance INTEGER,
+                cached_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                last_accessed INTEGER
+            )
+        ''')
+        self._add_last_accessed_column('drug_cache')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_cache_expires ON drug_cache (expires_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_cache_accessed ON drug_cache (last_accessed)")
+
+        # One row per guidance line, in order, per category
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS drug_guidance (
+                drug_name TEXT NOT NULL REFERENCES drug_cache (drug_name) ON DELETE CASCADE,
+                category TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (drug_name, category, position)
+            )
+        ''')
+
+        # Normalized medication name -> RxCUI (NULL: RxNorm has no match), shared by every spelling that
+        # normalizes to it; method is 'exact' (rxcui.json) or 'approximate' (approximateTerm.json, score is
+        # the name similarity). rxnorm_name is the drug's own name, which guidance is built from.
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS drug_name_map (
+                name TEXT PRIMARY KEY,
+                rxcui TEXT,
+                method TEXT NOT NULL,
+                score REAL,
+                rxnorm_name TEXT,
+                cached_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                last_accessed INTEGER
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_name_map_expires ON drug_name_map (expires_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_name_map_accessed ON drug_name_map (last_accessed)")
+
+        # Drug-drug interaction results per RxCUI pair; a pair with no interaction rows was checked and is clear
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS drug_pair_cache (
+                pair_key TEXT PRIMARY KEY,
+                rxcui_a TEXT NOT NULL,
+                rxcui_b TEXT NOT NULL,
+                cached_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                last_accessed INTEGER
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_pair_cache_expires ON drug_pair_cache (expires_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_drug_pair_cache_accessed ON drug_pair_cache (last_accessed)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS drug_pair_interactions (
+                pair_key TEXT NOT NULL REFERENCES drug_pair_cache (pair_key) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                severity TEXT,
+                description TEXT NOT NULL,
+                source TEXT,
+                PRIMARY KEY (pair_key, position)
             )
         ''')
 
         self.conn.commit()
 
-    def get_food_nutrition_summary(self, food_name):
+        if legacy_food or legacy_drug:
+            self._migrate_legacy_tables(legacy_food, legacy_drug)
+
+    def _add_last_accessed_column(self, table):
+        """Add the LRU column to tables created before the sweeper existed"""
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+        if 'last_accessed' not in columns:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN last_accessed INTEGER")
+            self.conn.execute(f"UPDATE {table} SET last_accessed = cached_at")
+
+    def _rename_legacy_table(self, table, blob_column):
+        """Rename a JSON-blob table to <table>_legacy; returns the new name or None"""
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+        if blob_column not in columns:
+            return None
+        legacy = f"{table}_legacy"
+        self.conn.execute(f"DROP TABLE IF EXISTS {legacy}")
+        self.conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        return legacy
+
+    def _migrate_legacy_tables(self, legacy_food, legacy_drug):
+        """Convert JSON-blob rows into the typed tables, keeping their original cache dates"""
+        migrated = 0
+        with self.conn:
+            if legacy_food:
+                for food_name, nutrition_data, cached_date in self.conn.execute(
+                        f"SELECT food_name, nutrition_data, cached_date FROM {legacy_food}").fetchall():
+                    try:
+                        self._cache_nutrition(food_name, json.loads(nutrition_data), _parse_legacy_date(cached_date),
+                                              commit=False)
+                        migrated += 1
+                    except (ValueError, TypeError):
+                        continue
+                self.conn.execute(f"DROP TABLE {legacy_food}")
+
+            if legacy_drug:
+                for drug_name, interaction_data, cached_date in self.conn.execute(
+                        f"SELECT drug_name, interaction_data, cached_date FROM {legacy_drug}").fetchall():
+                    try:
+                        self._cache_drug_data(drug_name, json.loads(interaction_data), _parse_legacy_date(cached_date),
+                                              commit=False)
+                        migrated += 1
+                    except (ValueError, TypeError):
+                        continue
+                self.conn.execute(f"DROP TABLE {legacy_drug}")
+
+        print(f"✅ Migrated {migrated} cached entries to the typed nutrition schema")
+
+    def get_food_nutrition_summary(self, food_name, deadline=None):
         """
         Get nutrition summary for a specific food item
-        Returns essential nutrition data for LLM context
+        Returns essential nutrition data for LLM context; USDA calls are cut short at `deadline`
         """
         # Check cache first (valid for 30 days)
+        traced = flight_recorder.fingerprint(food_name)
+        cached = self.food_l1.get(food_name.lower())
+        if cached is not None:
+            flight_recorder.record('food_lookup', food=traced, tier='l1')
+            return cached
+
         with self.lock:
             cached = self._get_cached_nutrition(food_name)
             if cached:
-                return json.loads(cached)
+                self.lookup_stats['exact'] += 1
+                flight_recorder.record('food_lookup', food=traced, tier='sqlite')
+                return cached
+
+            # A close match already in the cache saves the USDA round trip
+            cached = self._resolve_similar_cached(food_name)
+            if cached:
+                flight_recorder.record('food_lookup', food=traced, tier='similar')
+                return cached
+            self.lookup_stats['miss'] += 1
 
         try:
             # Search USDA database
-            nutrition_data = self._fetch_usda_nutrition(food_name)
+            with flight_recorder.stage('food_lookup', food=traced, tier='usda'):
+                nutrition_data = self._fetch_usda_nutrition(food_name, deadline)
 
             # Cache the result
             with self.lock:
@@ -74,7 +525,15 @@ class NutritionDatabaseIntegration:
                 'fat_g': 'Unknown'
             }
 
-    def _fetch_usda_nutrition(self, food_name):
+    def _http_get(self, url, params, timeout, traced_url=None):
+        """requests.get that records the call (URL without query, status, time) on the request's timeline;
+        traced_url replaces a URL whose path identifies the patient's drug"""
+        with flight_recorder.stage('http', url=traced_url or url, timeout_s=round(timeout, 2)) as call:
+            response = requests.get(url, params=params, timeout=timeout)
+            call['status'] = response.status_code
+            return response
+
+    def _fetch_usda_nutrition(self, food_name, deadline=None):
         """Fetch nutrition data from USDA API"""
         # Step 1: Search for food
         search_url = f"{self.usda_base}/foods/search"
@@ -85,7 +544,7 @@ class NutritionDatabaseIntegration:
             'pageSize': 1
         }
 
-        search_response = requests.get(search_url, params=search_params, timeout=15)
+        search_response = self._http_get(search_url, search_params, stage_timeout(15, deadline))
         search_response.raise_for_status()
         search_data = search_response.json()
 
@@ -104,7 +563,7 @@ class NutritionDatabaseIntegration:
         detail_url = f"{self.usda_base}/food/{fdc_id}"
         detail_params = {'api_key': self.usda_api_key}
 
-        detail_response = requests.get(detail_url, params=detail_params, timeout=15)
+        detail_response = self._http_get(detail_url, detail_params, stage_timeout(15, deadline))
         detail_response.raise_for_status()
         detail_data = detail_response.json()
 
@@ -154,25 +613,69 @@ class NutritionDatabaseIntegration:
 
         return nutrition
 
-    def get_drug_food_guidance(self, medication_name):
+    def get_drug_food_guidance(self, medication_name, deadline=None):
         """
         Get drug-food interaction guidance from RxNorm
-        Returns dietary restrictions and timing recommendations
+        Returns dietary restrictions and timing recommendations.
+        Guidance is cached per RxCUI and built from RxNorm's name for the drug, so "Metformin 500mg",
+        "metformin" and "metformine" share one entry once their names are resolved (see _resolve_drug).
+        With a `deadline`, RxNorm calls use only the time left; if there is too little, or the calls run
+        out of it, the built-in guidance is returned uncached and the lookup finishes in the background.
         """
-        # Check cache first (valid for 90 days)
+        # Check cache first (valid for 90 days); counters on this lock-free path are approximate
+        name = medication_name.lower()
+        traced = flight_recorder.fingerprint(medication_name)
+        cached = self.drug_l1.get(name)
+        if cached is not None:
+            self.lookup_stats['drug_hit'] += 1
+            flight_recorder.record('drug_lookup', medication=traced, tier='l1')
+            return self._as_requested(cached, medication_name)
+
         with self.lock:
-            cached = self._get_cached_drug_data(medication_name)
+            key = self._known_drug_key(medication_name)
+            cached = self._get_cached_drug_data(key) if key else None
             if cached:
-                return json.loads(cached)
+                self.lookup_stats['drug_hit'] += 1
+                self.drug_l1.alias(name, key)
+                flight_recorder.record('drug_lookup', medication=traced, tier='sqlite')
+                return self._as_requested(cached, medication_name)
+
+        if deadline is not None and remaining(deadline) < DEADLINE_MIN_HTTP:
+            flight_recorder.record('drug_lookup', medication=traced, tier='deadline_fallback')
+            return self._deadline_drug_fallback(medication_name)
 
         try:
-            guidance = self._fetch_drug_guidance(medication_name)
+            with flight_recorder.stage('drug_lookup', medication=traced, tier='rxnorm') as lookup:
+                try:
+                    rxcui, rxnorm_name = self._resolve_drug(medication_name, deadline)
+                except (requests.RequestException, ValueError, DeadlineExceeded):
+                    # Not remembered as unresolved; the next lookup asks RxNorm again
+                    rxcui, rxnorm_name = None, None
+                key = drug_guidance_key(rxcui, normalize_medication_name(medication_name))
+
+                # A new spelling of a drug whose guidance is already cached
+                with self.lock:
+                    cached = self._get_cached_drug_data(key)
+                    if cached:
+                        self.lookup_stats['drug_hit'] += 1
+                        self.lookup_stats['drug_rxcui_hit'] += 1
+                        self.drug_l1.alias(name, key)
+                        lookup['tier'] = 'rxcui'
+                        return self._as_requested(cached, medication_name)
+                    self.lookup_stats['drug_miss'] += 1
+
+                # The shared entry must not depend on which spelling fetched it (built-in rules match by name)
+                guidance = self._fetch_drug_guidance(rxnorm_name or medication_name, deadline, rxcui=rxcui or '')
+            if deadline is not None and remaining(deadline) <= 0:
+                # The fetch may have fallen back because it ran out of time; don't cache that for 90 days
+                return self._as_requested(self._deadline_drug_fallback(medication_name, guidance), medication_name)
 
             # Cache the result
             with self.lock:
-                self._cache_drug_data(medication_name, guidance)
+                self._cache_drug_data(key, guidance)
+                self.drug_l1.alias(name, key)
 
-            return guidance
+            return self._as_requested(guidance, medication_name)
 
         except Exception as e:
             return {
@@ -183,30 +686,38 @@ class NutritionDatabaseIntegration:
                 'special_considerations': []
             }
 
-    def _fetch_drug_guidance(self, medication_name):
-        """Fetch drug interaction data from RxNorm API with better error handling"""
-        try:
-            # Get RxCUI (drug identifier) with shorter timeout
-            rxcui_url = f"{self.rxnorm_base}/rxcui.json"
-            rxcui_params = {'name': medication_name}
+    def _as_requested(self, guidance, medication_name):
+        """Cached guidance labelled with the spelling that was asked for (cached values are shared, so copied)"""
+        if guidance.get('medication') == medication_name:
+            return guidance
+        return {**guidance, 'medication': medication_name}
 
-            rxcui_response = requests.get(rxcui_url, params=rxcui_params, timeout=10)
-            rxcui_response.raise_for_status()
-            rxcui_data = rxcui_response.json()
+    def _deadline_drug_fallback(self, medication_name, guidance=None):
+        """Guidance served when the RxNorm lookup did not fit the deadline; the full lookup is queued"""
+        self.lookup_stats['deadline_fallback'] += 1
+        self.refresher.submit(('drug', medication_name.lower()), self.get_drug_food_guidance, medication_name)
+        return guidance or self._get_known_drug_guidance(medication_name)
 
-            rxcui_list = rxcui_data.get('idGroup', {}).get('rxnormId', [])
+    def _fetch_drug_guidance(self, medication_name, deadline=None, rxcui=None):
+        """Fetch drug interaction data from RxNorm API with better error handling.
+        rxcui skips name resolution when the caller already has it ('' for a name RxNorm does not know)."""
+        try:
+            # Get RxCUI (drug identifier) with shorter timeout
+            if rxcui is None:
+                rxcui = self._resolve_rxcui(medication_name, deadline)
 
-            if not rxcui_list:
+            if not rxcui:
                 # If not found in RxNorm, return known guidance
                 return self._get_known_drug_guidance(medication_name)
 
             # Get interaction data with shorter timeout
-            rxcui = rxcui_list[0]
             interaction_url = f"{self.rxnorm_base}/interaction/interaction.json"
             interaction_params = {'rxcui': rxcui}
 
             try:
-                interaction_response = requests.get(interaction_url, params=interaction_params, timeout=8)
+                with self.lock:
+                    self.lookup_stats['interaction_calls'] += 1
+                interaction_response = self._http_get(interaction_url, interaction_params, stage_timeout(8, deadline))
                 interaction_response.raise_for_status()
                 interaction_data = interaction_response.json()
 
@@ -226,122 +737,279 @@ class NutritionDatabaseIntegration:
             # Fallback to known guidance for any error
             return self._get_known_drug_guidance(medication_name)
 
-    def _get_known_drug_guidance(self, medication_name):
-        """Get guidance from our built-in drug knowledge base"""
-        med_lower = medication_name.lower()
+    def _resolve_rxcui(self, medication_name, deadline=None):
+        """RxNorm concept ID for a medication name, or None if RxNorm does not know it"""
+        return self._resolve_drug(medication_name, deadline)[0]
 
-        # Comprehensive built-in drug guidance
-        known_drugs = {
-            'metformin': {
-                'food_restrictions': [
-                    'Take with meals to reduce stomach upset',
-                    'Limit alcohol consumption',
-                    'Avoid large amounts of vitamin B12 inhibiting foods long-term'
-                ],
-                'timing_recommendations': [
-                    'Take with breakfast and dinner if twice daily',
-                    'Take with largest meal if once daily',
-                    'Consistent meal timing helps with blood sugar control'
-                ],
-                'special_considerations': [
-                    'Monitor for lactic acidosis symptoms',
-                    'Regular B12 level monitoring recommended'
-                ]
-            },
-            'lisinopril': {
-                'food_restrictions': [
-                    'Monitor potassium intake (avoid excessive high-potassium foods)',
-                    'Limit alcohol consumption',
-                    'Avoid salt substitutes containing potassium'
-                ],
-                'timing_recommendations': [
-                    'Can be taken with or without food',
-                    'Take at the same time each day',
-                    'Morning dosing preferred to avoid nighttime hypotension'
-                ],
-                'special_considerations': [
-                    'Watch for signs of hyperkalemia',
-                    'Monitor blood pressure regularly'
-                ]
-            },
-            'warfarin': {
-                'food_restrictions': [
-                    'Maintain consistent vitamin K intake',
-                    'Limit leafy green vegetables to consistent amounts',
-                    'Avoid cranberry juice and large amounts of cranberries',
-                    'Limit alcohol consumption significantly'
-                ],
-                'timing_recommendations': [
-                    'Take at the same time each day (usually evening)',
-                    'Consistent diet pattern crucial for INR stability',
-                    'Take on empty stomach for consistent absorption'
-                ],
-                'special_considerations': [
-                    'Regular INR monitoring essential',
-                    'Many food and drug interactions - consult pharmacist'
-                ]
-            },
-            'levothyroxine': {
-                'food_restrictions': [
-                    'Avoid soy products within 4 hours',
-                    'Avoid calcium supplements within 4 hours',
-                    'Avoid iron supplements within 4 hours',
-                    'Avoid high-fiber meals within 1 hour'
-                ],
-                'timing_recommendations': [
-                    'Take on empty stomach 30-60 minutes before breakfast',
-                    'Wait 4 hours before calcium or iron supplements',
-                    'Consistent timing critical for hormone levels'
-                ],
-                'special_considerations': [
-                    'Coffee may affect absorption - wait 1 hour',
-                    'Regular thyroid function monitoring needed'
-                ]
-            },
-            'atorvastatin': {
-                'food_restrictions': [
-                    'Avoid grapefruit and grapefruit juice completely',
-                    'Limit alcohol consumption',
-                    'Can be taken with or without food'
-                ],
-                'timing_recommendations': [
-                    'Evening dosing preferred (cholesterol synthesis highest at night)',
-                    'Can take with dinner',
-                    'Consistent daily timing recommended'
-                ],
-                'special_considerations': [
-                    'Monitor for muscle pain or weakness',
-                    'Regular liver function tests recommended'
-                ]
+    def _resolve_drug(self, medication_name, deadline=None):
+        """
+        (rxcui, RxNorm name) for a medication name, or (None, None) if RxNorm does not know it.
+        The name is normalized first (strengths and dosage forms stripped) and the mapping is kept in
+        drug_name_map, so each normalized name costs one rxcui.json call - plus one approximateTerm.json call
+        when it is misspelled - per DRUG_CACHE_TTL. Lookup errors raise and are not remembered.
+        """
+        name = normalize_medication_name(medication_name)
+        traced, traced_name = flight_recorder.fingerprint(medication_name), flight_recorder.fingerprint(name)
+        mapped = self.drug_name_l1.get(name)
+        if mapped is None:
+            with self.lock:
+                mapped = self._get_cached_rxcui(name)
+        if mapped is not None:
+            rxcui, method, rxnorm_name = mapped
+            with self.lock:
+                self.lookup_stats['name_hit'] += 1
+            flight_recorder.record('rxcui', medication=traced, normalized=traced_name, tier='cached', method=method)
+            return rxcui, rxnorm_name
+
+        with flight_recorder.stage('rxcui', medication=traced, normalized=traced_name, tier='rxnorm') as lookup:
+            rxcui, method, score, rxnorm_name = self._fetch_rxcui(name, deadline)
+            lookup['method'] = method
+        with self.lock:
+            self.lookup_stats[f'name_{method}'] += 1
+            self._cache_rxcui(name, rxcui, method, score, rxnorm_name)
+        return rxcui, rxnorm_name
+
+    def _fetch_rxcui(self, name, deadline=None):
+        """
+        (rxcui, method, score, RxNorm name) for a normalized name: exact/normalized match, else RxNav's best
+        approximate term if its name is at least RXNORM_APPROX_MIN_SIMILARITY alike (score is that similarity)
+        """
+        with self.lock:
+            self.lookup_stats['rxcui_calls'] += 1
+        response = self._http_get(f"{self.rxnorm_base}/rxcui.json", {'name': name, 'search': 2},
+                                  stage_timeout(10, deadline))
+        response.raise_for_status()
+        rxcui_list = response.json().get('idGroup', {}).get('rxnormId', [])
+        if rxcui_list:
+            return rxcui_list[0], 'exact', None, name
+
+        with self.lock:
+            self.lookup_stats['approximate_term_calls'] += 1
+        response = self._http_get(f"{self.rxnorm_base}/approximateTerm.json", {'term': name, 'maxEntries': 1},
+                                  stage_timeout(10, deadline))
+        response.raise_for_status()
+        candidates = [candidate for candidate in response.json().get('approximateGroup', {}).get('candidate', [])
+                      if candidate.get('rxcui')]
+        if candidates:
+            rxcui = candidates[0]['rxcui']
+            rxnorm_name = normalize_medication_name(
+                candidates[0].get('name') or self._fetch_rxnorm_name(rxcui, deadline))
+            # 'warfrin' against 'warfarin', not against 'warfarin sodium'
+            similarity = difflib.SequenceMatcher(
+                None, name, ' '.join(rxnorm_name.split()[:len(name.split())])).ratio()
+            if similarity >= RXNORM_APPROX_MIN_SIMILARITY:
+                return rxcui, 'approximate', round(similarity, 3), rxnorm_name
+        return None, 'unresolved', None, None
+
+    def _fetch_rxnorm_name(self, rxcui, deadline=None):
+        """RxNorm's name for a concept, for approximateTerm.json candidates that come without one"""
+        with self.lock:
+            self.lookup_stats['rxcui_calls'] += 1
+        response = self._http_get(f"{self.rxnorm_base}/rxcui/{rxcui}/properties.json", {},
+                                  stage_timeout(10, deadline), f"{self.rxnorm_base}/rxcui/<rxcui>/properties.json")
+        response.raise_for_status()
+        return (response.json().get('properties') or {}).get('name') or ''
+
+    def _get_cached_rxcui(self, name):
+        """(rxcui, method, RxNorm name) remembered for a normalized name, or None if it has to be resolved
+        (caller holds the lock)"""
+        row = self.conn.execute(
+            "SELECT rxcui, method, rxnorm_name, expires_at FROM drug_name_map WHERE name = ? AND expires_at > ?",
+            (name, int(time.time()))
+        ).fetchone()
+        if not row:
+            return None
+        mapped = (row[0], row[1], row[2])
+        self.drug_name_l1.set(name, mapped, row[3])
+        return mapped
+
+    def _cache_rxcui(self, name, rxcui, method, score, rxnorm_name=None, cached_at=None):
+        """Remember a name's RxCUI; names RxNorm has no match for are kept for RXCUI_UNRESOLVED_TTL (caller holds the lock)"""
+        cached_at = int(cached_at or time.time())
+        expires_at = cached_at + (DRUG_CACHE_TTL if rxcui else RXCUI_UNRESOLVED_TTL)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO drug_name_map "
+            "(name, rxcui, method, score, rxnorm_name, cached_at, expires_at, last_accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, rxcui, method, score, rxnorm_name, cached_at, expires_at, cached_at)
+        )
+        self.conn.commit()
+        self.drug_name_l1.invalidate(name)
+        self.drug_name_l1.set(name, (rxcui, method, rxnorm_name), expires_at)
+
+    def _known_drug_key(self, medication_name):
+        """drug_cache key for a name whose RxCUI is already known, without calling RxNorm (caller holds the lock)"""
+        name = normalize_medication_name(medication_name)
+        mapped = self.drug_name_l1.get(name) or self._get_cached_rxcui(name)
+        if not mapped:
+            return None
+        self.lookup_stats['name_hit'] += 1
+        return drug_guidance_key(mapped[0], name)
+
+    def get_drug_resolution_stats(self):
+        """Hit rates of the name->RxCUI map and the per-RxCUI guidance cache, and the RxNav calls they leave"""
+        with self.lock:
+            stats = dict(self.lookup_stats)
+        names = stats['name_hit'] + stats['name_exact'] + stats['name_approximate'] + stats['name_unresolved']
+        guidance = stats['drug_hit'] + stats['drug_miss']
+        calls = stats['rxcui_calls'] + stats['approximate_term_calls'] + stats['interaction_calls']
+        return {
+            'name_lookups': names,
+            'name_hit_rate': round(stats['name_hit'] / names, 3) if names else 0.0,
+            'resolved_exact': stats['name_exact'],
+            'resolved_approximate': stats['name_approximate'],
+            'unresolved': stats['name_unresolved'],
+            'guidance_lookups': guidance,
+            'guidance_hit_rate': round(stats['drug_hit'] / guidance, 3) if guidance else 0.0,
+            'guidance_shared_by_rxcui': stats['drug_rxcui_hit'],
+            'rxnav_calls': {
+                'rxcui': stats['rxcui_calls'],
+                'approximate_term': stats['approximate_term_calls'],
+                'interaction': stats['interaction_calls'],
+                'interaction_list': stats['interaction_list_calls']
             },
-            'amlodipine': {
-                'food_restrictions': [
-                    'Avoid grapefruit and grapefruit juice',
-                    'Limit alcohol consumption',
-                    'Can be taken with or without food'
-                ],
-                'timing_recommendations': [
-                    'Same time each day',
-                    'Morning dosing typically preferred',
-                    'Can take with breakfast'
-                ],
-                'special_considerations': [
-                    'Monitor for ankle swelling',
-                    'Rise slowly from sitting/lying to prevent dizziness'
-                ]
-            }
+            # rxcui.json + approximateTerm.json + interaction.json calls per guidance lookup; 2 when nothing is cached
+            'rxnav_calls_per_guidance_lookup': round(calls / guidance, 3) if guidance else 0.0
+        }
+
+    def get_drug_drug_interactions(self, medications, deadline=None):
+        """
+        Interactions between the medications a patient takes together.
+        Each name is resolved to an RxCUI; pairs already in drug_pair_cache are served from it and the rest are
+        fetched with one interaction/list.json call covering only the drugs in uncached pairs (which also
+        refreshes any cached pair among those drugs). Pairs that could not be checked, including every pair
+        with a medication that did not resolve to an RxCUI, are listed as unchecked.
+        """
+        names = list(dict.fromkeys(name.strip() for name in medications if name and name.strip()))
+        rxcuis = {}
+        for name in names:
+            try:
+                rxcuis[name] = self._resolve_rxcui(name, deadline)
+            except (requests.RequestException, ValueError, DeadlineExceeded):
+                rxcuis[name] = None
+
+        # Two spellings of one drug are one drug
+        drug_names = {}
+        for name, rxcui in rxcuis.items():
+            if rxcui:
+                drug_names.setdefault(rxcui, name)
+        pairs = {pair_key(a, b): (a, b) for a, b in combinations(sorted(drug_names), 2)}
+        # A drug RxNav cannot name cannot be checked against anything
+        unresolved = [name for name in names if not rxcuis[name]]
+        drugs = [name for name in names if not rxcuis[name] or drug_names[rxcuis[name]] == name]
+        unresolved_pairs = [[a, b] for a, b in combinations(drugs, 2) if not (rxcuis[a] and rxcuis[b])]
+
+        with self.lock:
+            found = self._get_cached_pairs(list(pairs))
+            missing = [key for key in pairs if key not in found]
+            self.lookup_stats['pair_hit'] += len(found)
+            self.lookup_stats['pair_miss'] += len(missing)
+
+        unchecked = []
+        if missing:
+            involved = sorted({rxcui for key in missing for rxcui in pairs[key]})
+            try:
+                fetched = self._fetch_pair_interactions(involved, deadline)
+                with self.lock:
+                    self._cache_pairs(fetched)
+                found.update(fetched)
+            except (requests.RequestException, ValueError, DeadlineExceeded) as e:
+                print(f"⚠️ Drug-drug interaction lookup failed for {len(missing)} pairs: {e}")
+                unchecked = missing
+
+        flight_recorder.record('drug_pairs', pairs=len(pairs), cached=len(pairs) - len(missing),
+                               fetched=len(missing) - len(unchecked),
+                               unchecked=len(unchecked) + len(unresolved_pairs))
+        interactions = []
+        for key, (a, b) in pairs.items():
+            for interaction in found.get(key, []):
+                interactions.append({'drugs': [drug_names[a], drug_names[b]], 'rxcuis': [a, b], **interaction})
+        return {
+            'medications': [{'medication': name, 'rxcui': rxcuis[name]} for name in names],
+            'interactions': interactions,
+            'pairs_checked': len(pairs) - len(unchecked),
+            'pairs_cached': len(pairs) - len(missing),
+            'pairs_fetched': len(missing) - len(unchecked),
+            'unresolved_medications': unresolved,
+            'unchecked_pairs': [[drug_names[a] for a in pairs[key]] for key in unchecked] + unresolved_pairs
         }
 
+    def _fetch_pair_interactions(self, rxcuis, deadline=None):
+        """{pair_key: [interaction]} for every pair among rxcuis, from a single interaction/list.json call"""
+        with self.lock:
+            self.lookup_stats['interaction_list_calls'] += 1
+        response = self._http_get(f"{self.rxnorm_base}/interaction/list.json", {'rxcuis': ' '.join(rxcuis)},
+                                  stage_timeout(10, deadline))
+        response.raise_for_status()
+
+        pairs = {pair_key(a, b): [] for a, b in combinations(rxcuis, 2)}
+        for group in response.json().get('fullInteractionTypeGroup', []):
+            source = group.get('sourceName')
+            for interaction_type in group.get('fullInteractionType', []):
+                concepts = [concept.get('rxcui') for concept in interaction_type.get('minConcept', [])]
+                if len(concepts) != 2 or pair_key(*concepts) not in pairs:
+                    continue
+                for pair in interaction_type.get('interactionPair', []):
+                    if pair.get('description'):
+                        pairs[pair_key(*concepts)].append({
+                            'severity': pair.get('severity') or 'N/A',
+                            'description': pair['description'],
+                            'source': source
+                        })
+        return pairs
+
+    def _get_cached_pairs(self, keys):
+        """{pair_key: [interaction]} for the unexpired cached pairs among keys (caller holds the lock)"""
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        now = int(time.time())
+        found = {row[0]: [] for row in self.conn.execute(
+            f"SELECT pair_key FROM drug_pair_cache WHERE pair_key IN ({placeholders}) AND expires_at > ?",
+            list(keys) + [now]
+        )}
+        if not found:
+            return found
+        placeholders = ','.join('?' * len(found))
+        for key, severity, description, source in self.conn.execute(
+                f"SELECT pair_key, severity, description, source FROM drug_pair_interactions "
+                f"WHERE pair_key IN ({placeholders}) ORDER BY pair_key, position", list(found)):
+            found[key].append({'severity': severity, 'description': description, 'source': source})
+        with self.conn:
+            self.conn.executemany("UPDATE drug_pair_cache SET last_accessed = ? WHERE pair_key = ?",
+                                  [(now, key) for key in found])
+        return found
+
+    def _cache_pairs(self, pairs):
+        """Store {pair_key: [interaction]} results, including pairs with no interactions (caller holds the lock)"""
+        now = int(time.time())
+        with self.conn:
+            for key, interactions in pairs.items():
+                rxcui_a, rxcui_b = key.split('+')
+                # REPLACE deletes the old row, which cascades to its interactions
+                self.conn.execute("INSERT OR REPLACE INTO drug_pair_cache VALUES (?, ?, ?, ?, ?, ?)",
+                                  (key, rxcui_a, rxcui_b, now, now + DRUG_CACHE_TTL, now))
+                self.conn.executemany(
+                    "INSERT INTO drug_pair_interactions VALUES (?, ?, ?, ?, ?)",
+                    [(key, position, item['severity'], item['description'], item['source'])
+                     for position, item in enumerate(interactions)]
+                )
+
+    def _get_known_drug_guidance(self, medication_name):
+        """Get guidance from our built-in drug knowledge base"""
+        med_lower = medication_name.lower()
+
         # Check if we have specific guidance for this drug
-        for drug_name, guidance in known_drugs.items():
+        for drug_name, guidance in KNOWN_DRUG_GUIDANCE.items():
             if drug_name in med_lower or med_lower in drug_name:
+                # Copies, since callers extend these lists
                 return {
                     'medication': medication_name,
                     'rxnorm_found': False,
                     'built_in_guidance': True,
-                    'food_restrictions': guidance['food_restrictions'],
-                    'timing_recommendations': guidance['timing_recommendations'],
-                    'special_considerations': guidance['special_considerations']
+                    'food_restrictions': list(guidance['food_restrictions']),
+                    'timing_recommendations': list(guidance['timing_recommendations']),
+                    'special_considerations': list(guidance['special_considerations'])
                 }
 
         # Generic guidance for unknown drugs
@@ -421,54 +1089,8 @@ class NutritionDatabaseIntegration:
         """Add well-known drug-food interactions"""
         med_lower = medication_name.lower()
 
-        # Common drug-food interactions
-        known_interactions = {
-            'warfarin': {
-                'food_restrictions': [
-                    'Maintain consistent vitamin K intake (leafy greens)',
-                    'Avoid cranberry juice and large amounts of cranberries',
-                    'Limit alcohol consumption'
-                ],
-                'timing_recommendations': [
-                    'Take at the same time each day',
-                    'Consistent diet pattern important for INR stability'
-                ]
-            },
-            'metformin': {
-                'food_restrictions': [
-                    'Take with meals to reduce stomach upset',
-                    'Limit alcohol intake'
-                ],
-                'timing_recommendations': [
-                    'Take with breakfast and dinner if twice daily',
-                    'Take with largest meal if once daily'
-                ]
-            },
-            'levothyroxine': {
-                'food_restrictions': [
-                    'Avoid soy products within 4 hours',
-                    'Avoid calcium and iron supplements within 4 hours',
-                    'Avoid high-fiber meals within 1 hour'
-                ],
-                'timing_recommendations': [
-                    'Take on empty stomach 30-60 minutes before breakfast',
-                    'Wait at least 4 hours before calcium or iron supplements'
-                ]
-            },
-            'lisinopril': {
-                'food_restrictions': [
-                    'Monitor potassium intake (avoid excessive potassium-rich foods)',
-                    'Limit alcohol consumption'
-                ],
-                'timing_recommendations': [
-                    'Can be taken with or without food',
-                    'Take at the same time each day'
-                ]
-            }
-        }
-
         # Add known interactions if medication matches
-        for drug, interactions in known_interactions.items():
+        for drug, interactions in KNOWN_DRUG_INTERACTIONS.items():
             if drug in med_lower:
                 guidance['food_restrictions'].extend(interactions.get('food_restrictions', []))
                 guidance['timing_recommendations'].extend(interactions.get('timing_recommendations', []))
@@ -481,10 +1103,11 @@ class NutritionDatabaseIntegration:
 
         return guidance
 
-    def enhance_llm_prompt_with_nutrition_data(self, original_prompt, user_data):
+    def enhance_llm_prompt_with_nutrition_data(self, original_prompt, user_data, deadline=None):
         """
         Enhance the LLM prompt with real nutrition and drug interaction data
-        This makes the AI responses more accurate and evidence-based
+        This makes the AI responses more accurate and evidence-based.
+        Drug lookups share `deadline`; ones that don't fit use the built-in guidance.
         """
         enhanced_sections = []
 
@@ -506,20 +1129,18 @@ When considering medications:
         """)
 
         # Get medication-specific data
-        medications = user_data.get('medicines', '').split(',')
         medication_guidance = []
 
+        medications = medication_names(user_data.get('medicines', ''))
         for med in medications:
-            med = med.strip()
-            if med and med.lower() not in ['none', 'nil', '']:
-                drug_data = self.get_drug_food_guidance(med)
-                if not drug_data.get('error'):
-                    medication_guidance.append(f"""
+            drug_data = self.get_drug_food_guidance(med, deadline)
+            if not drug_data.get('error'):
+                medication_guidance.append(f"""
 MEDICATION: {drug_data['medication']}
 - Food Restrictions: {'; '.join(drug_data.get('food_restrictions', []))}
 - Timing: {'; '.join(drug_data.get('timing_recommendations', []))}
 - Special Notes: {'; '.join(drug_data.get('special_considerations', []))}
-                    """)
+                """)
 
         if medication_guidance:
             enhanced_sections.append(f"""
@@ -529,6 +1150,21 @@ MEDICATION: {drug_data['medication']}
 CRITICAL: Incorporate these specific interactions into meal timing and food choices.
             """)
 
+        # Interactions between the medications themselves
+        if len(medications) > 1:
+            drug_pairs = self.get_drug_drug_interactions(medications, deadline)
+            if drug_pairs['interactions'] or drug_pairs['unchecked_pairs']:
+                pair_lines = [f"- {' + '.join(item['drugs'])} ({item['severity']}): {item['description']}"
+                              for item in drug_pairs['interactions']]
+                pair_lines += [f"- {' + '.join(pair)}: NOT CHECKED - treat as a possible interaction"
+                               for pair in drug_pairs['unchecked_pairs']]
+                enhanced_sections.append(f"""
+⚠️ DRUG-DRUG INTERACTIONS (RxNav):
+{chr(10).join(pair_lines)}
+
+CRITICAL: Space doses and choose foods so they do not add to these combined effects.
+            """)
+
         # Add verification requirement
         enhanced_sections.append("""
 ✅ NUTRITION VERIFICATION REQUIREMENT:
@@ -547,64 +1183,366 @@ Example format:
 
         return enhanced_prompt
 
-    def get_nutrition_verification_for_llm(self, food_list):
+    def prefetch(self, medications=(), foods=()):
+        """
+        Warm the drug and food caches ahead of a plan request.
+        Lookups not already cached are queued on the background refresher, which deduplicates them
+        (also against stale refreshes) and rate-limits the upstream calls. Returns what happened to each name.
+        """
+        report = {'queued': [], 'cached': [], 'pending': [], 'rate_limited': [], 'dropped': []}
+        items = [('drug', name) for name in medications] + [('food', name) for name in foods]
+        items = list(dict.fromkeys((kind, name.strip().lower()) for kind, name in items if name and name.strip()))
+        report['dropped'] = [name for _, name in items[PREFETCH_MAX_ITEMS:]]
+
+        for kind, name in items[:PREFETCH_MAX_ITEMS]:
+            if self._is_cached(kind, name):
+                report['cached'].append(name)
+                continue
+            fetch = self.get_drug_food_guidance if kind == 'drug' else self.get_food_nutrition_summary
+            if self.refresher.submit((kind, name), fetch, name):
+                report['queued'].append(name)
+            elif self.refresher.is_pending((kind, name)):
+                report['pending'].append(name)
+            else:
+                report['rate_limited'].append(name)
+        return report
+
+    def _is_cached(self, kind, name):
+        """Whether a lookup would be answered from the cache (stale rows count; reading them queues a refresh)"""
+        l1 = self.drug_l1 if kind == 'drug' else self.food_l1
+        if l1.get(name) is not None:
+            return True
+        with self.lock:
+            if kind == 'drug':
+                key = self._known_drug_key(name)
+                return key is not None and self._get_cached_drug_data(key) is not None
+            return self._get_cached_nutrition(name) is not None
+
+    def get_nutrition_verification_for_llm(self, food_list, cache_only=False, deadline=None, micronutrients=True):
         """
         Get nutrition verification data for a list of foods
-        This can be called during or after LLM response generation
+        This can be called during or after LLM response generation.
+        Cached foods are read in one query; with cache_only=False the misses are fetched from USDA
+        concurrently until `deadline` (a time.monotonic() value). Foods not resolved in time are omitted;
+        entries USDA could not match carry an 'error' key.
         """
-        verification_data = {}
+        food_list = list(dict.fromkeys(food.lower() for food in food_list if food))
 
+        verification_data = {}
         for food in food_list:
-            nutrition = self.get_food_nutrition_summary(food)
-            verification_data[food] = nutrition
+            cached = self.food_l1.get(food)
+            if cached is not None:
+                verification_data[food] = cached
+        l1_hits = len(verification_data)
+
+        pending_foods = [food for food in food_list if food not in verification_data]
+        if pending_foods:
+            with self.lock:
+                verification_data.update(self._get_cached_nutrition_bulk(pending_foods, micronutrients))
+
+        misses = [food for food in food_list if food not in verification_data]
+        flight_recorder.record('food_lookup_bulk', foods=len(food_list), l1=l1_hits,
+                               sqlite=len(verification_data) - l1_hits, misses=len(misses), cache_only=cache_only)
+        if cache_only or not misses:
+            return verification_data
+
+        executor = ThreadPoolExecutor(max_workers=min(len(misses), VERIFY_FETCH_WORKERS))
+        futures = {flight_recorder.run_in_context(executor, self.get_food_nutrition_summary, food): food
+                   for food in misses}
+        timeout = None if deadline is None else max(0.0, remaining(deadline))
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                verification_data[futures[future]] = future.result()
+        except FuturesTimeout:
+            # Out of budget: late fetches still land in the cache for next time
+            pass
+        finally:
+            executor.shutdown(wait=False)
 
         return verification_data
 
-    def _get_cached_nutrition(self, food_name):
-        """Get nutrition data from cache if valid"""
-        cursor = self.conn.execute(
-            "SELECT nutrition_data, cached_date FROM food_nutrition WHERE food_name = ?",
-            (food_name.lower(),)
+    def _get_cached_nutrition(self, food_name, micronutrients=True):
+        """Get nutrition data from cache if valid or within the stale grace window (filtered in SQL)"""
+        now = int(time.time())
+        row = self.conn.execute(
+            f"SELECT {FOOD_COLUMNS} FROM food_nutrition WHERE food_name = ? AND expires_at > ?",
+            (food_name.lower(), now - FOOD_STALE_GRACE)
+        ).fetchone()
+        if not row:
+            return None
+
+        data = _food_row_to_dict(row)
+        if micronutrients and not data.get('error'):
+            self._attach_micronutrients({row[0]: data})
+        if row[-1] <= now:
+            # Stale: serve it now, replace it in the background
+            self._schedule_food_refresh(row[0])
+            self.food_l1.touch(row[0])
+        elif micronutrients:
+            # Only complete results go to L1, expiring with the row they came from
+            self.food_l1.set(row[0], data, row[-1])
+        else:
+            self.food_l1.touch(row[0])
+        return data
+
+    def _get_cached_nutrition_bulk(self, food_names, micronutrients=True):
+        """Valid cached nutrition for many foods in a single query, keyed by lowercase name"""
+        if not food_names:
+            return {}
+
+        names = list(dict.fromkeys(name.lower() for name in food_names))
+        placeholders = ','.join('?' * len(names))
+        now = int(time.time())
+        rows = self.conn.execute(
+            f"SELECT {FOOD_COLUMNS} FROM food_nutrition WHERE food_name IN ({placeholders}) AND expires_at > ?",
+            names + [now - FOOD_STALE_GRACE]
+        ).fetchall()
+
+        results = {row[0]: _food_row_to_dict(row) for row in rows}
+        if micronutrients:
+            self._attach_micronutrients({k: v for k, v in results.items() if not v.get('error')})
+        for row in rows:
+            if row[-1] <= now:
+                self._schedule_food_refresh(row[0])
+            self.food_l1.touch(row[0])
+        self.lookup_stats['exact'] += len(results)
+
+        for food_name in names:
+            if food_name not in results:
+                cached = self._resolve_similar_cached(food_name, micronutrients)
+                if cached:
+                    results[food_name] = cached
+        return results
+
+    def _attach_micronutrients(self, foods):
+        """Fill key_vitamins/key_minerals of the given {food_name: dict} from the child tables"""
+        if not foods:
+            return
+        names = list(foods)
+        placeholders = ','.join('?' * len(names))
+        rows = self.conn.execute(
+            f"SELECT 'key_vitamins', food_name, name, amount, unit FROM food_vitamins "
+            f"WHERE food_name IN ({placeholders}) "
+            f"UNION ALL SELECT 'key_minerals', food_name, name, amount, unit FROM food_minerals "
+            f"WHERE food_name IN ({placeholders})",
+            names + names
         )
-        result = cursor.fetchone()
+        for group, food_name, name, amount, unit in rows:
+            foods[food_name][group][name] = unit if amount is None else f"{amount} {unit}".strip()
+
+    def _resolve_similar_cached(self, food_name, micronutrients=True):
+        """Cached nutrition for a known alias or fuzzy match of food_name (caller holds the lock)"""
+        food_name = food_name.lower()
+        row = self.conn.execute(
+            "SELECT food_name FROM food_alias WHERE alias = ?", (food_name,)
+        ).fetchone()
+        if row:
+            cached = self._get_cached_nutrition(row[0], micronutrients)
+            if cached:
+                self.lookup_stats['alias'] += 1
+                self.food_l1.alias(food_name, row[0])
+                return cached
 
-        if result:
-            cached_date = datetime.fromisoformat(result[1])
-            if datetime.now() - cached_date < timedelta(days=30):
-                return result[0]
+        match, similarity = self.food_index.lookup(food_name)
+        if match is None or match == food_name:
+            return None
+        cached = self._get_cached_nutrition(match, micronutrients)
+        if not cached:
+            return None
 
-        return None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO food_alias VALUES (?, ?, ?, ?)",
+            (food_name, match, round(similarity, 3), datetime.now().isoformat())
+        )
+        self.conn.commit()
+        self.lookup_stats['fuzzy'] += 1
+        self.food_l1.alias(food_name, match)
+        return cached
+
+    def _schedule_food_refresh(self, food_name):
+        """Queue a USDA re-fetch for a stale row (caller holds the lock)"""
+        self.lookup_stats['stale'] += 1
+        self.refresher.submit(('food', food_name), self._refresh_food, food_name)
+
+    def _refresh_food(self, food_name):
+        nutrition_data = self._fetch_usda_nutrition(food_name)
+        if nutrition_data.get('error'):
+            # Keep serving the stale values rather than replacing them with a miss
+            raise ValueError(nutrition_data['error'])
+        with self.lock:
+            self._cache_nutrition(food_name, nutrition_data)
 
-    def _cache_nutrition(self, food_name, data):
+    def _cache_nutrition(self, food_name, data, cached_at=None, commit=True):
         """Cache nutrition data"""
+        food_name = food_name.lower()
+        cached_at = int(cached_at or time.time())
+        error = data.get('error')
+
+        def number(key):
+            value = data.get(key)
+            return value if isinstance(value, (int, float)) and not error else None
+
+        # REPLACE deletes the old row, which cascades to its vitamins and minerals
         self.conn.execute(
-            "INSERT OR REPLACE INTO food_nutrition VALUES (?, ?, ?)",
-            (food_name.lower(), json.dumps(data), datetime.now().isoformat())
+            "INSERT OR REPLACE INTO food_nutrition "
+            "(food_name, description, usda_verified, calories_per_100g, protein_g, carbs_g, fat_g, fiber_g, "
+            "sodium_mg, potassium_mg, error, cached_at, expires_at, last_accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (food_name, data.get('food_name'), int(bool(data.get('usda_verified'))),
+             number('calories_per_100g'), number('protein_g'), number('carbs_g'), number('fat_g'),
+             number('fiber_g'), number('sodium_mg'), number('potassium_mg'), error,
+             cached_at, cached_at + FOOD_CACHE_TTL, cached_at)
         )
-        self.conn.commit()
+        for table, group in (('food_vitamins', 'key_vitamins'), ('food_minerals', 'key_minerals')):
+            rows = [(food_name, name) + _split_amount(value) for name, value in (data.get(group) or {}).items()]
+            if rows:
+                self.conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)", rows)
+        if commit:
+            self.conn.commit()
+        if not error:
+            self.food_index.add(food_name)
+
+        # The row was rewritten: drop stale copies (including alias entries) and keep the new value
+        self.food_l1.invalidate(food_name)
+        self.food_l1.set(food_name, data, cached_at + FOOD_CACHE_TTL)
 
     def _get_cached_drug_data(self, drug_name):
         """Get drug data from cache if valid"""
-        cursor = self.conn.execute(
-            "SELECT interaction_data, cached_date FROM drug_cache WHERE drug_name = ?",
-            (drug_name.lower(),)
-        )
-        result = cursor.fetchone()
-
-        if result:
-            cached_date = datetime.fromisoformat(result[1])
-            if datetime.now() - cached_date < timedelta(days=90):
-                return result[0]
+        drug_name = drug_name.lower()
+        now = int(time.time())
+        row = self.conn.execute(
+            "SELECT medication, rxnorm_found, built_in_guidance, expires_at FROM drug_cache "
+            "WHERE drug_name = ? AND expires_at > ?",
+            (drug_name, now - DRUG_STALE_GRACE)
+        ).fetchone()
+        if not row:
+            return None
+
+        medication, rxnorm_found, built_in_guidance, expires_at = row
+        guidance = {'medication': medication, 'rxnorm_found': bool(rxnorm_found)}
+        if built_in_guidance is not None:
+            guidance['built_in_guidance'] = bool(built_in_guidance)
+        for category in DRUG_GUIDANCE_CATEGORIES:
+            guidance[category] = []
+        for category, text in self.conn.execute(
+                "SELECT category, text FROM drug_guidance WHERE drug_name = ? ORDER BY category, position",
+                (drug_name,)):
+            guidance.setdefault(category, []).append(text)
+
+        if expires_at <= now:
+            self.lookup_stats['stale'] += 1
+            self.refresher.submit(('drug', drug_name), self._refresh_drug, drug_name, medication or drug_name)
+            self.drug_l1.touch(drug_name)
+        else:
+            self.drug_l1.set(drug_name, guidance, expires_at)
+        return guidance
 
-        return None
+    def _refresh_drug(self, drug_name, medication_name):
+        # Rows keyed by RxCUI skip name resolution; '' marks a name RxNorm had no match for
+        rxcui = drug_name[len('rxcui:'):] if drug_name.startswith('rxcui:') else ''
+        guidance = self._fetch_drug_guidance(medication_name, rxcui=rxcui)
+        with self.lock:
+            self._cache_drug_data(drug_name, guidance)
 
-    def _cache_drug_data(self, drug_name, data):
+    def _cache_drug_data(self, drug_name, data, cached_at=None, commit=True):
         """Cache drug interaction data"""
+        drug_name = drug_name.lower()
+        cached_at = int(cached_at or time.time())
+        built_in = data.get('built_in_guidance')
+
         self.conn.execute(
-            "INSERT OR REPLACE INTO drug_cache VALUES (?, ?, ?)",
-            (drug_name.lower(), json.dumps(data), datetime.now().isoformat())
+            "INSERT OR REPLACE INTO drug_cache "
+            "(drug_name, medication, rxnorm_found, built_in_guidance, cached_at, expires_at, last_accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (drug_name, data.get('medication', drug_name), int(bool(data.get('rxnorm_found'))),
+             None if built_in is None else int(bool(built_in)), cached_at, cached_at + DRUG_CACHE_TTL, cached_at)
         )
-        self.conn.commit()
+        rows = [
+            (drug_name, category, position, text)
+            for category in DRUG_GUIDANCE_CATEGORIES
+            for position, text in enumerate(data.get(category) or [])
+        ]
+        if rows:
+            self.conn.executemany("INSERT INTO drug_guidance VALUES (?, ?, ?, ?)", rows)
+        if commit:
+            self.conn.commit()
+
+        self.drug_l1.invalidate(drug_name)
+        self.drug_l1.set(drug_name, data, cached_at + DRUG_CACHE_TTL)
+
+    def flush_access_times(self):
+        """Write the last-access times buffered by the L1 caches to SQLite; returns rows touched"""
+        updates = 0
+        with self.lock:
+            with self.conn:
+                for table, key_column, l1 in (('food_nutrition', 'food_name', self.food_l1),
+                                              ('drug_cache', 'drug_name', self.drug_l1),
+                                              ('drug_name_map', 'name', self.drug_name_l1)):
+                    accessed = l1.drain_accessed()
+                    if accessed:
+                        self.conn.executemany(
+                            f"UPDATE {table} SET last_accessed = ? WHERE {key_column} = ? AND last_accessed < ?",
+                            [(when, key, when) for key, when in accessed.items()]
+                        )
+                        updates += len(accessed)
+        return updates
+
+    def delete_cached_rows(self, table, keys):
+        """Delete food_nutrition, drug_cache, drug_name_map or drug_pair_cache rows (children cascade) and forget
+        them in memory; caller holds the lock"""
+        if not keys:
+            return 0
+        placeholders = ','.join('?' * len(keys))
+        with self.conn:
+            if table == 'food_nutrition':
+                deleted = self.conn.execute(
+                    f"DELETE FROM food_nutrition WHERE food_name IN ({placeholders})", keys).rowcount
+                self.conn.execute(f"DELETE FROM food_alias WHERE food_name IN ({placeholders})", keys)
+            elif table == 'drug_name_map':
+                deleted = self.conn.execute(
+                    f"DELETE FROM drug_name_map WHERE name IN ({placeholders})", keys).rowcount
+            elif table == 'drug_pair_cache':
+                # No in-memory copy to forget
+                return self.conn.execute(
+                    f"DELETE FROM drug_pair_cache WHERE pair_key IN ({placeholders})", keys).rowcount
+            else:
+                deleted = self.conn.execute(
+                    f"DELETE FROM drug_cache WHERE drug_name IN ({placeholders})", keys).rowcount
+
+        l1 = {'food_nutrition': self.food_l1, 'drug_name_map': self.drug_name_l1}.get(table, self.drug_l1)
+        for key in keys:
+            l1.invalidate(key)
+            if table == 'food_nutrition':
+                self.food_index.remove(key)
+        return deleted
+
+    def query_foods(self, max_sodium_mg=None, max_calories=None, min_protein_g=None, min_fiber_g=None,
+                    max_potassium_mg=None, limit=50):
+        """Aggregate query over cached foods, e.g. query_foods(max_sodium_mg=100)"""
+        conditions = ["error IS NULL", "expires_at > ?"]
+        params = [int(time.time())]
+        for column, operator, value in (
+                ('sodium_mg', '<=', max_sodium_mg),
+                ('calories_per_100g', '<=', max_calories),
+                ('protein_g', '>=', min_protein_g),
+                ('fiber_g', '>=', min_fiber_g),
+                ('potassium_mg', '<=', max_potassium_mg)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(float(value))
+        params.append(int(limit))
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT food_name, description, calories_per_100g, protein_g, carbs_g, fat_g, fiber_g, "
+                f"sodium_mg, potassium_mg FROM food_nutrition WHERE {' AND '.join(conditions)} "
+                f"ORDER BY sodium_mg, food_name LIMIT ?",
+                params
+            ).fetchall()
+
+        keys = ('food_name', 'description', 'calories_per_100g', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g',
+                'sodium_mg', 'potassium_mg')
+        return [dict(zip(keys, row)) for row in rows]
 
     def test_api_connections(self):
         """Test both API connections"""
@@ -0,0 +1,228 @@
+"""
+Post-generation nutrition verification.
+
+Parses the meals out of a generated plan, resolves every food against the
+nutrition cache in bulk and recomputes calories and macros per meal, so the
+"USDA verified" numbers the LLM writes can be checked against daily_calories.
+"""
+import os
+import re
+import time
+
+
+VERIFY_ENABLED = os.environ.get('NUTRITION_VERIFY_ENABLED', 'true').lower() == 'true'
+# Interactive requests only read the cache; batch requests may also call USDA for misses
+VERIFY_BUDGET_INTERACTIVE = float(os.environ.get('VERIFY_BUDGET_INTERACTIVE_MS', 50)) / 1000
+VERIFY_BUDGET_BATCH = float(os.environ.get('VERIFY_BUDGET_BATCH_SECONDS', 10))
+# Relative difference above which a number is reported as a discrepancy
+VERIFY_TOLERANCE = float(os.environ.get('VERIFY_TOLERANCE', 0.15))
+
+MEAL_HEADER = re.compile(r'\*\*(BREAKFAST|LUNCH|DINNER)\s*\((\d[\d,]*)\s*calories\)', re.IGNORECASE)
+MEAL_LINE = re.compile(r'\*Meal:\*\s*(.+)')
+KEY_NUTRIENTS = re.compile(
+    r'\*Key Nutrients:\*\s*(\d+(?:\.\d+)?)\s*g\s*protein,\s*(\d+(?:\.\d+)?)\s*g\s*carbs?,\s*(\d+(?:\.\d+)?)\s*g\s*fats?',
+    re.IGNORECASE
+)
+
+# "<food name> (<portion>)"; the name may contain non-numeric parentheses such as "(cooked)"
+FOOD_WITH_PORTION = re.compile(
+    r"([A-Za-z][\w\-']*(?:\s+(?:[A-Za-z][\w\-']*|\([^)\d]*\)))*)\s*\(([^)]*\d[^)]*)\)"
+)
+# Skips nutrient amounts such as "5g protein" inside "(1 cup = 216 calories, 5g protein)"
+PORTION_AMOUNT = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(kg|g|grams?|ml|l)\b(?!\s*(?:protein|carbs?|carbohydrates?|fats?|fib(?:re|er)|sugars?))',
+    re.IGNORECASE
+)
+UNIT_TO_GRAMS = {'kg': 1000, 'l': 1000}
+
+LEADING_WORDS = re.compile(
+    r'^(?:(?:cooked|served|topped|mixed|sauteed|tossed)\s+(?:in|with)|with|in|and|plus|on|a|an|of|'
+    r'small|medium|large|cups?|slices?|pieces?|tbsp|tsp|handful)\s+',
+    re.IGNORECASE
+)
+
+
+def normalize_food_name(name):
+    """Lowercase lookup name with descriptive parentheses and leading connectors/sizes removed"""
+    name = re.sub(r'\([^)]*\)', ' ', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    previous = None
+    while previous != name:
+        previous = name
+        name = LEADING_WORDS.sub('', name).strip()
+    return name.lower()
+
+
+def parse_meal_items(meal_text):
+    """[(food_name, grams)] for every food with a weight/volume portion; foods without one are returned with None"""
+    items = []
+    for match in FOOD_WITH_PORTION.finditer(meal_text):
+        name = normalize_food_name(match.group(1))
+        if not name:
+            continue
+        amount = PORTION_AMOUNT.search(match.group(2))
+        grams = None
+        if amount:
+            unit = amount.group(2).lower()
+            grams = float(amount.group(1)) * UNIT_TO_GRAMS.get(unit, 1)
+        items.append((name, grams))
+    return items
+
+
+def parse_meal_plan(plan_text):
+    """Meals found in a plan: {meal: {'claimed_calories', 'claimed_macros', 'items'}}"""
+    meals = {}
+    headers = list(MEAL_HEADER.finditer(plan_text or ''))
+    for index, header in enumerate(headers):
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(plan_text)
+        # The last meal block runs until the next top-level section
+        next_section = plan_text.find('\n**', header.end())
+        if index + 1 == len(headers) and next_section != -1:
+            end = next_section
+        block = plan_text[header.end():end]
+
+        meal_line = MEAL_LINE.search(block)
+        nutrients = KEY_NUTRIENTS.search(block)
+        meals[header.group(1).lower()] = {
+            'claimed_calories': int(header.group(2).replace(',', '')),
+            'claimed_macros': {
+                'protein': float(nutrients.group(1)),
+                'carbs': float(nutrients.group(2)),
+                'fat': float(nutrients.group(3))
+            } if nutrients else None,
+            'items': parse_meal_items(meal_line.group(1)) if meal_line else []
+        }
+    return meals
+
+
+def _usable(nutrition):
+    if not nutrition or nutrition.get('error'):
+        return False
+    return all(isinstance(nutrition.get(k), (int, float)) for k in ('protein_g', 'carbs_g', 'fat_g'))
+
+
+def _calories_per_100g(nutrition):
+    """USDA energy value, or 4/4/9 Atwater factors when the entry reports none"""
+    calories = nutrition.get('calories_per_100g')
+    if isinstance(calories, (int, float)) and calories > 0:
+        return calories
+    return nutrition['protein_g'] * 4 + nutrition['carbs_g'] * 4 + nutrition['fat_g'] * 9
+
+
+def _off_by(actual, expected, tolerance):
+    return expected > 0 and abs(actual - expected) / expected > tolerance
+
+
+class NutritionVerifier:
+    """Recomputes meal calories and macros from cached nutrition data and reports discrepancies"""
+
+    def __init__(self, nutrition_db, tolerance=None, enabled=None):
+        self.nutrition_db = nutrition_db
+        self.tolerance = VERIFY_TOLERANCE if tolerance is None else tolerance
+        self.enabled = VERIFY_ENABLED if enabled is None else enabled
+
+    def verify(self, plan_text, daily_calories, batch=False, deadline=None):
+        """Verification report for a plan; interactive requests use cache hits only.
+        Lookups stop at the end of the verify budget or the request's deadline, whichever is sooner."""
+        started = time.monotonic()
+        mode = 'full' if batch else 'cache_only'
+        budget = VERIFY_BUDGET_BATCH if batch else VERIFY_BUDGET_INTERACTIVE
+        stop_at = started + budget if deadline is None else min(started + budget, deadline)
+
+        meals = parse_meal_plan(plan_text)
+        discrepancies = []
+
+        claimed_total = sum(meal['claimed_calories'] for meal in meals.values())
+        if meals and _off_by(claimed_total, daily_calories, self.tolerance):
+            discrepancies.append({
+                'type': 'claimed_total_calories',
+                'expected': daily_calories,
+                'actual': claimed_total,
+                'message': f"Meal calories add up to {claimed_total}, target is {daily_calories}"
+            })
+
+        foods = {name for meal in meals.values() for name, grams in meal['items'] if grams}
+        nutrition = {}
+        if foods and self.nutrition_db is not None:
+            nutrition = self.nutrition_db.get_nutrition_verification_for_llm(
+                foods, cache_only=not batch, deadline=stop_at, micronutrients=False
+            )
+
+        unresolved = set()
+        computed_meals = {}
+        for meal_name, meal in meals.items():
+            totals = {'calories': 0.0, 'protein': 0.0, 'carbs': 0.0, 'fat': 0.0}
+            resolved = 0
+            for name, grams in meal['items']:
+                data = nutrition.get(name)
+                if not grams or not _usable(data):
+                    unresolved.add(name)
+                    continue
+                factor = grams / 100.0
+                totals['calories'] += _calories_per_100g(data) * factor
+                totals['protein'] += data['protein_g'] * factor
+                totals['carbs'] += data['carbs_g'] * factor
+                totals['fat'] += data['fat_g'] * factor
+                resolved += 1
+
+            complete = bool(meal['items']) and resolved == len(meal['items'])
+            computed_meals[meal_name] = {
+                'claimed_calories': meal['claimed_calories'],
+                'computed_calories': int(round(totals['calories'])),
+                'computed_macros': {k: round(totals[k], 1) for k in ('protein', 'carbs', 'fat')},
+                'items': len(meal['items']),
+                'resolved_items': resolved,
+                'complete': complete
+            }
+
+            # Only fully resolved meals can be compared; a partial sum would always look short
+            if not complete:
+                continue
+            if _off_by(totals['calories'], meal['claimed_calories'], self.tolerance):
+                discrepancies.append({
+                    'type': 'meal_calories',
+                    'meal': meal_name,
+                    'expected': meal['claimed_calories'],
+                    'actual': int(round(totals['calories'])),
+                    'message': f"{meal_name.capitalize()} claims {meal['claimed_calories']} calories, "
+                               f"portions add up to {int(round(totals['calories']))}"
+                })
+            for macro, claimed in (meal['claimed_macros'] or {}).items():
+                if _off_by(totals[macro], claimed, self.tolerance) and abs(totals[macro] - claimed) >= 5:
+                    discrepancies.append({
+                        'type': 'meal_macro',
+                        'meal': meal_name,
+                        'macro': macro,
+                        'expected': claimed,
+                        'actual': round(totals[macro], 1),
+                        'message': f"{meal_name.capitalize()} claims {claimed:g}g {macro}, portions give {totals[macro]:.0f}g"
+                    })
+
+        all_complete = bool(computed_meals) and all(meal['complete'] for meal in computed_meals.values())
+        computed_total = sum(meal['computed_calories'] for meal in computed_meals.values())
+        if all_complete and _off_by(computed_total, daily_calories, self.tolerance):
+            discrepancies.append({
+                'type': 'computed_total_calories',
+                'expected': daily_calories,
+                'actual': computed_total,
+                'message': f"Portions add up to {computed_total} calories, target is {daily_calories}"
+            })
+
+        if not meals:
+            status = 'unparsed'
+        elif all_complete:
+            status = 'verified'
+        else:
+            status = 'partial'
+
+        return {
+            'status': status,
+            'mode': mode,
+            'meals': computed_meals,
+            'computed_total_calories': computed_total if all_complete else None,
+            'claimed_total_calories': claimed_total,
+            'target_calories': daily_calories,
+            'discrepancies': discrepancies,
+            'unresolved_foods': sorted(unresolved),
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 2)
+        }
@@ -0,0 +1,4 @@
+"""
+Performance tooling for Halo Health Eats: local stand-ins for the external
+APIs, shared fixtures and the load-test driver.
+"""
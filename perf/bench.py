@@ -0,0 +1,135 @@
+"""
+Micro-benchmarks for the pure-Python work done on every request.
+
+Each benchmark is timed with timeit (best of several repeats, per-call time)
+and the results are appended to perf/results/bench_history.jsonl. A run is
+compared against the previous run, or against a specific commit with
+--against, and any benchmark slower by more than --tolerance is reported.
+
+Usage:
+    python -m perf.bench
+    python -m perf.bench --filter pdf --against 1e72da3 --fail-on-regression
+"""
+import argparse
+import os
+import sys
+import timeit
+
+# Keep the planner offline: without a USDA key no nutrition DB or API self-test is set up at import
+os.environ['USDA_API_KEY'] = ''
+
+from app import IntelligentDietPlanner, response_cache_entry, response_cache_seeds  # noqa: E402
+from plan_codec import CompressedPlanCache  # noqa: E402
+from prompts import build_intelligent_diet_prompt, validate_response_format  # noqa: E402
+from perf.fixtures import make_plan_text  # noqa: E402
+from perf.history import compare_metrics, find_previous, record_run  # noqa: E402
+
+SUITE = 'hot_paths'
+
+MANY_MEDICATIONS = ', '.join([
+    'Metformine 500mg', 'lisiniprol 10mg', 'atorvastatin 20mg', 'levothyroxine 50mcg', 'warfarin 5mg',
+    'amlodipine 5mg', 'aspirin 81mg', 'omeprazole 20mg', 'sertraline 50mg', 'gabapentin 300mg',
+    'furosemide 40mg', 'metoprolol 25mg', 'insulin glargine', 'vitamin d3', 'calcium carbonate'
+])
+
+FORM_DATA = {
+    'height': '172', 'weight': '88', 'age': '54', 'gender': 'male', 'budget': '250',
+    'diagnosis': 'Diabetis type 2 with hypertenion and high bp',
+    'preexisting': 'hart disease, thyroids',
+    'medicines': MANY_MEDICATIONS,
+    'allergies': 'Shelfish, glutten, lactos intolerant',
+    'additional-health': 'Occasional migraines, previous knee surgery',
+    'diet-type': 'vegetarian', 'diet-goal': 'lose_fat', 'exercise': 'light',
+    'food-preference': 'home_based', 'cuisines': ['indian', 'mediterranean', 'mexican'],
+    'fasting': 'intermittent', 'fasting-details': '16:8, eating window 10am-6pm'
+}
+
+LONG_PLAN = make_plan_text(1850, padding_paragraphs=120)
+SHORT_PLAN = make_plan_text(1850)
+
+
+def build_benchmarks(planner):
+    """Benchmark name -> zero-argument callable"""
+    mapped = planner.map_frontend_data(FORM_DATA)
+    result = {
+        'bmr': 1720, 'bmi': 29.7, 'bmi_category': 'Overweight', 'daily_calories': 1850,
+        'diet_plan': LONG_PLAN
+    }
+    cache = CompressedPlanCache(response_cache_seeds(), train_samples=0)
+    cache_entry = response_cache_entry({**result, 'diet_plan': SHORT_PLAN})
+    cache['plan'] = cache_entry
+
+    return {
+        'calculate_bmr': lambda: planner.calculate_bmr('54', '88', '172', 'male'),
+        'calculate_bmi': lambda: planner.calculate_bmi('88', '172'),
+        'calculate_daily_calories': lambda: planner.calculate_daily_calories(1720.5, 'light', 'lose_fat', 0.85),
+        'get_cache_key': lambda: planner.get_cache_key(mapped),
+        'map_frontend_data': lambda: planner.map_frontend_data(FORM_DATA),
+        'preprocess_medical_text': lambda: planner.preprocess_medical_text(MANY_MEDICATIONS),
+        'build_intelligent_diet_prompt': lambda: build_intelligent_diet_prompt(mapped, 1850),
+        'validate_response_format.short': lambda: validate_response_format(SHORT_PLAN),
+        'validate_response_format.long': lambda: validate_response_format(LONG_PLAN),
+        'clean_text_for_pdf.long': lambda: planner.clean_text_for_pdf(LONG_PLAN),
+        'extract_section_text.long': lambda: planner.extract_section_text(
+            LONG_PLAN, '🍽️ DAILY MEAL PLAN', '🚫 FOODS TO STRICTLY AVOID:'
+        ),
+        'generate_pdf_diet_plan.long': lambda: planner.generate_pdf_diet_plan(FORM_DATA, result),
+        'response_cache.get': lambda: cache.get('plan'),
+        'response_cache.set': lambda: cache.__setitem__('plan', cache_entry),
+    }
+
+
+def time_benchmark(func, repeat, min_time):
+    """Best per-call time in microseconds over `repeat` runs of an auto-sized loop"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = timer.repeat(repeat=repeat, number=number)
+    return min(runs) / number * 1e6
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for request hot paths')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timing run')
+    parser.add_argument('--against', default=None, help='compare against the last run recorded for this commit')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--no-record', action='store_true')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    planner = IntelligentDietPlanner()
+    benchmarks = {name: func for name, func in build_benchmarks(planner).items() if args.filter in name}
+
+    metrics = {}
+    for name, func in benchmarks.items():
+        metrics[f'{name}.us'] = round(time_benchmark(func, args.repeat, args.min_time), 3)
+        print(f"  {name:34s} {metrics[f'{name}.us']:12.3f} µs/call")
+
+    config_key = f"{SUITE}|python={sys.version_info.major}.{sys.version_info.minor}|filter={args.filter}"
+    previous = find_previous('bench', config_key, commit=args.against)
+    regressions = []
+    if previous:
+        regressions = compare_metrics(previous['metrics'], metrics, args.tolerance)
+        print(f"\nCompared with {previous['commit']} ({previous['recorded_at']}):")
+        for regression in regressions:
+            print(f"  ❌ {regression}")
+        if not regressions:
+            print("  ✅ No regressions")
+    elif args.against:
+        print(f"\n⚠️ No recorded run found for commit {args.against}")
+
+    if not args.no_record:
+        record_run('bench', config_key, {'suite': SUITE, 'filter': args.filter, 'repeat': args.repeat}, metrics)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+Local stand-ins for the three external services the app depends on:
+
+- Groq chat completions   (POST /openai/v1/chat/completions)
+- USDA FoodData Central   (GET /fdc/v1/foods/search, GET /fdc/v1/food/<fdcId>)
+- RxNav / RxNorm          (GET /REST/rxcui.json, GET /REST/approximateTerm.json,
+                           GET /REST/rxcui/<rxcui>/properties.json,
+                           GET /REST/interaction/interaction.json, GET /REST/interaction/list.json)
+
+Each service runs on its own ThreadingHTTPServer with a configurable latency
+and error profile so capacity can be measured without touching the real APIs.
+
+Usage:
+    python -m perf.fakes --profile realistic
+
+then point the app at them:
+    GROQ_BASE_URL=http://127.0.0.1:18001
+    USDA_API_BASE=http://127.0.0.1:18002/fdc/v1
+    RXNORM_API_BASE=http://127.0.0.1:18003/REST
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from perf.fixtures import make_plan_text
+
+
+# latency_ms: median latency, jitter: lognormal sigma, error_rate: fraction of 5xx/429 responses,
+# hang_rate: fraction of requests that stall for HANG_SECONDS (to exercise client timeouts)
+PROFILES = {
+    'fast': {
+        'groq': {'latency_ms': 20, 'jitter': 0.1, 'tokens_per_second': 20000, 'error_rate': 0.0, 'hang_rate': 0.0},
+        'usda': {'latency_ms': 5, 'jitter': 0.1, 'error_rate': 0.0, 'hang_rate': 0.0},
+        'rxnorm': {'latency_ms': 5, 'jitter': 0.1, 'error_rate': 0.0, 'hang_rate': 0.0},
+    },
+    'realistic': {
+        'groq': {'latency_ms': 350, 'jitter': 0.35, 'tokens_per_second': 280, 'error_rate': 0.01, 'hang_rate': 0.0},
+        'usda': {'latency_ms': 250, 'jitter': 0.4, 'error_rate': 0.01, 'hang_rate': 0.0},
+        'rxnorm': {'latency_ms': 180, 'jitter': 0.4, 'error_rate': 0.01, 'hang_rate': 0.0},
+    },
+    'degraded': {
+        'groq': {'latency_ms': 1500, 'jitter': 0.6, 'tokens_per_second': 120, 'error_rate': 0.08, 'hang_rate': 0.01},
+        'usda': {'latency_ms': 1800, 'jitter': 0.7, 'error_rate': 0.1, 'hang_rate': 0.03},
+        'rxnorm': {'latency_ms': 1200, 'jitter': 0.7, 'error_rate': 0.1, 'hang_rate': 0.03},
+    },
+}
+
+DEFAULT_PORTS = {'groq': 18001, 'usda': 18002, 'rxnorm': 18003}
+HANG_SECONDS = 20
+
+# Small models on Groq generate several times faster than the 70B ones
+FAST_MODEL_MARKERS = ('8b', 'instant')
+
+FAKE_RXCUIS = {
+    'metformin': '6809',
+    'lisinopril': '29046',
+    'atorvastatin': '83367',
+    'levothyroxine': '10582',
+    'warfarin': '11289',
+    'amlodipine': '17767',
+    'aspirin': '1191',
+}
+
+# Drug-drug interactions reported by the fake interaction/list.json, per unordered RxCUI pair
+FAKE_DRUG_INTERACTIONS = {
+    frozenset(('11289', '1191')): ('high', 'Aspirin may increase the anticoagulant activities of warfarin, '
+                                           'raising the risk of bleeding.'),
+    frozenset(('11289', '83367')): ('N/A', 'Atorvastatin may increase the anticoagulant activities of warfarin.'),
+    frozenset(('17767', '83367')): ('N/A', 'Amlodipine may increase the serum concentration of atorvastatin.'),
+    frozenset(('29046', '1191')): ('N/A', 'Aspirin may decrease the antihypertensive activities of lisinopril.'),
+    frozenset(('10582', '11289')): ('N/A', 'Levothyroxine may increase the anticoagulant activities of warfarin.'),
+}
+FAKE_DRUG_NAMES = {rxcui: drug for drug, rxcui in FAKE_RXCUIS.items()}
+
+
+class FakeServiceStats:
+    """Thread-safe per-path request counters exposed at /__stats"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """Base handler: applies the latency/error profile, then dispatches to route()"""
+
+    service = None
+    profile = None
+    stats = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stats':
+            return self._send_json(200, self.stats.snapshot())
+
+        body = None
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            raw = self.rfile.read(length) if length else b''
+            body = json.loads(raw) if raw else {}
+
+        route_key = re.sub(r'/\d+$', '/{id}', parsed.path)
+        self.stats.record(f"{method} {route_key}")
+
+        if random.random() < self.profile.get('hang_rate', 0):
+            time.sleep(HANG_SECONDS)
+
+        time.sleep(self._sample_latency())
+
+        if random.random() < self.profile.get('error_rate', 0):
+            return self._send_error_response()
+
+        status, payload = self.route(method, parsed.path, parse_qs(parsed.query), body)
+        self._send_json(status, payload)
+
+    def _sample_latency(self):
+        median = self.profile.get('latency_ms', 0) / 1000.0
+        jitter = self.profile.get('jitter', 0)
+        return median * random.lognormvariate(0, jitter) if jitter else median
+
+    def _send_error_response(self):
+        if self.service == 'groq':
+            self.send_response(429)
+            payload = json.dumps({'error': {'message': 'Rate limit reached', 'type': 'tokens'}}).encode()
+            self.send_header('Retry-After', '1')
+        else:
+            self.send_response(503)
+            payload = json.dumps({'error': 'Service temporarily unavailable'}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self, method, path, query, body):
+        return 404, {'error': f'No route for {method} {path}'}
+
+
+def _only_sections(plan_text, markers):
+    """Keep the top-level plan sections (emoji headers) whose header contains one of the markers"""
+    blocks = re.split(r'\n(?=\*\*[^\w*\s])', plan_text)
+    return '\n'.join(block for block in blocks if any(marker in block.split('\n', 1)[0] for marker in markers))
+
+
+class FakeGroqHandler(FakeServiceHandler):
+    service = 'groq'
+
+    def route(self, method, path, query, body):
+        if method != 'POST' or not path.endswith('/chat/completions'):
+            return super().route(method, path, query, body)
+
+        prompt = ' '.join(m.get('content', '') for m in body.get('messages', []))
+        calories = 2000
+        for token in prompt.split('TARGET DAILY CALORIES:')[1:2]:
+            digits = ''.join(ch for ch in token[:12] if ch.isdigit())
+            calories = int(digits) if digits else calories
+
+        content = make_plan_text(calories)
+        # Section regeneration prompts ask for a subset of the plan; answer with just those sections
+        rewrite = re.search(r'SECTIONS TO (?:RE)?WRITE[^:*]*:\*\*\s*(.+)', prompt)
+        if rewrite:
+            content = _only_sections(content, [m.strip() for m in rewrite.group(1).split(',')])
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = min(len(content) // 4, body.get('max_tokens') or 4096)
+
+        tokens_per_second = self.profile.get('tokens_per_second', 0)
+        if tokens_per_second:
+            model = body.get('model', '')
+            if any(marker in model for marker in FAST_MODEL_MARKERS):
+                tokens_per_second *= 3
+            time.sleep(completion_tokens / tokens_per_second)
+
+        return 200, {
+            'id': 'chatcmpl-' + hashlib.md5(prompt.encode()).hexdigest()[:12],
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+
+class FakeUSDAHandler(FakeServiceHandler):
+    service = 'usda'
+
+    def route(self, method, path, query, body):
+        if path.endswith('/foods/search'):
+            food = query.get('query', [''])[0]
+            fdc_id = int(hashlib.md5(food.lower().encode()).hexdigest()[:6], 16)
+            return 200, {'foods': [{'fdcId': fdc_id, 'description': food.title()}]}
+
+        if '/food/' in path:
+            fdc_id = int(path.rsplit('/', 1)[1])
+            rng = random.Random(fdc_id)
+            nutrients = [
+                ('Energy', 'KCAL', rng.uniform(20, 600)),
+                ('Protein', 'G', rng.uniform(0, 30)),
+                ('Carbohydrate, by difference', 'G', rng.uniform(0, 80)),
+                ('Total lipid (fat)', 'G', rng.uniform(0, 40)),
+                ('Fiber, total dietary', 'G', rng.uniform(0, 12)),
+                ('Sodium, Na', 'MG', rng.uniform(0, 900)),
+                ('Potassium, K', 'MG', rng.uniform(0, 900)),
+                ('Vitamin C, total ascorbic acid', 'MG', rng.uniform(0, 60)),
+                ('Calcium, Ca', 'MG', rng.uniform(0, 300)),
+                ('Iron, Fe', 'MG', rng.uniform(0, 8)),
+            ]
+            return 200, {
+                'fdcId': fdc_id,
+                'description': f'Food {fdc_id}',
+                'foodNutrients': [
+                    {'nutrient': {'name': name, 'unitName': unit}, 'amount': amount}
+                    for name, unit, amount in nutrients
+                ]
+            }
+
+        return super().route(method, path, query, body)
+
+
+class FakeRxNormHandler(FakeServiceHandler):
+    service = 'rxnorm'
+
+    def route(self, method, path, query, body):
+        if path.endswith('/rxcui.json'):
+            # Like the real API, only the drug's own name matches; "metformin 500mg" or "metformine" do not
+            name = ' '.join(query.get('name', [''])[0].lower().split())
+            ids = [FAKE_RXCUIS[name]] if name in FAKE_RXCUIS else []
+            return 200, {'idGroup': {'name': name, 'rxnormId': ids}}
+
+        if path.endswith('/approximateTerm.json'):
+            term = query.get('term', [''])[0].lower()
+            max_entries = int(query.get('maxEntries', ['20'])[0])
+            scored = sorted(((difflib.SequenceMatcher(None, term, drug).ratio(), drug) for drug in FAKE_RXCUIS),
+                            reverse=True)
+            candidates = [{'rxcui': FAKE_RXCUIS[drug], 'rxaui': '', 'score': str(round(ratio * 100, 2)),
+                           'rank': str(rank), 'name': drug, 'source': 'RXNORM'}
+                          for rank, (ratio, drug) in enumerate(scored, 1) if ratio >= 0.6][:max_entries]
+            group = {'inputTerm': term, 'comment': ''}
+            if candidates:
+                group['candidate'] = candidates
+            return 200, {'approximateGroup': group}
+
+        if path.endswith('/properties.json'):
+            rxcui = path.split('/')[-2]
+            if rxcui not in FAKE_DRUG_NAMES:
+                return 200, {}
+            return 200, {'properties': {'rxcui': rxcui, 'name': FAKE_DRUG_NAMES[rxcui], 'tty': 'IN'}}
+
+        if path.endswith('/interaction/interaction.json'):
+            rxcui = query.get('rxcui', [''])[0]
+            return 200, {
+                'nlmDisclaimer': 'Fake RxNav data for load testing',
+                'interactionTypeGroup': [{
+                    'sourceConceptGroup': [{
+                        'conceptInteraction': [
+                            {'description': f'Take {rxcui} with a meal to reduce stomach upset', 'severity': 'N/A'},
+                            {'description': 'Separate doses by 4 hours from mineral supplements', 'severity': 'N/A'},
+                        ]
+                    }]
+                }]
+            }
+
+        if path.endswith('/interaction/list.json'):
+            # rxcuis arrives space-separated ('+' in the URL), like the real API
+            rxcuis = ' '.join(query.get('rxcuis', [''])).split()
+            interaction_types = []
+            for i, rxcui_a in enumerate(rxcuis):
+                for rxcui_b in rxcuis[i + 1:]:
+                    found = FAKE_DRUG_INTERACTIONS.get(frozenset((rxcui_a, rxcui_b)))
+                    if not found:
+                        continue
+                    concepts = [{'rxcui': rxcui, 'name': FAKE_DRUG_NAMES.get(rxcui, rxcui), 'tty': 'IN'}
+                                for rxcui in (rxcui_a, rxcui_b)]
+                    interaction_types.append({
+                        'minConcept': concepts,
+                        'interactionPair': [{
+                            'interactionConcept': [{'minConceptItem': concept} for concept in concepts],
+                            'severity': found[0],
+                            'description': found[1]
+                        }]
+                    })
+            payload = {'nlmDisclaimer': 'Fake RxNav data for load testing', 'userInput': {'rxcuis': rxcuis}}
+            if interaction_types:
+                payload['fullInteractionTypeGroup'] = [{'sourceName': 'DrugBank',
+                                                        'fullInteractionType': interaction_types}]
+            return 200, payload
+
+        return super().route(method, path, query, body)
+
+
+HANDLERS = {
+    'groq': FakeGroqHandler,
+    'usda': FakeUSDAHandler,
+    'rxnorm': FakeRxNormHandler,
+}
+
+BASE_PATHS = {'groq': '', 'usda': '/fdc/v1', 'rxnorm': '/REST'}
+ENV_NAMES = {'groq': 'GROQ_BASE_URL', 'usda': 'USDA_API_BASE', 'rxnorm': 'RXNORM_API_BASE'}
+
+
+def start_fake_services(profile='realistic', host='127.0.0.1', ports=None, overrides=None):
+    """
+    Start all three fake services in background threads.
+    Returns (env, stop) where env maps the app's base-URL variables to the fakes.
+    """
+    ports = {**DEFAULT_PORTS, **(ports or {})}
+    profile_config = json.loads(json.dumps(PROFILES[profile]))
+    for service, values in (overrides or {}).items():
+        profile_config[service].update(values)
+
+    servers = []
+    env = {}
+    for service, handler_base in HANDLERS.items():
+        handler = type(handler_base.__name__, (handler_base,), {
+            'profile': profile_config[service],
+            'stats': FakeServiceStats()
+        })
+        server = ThreadingHTTPServer((host, ports[service]), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        env[ENV_NAMES[service]] = f"http://{host}:{server.server_address[1]}{BASE_PATHS[service]}"
+
+    def stop():
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    return env, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run local fakes for Groq, USDA and RxNav')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='realistic')
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args()
+
+    env, stop = start_fake_services(args.profile, args.host)
+    print(f"✅ Fake services running with '{args.profile}' profile:")
+    for name, value in env.items():
+        print(f"export {name}={value}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop()
+
+
+if __name__ == '__main__':
+    main()
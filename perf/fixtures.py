@@ -0,0 +1,134 @@
+"""
+Realistic request fixtures shared by the load tests and the fake services.
+Profiles mirror what the test.html form posts to /generate_diet.
+"""
+import random
+
+DIAGNOSES = [
+    '', '', '', 'type 2 diabetes', 'hypertension', 'high cholesterol',
+    'hypothyroidism', 'diabetis and high bp', 'PCOS', 'kidney disease stage 2'
+]
+
+MEDICATIONS = [
+    '', '', 'metformin 500mg', 'lisinopril', 'atorvastatin', 'levothyroxine',
+    'metformin, lisinopril', 'warfarin, amlodipine, atorvastatin',
+    'Metformin 500 mg tablet', 'metformine', 'Lisinopril 10mg', 'atorvastatin 20 mg, aspirin 81mg'
+]
+
+ALLERGIES = ['', '', 'peanuts', 'lactose intolerant', 'gluten', 'shellfish, tree nuts']
+
+CUISINES = ['indian', 'mediterranean', 'mexican', 'chinese', 'american', 'italian']
+
+DIET_TYPES = ['vegetarian', 'non-vegetarian', 'vegan', 'eggetarian']
+DIET_GOALS = ['balanced', 'lose_fat', 'gain_muscle']
+EXERCISE_LEVELS = ['sedentary', 'light', 'moderate', 'active', 'very_active']
+
+
+def make_profile(rng=None, unique=True):
+    """Build one form submission; unique=False draws from a small pool so the response cache can hit"""
+    rng = rng or random.Random()
+    if not unique:
+        rng = random.Random(rng.randint(0, 24))
+
+    return {
+        'height': str(rng.randint(150, 195)),
+        'weight': str(rng.randint(45, 130)),
+        'age': str(rng.randint(18, 80)),
+        'gender': rng.choice(['male', 'female']),
+        'budget': str(rng.choice([100, 200, 350])),
+        'diagnosis': rng.choice(DIAGNOSES),
+        'preexisting': rng.choice(['', '', 'asthma', 'migraine']),
+        'medicines': rng.choice(MEDICATIONS),
+        'allergies': rng.choice(ALLERGIES),
+        'additional-health': '',
+        'diet-type': rng.choice(DIET_TYPES),
+        'diet-goal': rng.choice(DIET_GOALS),
+        'exercise': rng.choice(EXERCISE_LEVELS),
+        'food-preference': rng.choice(['home_based', 'restaurant', 'mixed']),
+        'cuisines': rng.sample(CUISINES, 2),
+        'fasting': rng.choice(['none', 'none', 'intermittent']),
+        'fasting-details': ''
+    }
+
+
+def make_plan_text(calories=2000, padding_paragraphs=0):
+    """Diet plan text in the exact section format requested by build_intelligent_diet_prompt"""
+    breakfast = int(calories * 0.3)
+    lunch = int(calories * 0.4)
+    dinner = calories - breakfast - lunch
+    filler = "\n".join(
+        "- Additional clinical note %d: maintain consistent meal timing, favour whole grains, "
+        "legumes and seasonal vegetables, and monitor portion sizes carefully." % i
+        for i in range(padding_paragraphs)
+    )
+
+    return f"""**🔬 CLINICAL ASSESSMENT:**
+
+*Medical Terminology Interpretation:*
+Interpreting 'diabetis' as 'diabetes'.
+
+*Medical Nutrition Analysis:*
+Type 2 diabetes requires consistent carbohydrate distribution and a focus on low glycaemic index foods.
+{filler}
+
+*Drug-Nutrient Considerations:*
+Metformin should be taken with meals to reduce gastrointestinal upset; monitor vitamin B12.
+
+*BMI & Goal Strategy:*
+A moderate calorie deficit supports gradual weight loss of 0.5 kg per week.
+
+*Special Dietary Needs:*
+Vegetarian, peanut-free.
+
+**📊 PERSONALIZED MACRONUTRIENT PLAN:**
+
+- **Protein:** {int(calories * 0.25 / 4)}g (25% of calories) - Preserves lean mass
+- **Carbohydrates:** {int(calories * 0.45 / 4)}g (45% of calories) - Controlled, high-fibre sources
+- **Fats:** {int(calories * 0.30 / 9)}g (30% of calories) - Emphasis on unsaturated fats
+
+**🍽️ DAILY MEAL PLAN ({calories} calories):**
+
+**BREAKFAST ({breakfast} calories):**
+*Meal:* Rolled oats (60g) cooked in low-fat milk (250ml), 1 medium apple (150g), chia seeds (10g)
+*Key Nutrients:* 18g protein, 70g carbs, 10g fats
+*Medical Benefits:* Soluble fibre slows glucose absorption.
+*Timing Notes:* Take metformin with breakfast.
+
+**LUNCH ({lunch} calories):**
+*Meal:* Brown rice (150g cooked), lentil dal (200g), mixed vegetable salad (150g), plain yogurt (100g)
+*Key Nutrients:* 30g protein, 95g carbs, 18g fats
+*Medical Benefits:* Legumes provide protein and fibre with a low glycaemic load.
+*Timing Notes:* Eat at a consistent time each day.
+
+**DINNER ({dinner} calories):**
+*Meal:* Grilled paneer (100g), quinoa (120g cooked), sauteed spinach (150g), olive oil (10ml)
+*Key Nutrients:* 32g protein, 45g carbs, 28g fats
+*Medical Benefits:* Balanced protein and fat support overnight glucose stability.
+*Timing Notes:* Take evening metformin dose with dinner.
+
+**🚫 FOODS TO STRICTLY AVOID:**
+- Sugary beverages and fruit juices
+- Refined white bread and pastries
+- Peanuts and peanut-containing products
+
+**✅ THERAPEUTIC FOODS TO EMPHASIZE:**
+- Leafy greens, legumes, whole grains
+- Cinnamon and fenugreek seeds
+
+**⏰ MEAL TIMING STRATEGY:**
+Three meals spaced 5-6 hours apart, with metformin taken alongside breakfast and dinner.
+
+**💧 HYDRATION PLAN:**
+2.5 litres of water daily; limit sweetened drinks.
+
+**🔄 MONITORING & ADJUSTMENTS:**
+Check fasting glucose weekly; review the plan with your physician in 3 months.
+
+**⚠️ IMPORTANT MEDICAL DISCLAIMERS:**
+- This plan is based on the information provided
+- Consult your healthcare provider before implementing any dietary changes
+- Monitor for any adverse reactions, especially with diabetes
+- Regular follow-up recommended for HbA1c monitoring
+
+═══════════════════════════════════════════════════════════════════════════════════
+"""
@@ -0,0 +1,96 @@
+"""
+Result storage for performance runs.
+
+Every run is appended to perf/results/<kind>_history.jsonl together with the
+git commit it was measured on, so the previous run of the same configuration
+can be compared against and regressions flagged.
+"""
+import json
+import os
+import subprocess
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def current_commit():
+    """Short git commit of the working tree, marked dirty when there are local changes"""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+        dirty = subprocess.call(
+            ['git', 'diff', '--quiet', 'HEAD', '--', '.', ':!perf/results'], stderr=subprocess.DEVNULL
+        ) != 0
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def history_path(kind, results_dir=None):
+    return os.path.join(results_dir or RESULTS_DIR, f"{kind}_history.jsonl")
+
+
+def load_history(kind, results_dir=None):
+    """Load all recorded runs of a kind, oldest first"""
+    path = history_path(kind, results_dir)
+    if not os.path.exists(path):
+        return []
+
+    runs = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                runs.append(json.loads(line))
+    return runs
+
+
+def find_previous(kind, config_key, results_dir=None, commit=None):
+    """Most recent run of the same configuration, optionally pinned to a commit"""
+    for run in reversed(load_history(kind, results_dir)):
+        if run.get('config_key') != config_key:
+            continue
+        if commit and not run.get('commit', '').startswith(commit):
+            continue
+        return run
+    return None
+
+
+def record_run(kind, config_key, config, metrics, results_dir=None):
+    """Append one run to the history file and return the stored record"""
+    results_dir = results_dir or RESULTS_DIR
+    os.makedirs(results_dir, exist_ok=True)
+
+    record = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': current_commit(),
+        'config_key': config_key,
+        'config': config,
+        'metrics': metrics
+    }
+    with open(history_path(kind, results_dir), 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    return record
+
+
+def compare_metrics(previous, current, tolerance, higher_is_better=()):
+    """
+    Compare two flat metric dicts.
+    Returns a list of regression descriptions for metrics that moved the wrong way by more than tolerance.
+    """
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+            continue
+
+        change = (value - old) / old
+        if name in higher_is_better:
+            change = -change
+
+        if change > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {value:.4g} ({change * 100:+.1f}% worse)")
+
+    return regressions
@@ -0,0 +1,317 @@
+"""
+End-to-end load test for /generate_diet and /download_pdf under gunicorn.
+
+The app is started against the local fakes from perf/fakes.py, so every run
+is isolated from the real Groq, USDA and RxNav services. Each combination of
+worker class and worker count is driven for a fixed duration and throughput
+plus latency percentiles are appended to perf/results/loadtest_history.jsonl.
+
+Usage:
+    python -m perf.loadtest --profile realistic --worker-classes sync,gthread --workers 2,4 --duration 30
+    python -m perf.loadtest --config gunicorn.conf.py --worker-classes sync,gthread,gevent --workers 2,4
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from perf.fakes import PROFILES, start_fake_services
+from perf.fixtures import make_profile
+from perf.history import compare_metrics, find_previous, record_run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(worker_class, workers, threads, port, env, config=None):
+    """Start the app under gunicorn (with a config file's hooks and preload if given) and wait for /health"""
+    cmd = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        '--timeout', '120',
+        '--log-level', 'warning',
+    ]
+    # Explicit for every class: gunicorn silently turns sync into gthread when a config sets threads > 1
+    cmd += ['--threads', str(threads if worker_class == 'gthread' else 1)]
+    if worker_class == 'gevent':
+        cmd += ['--worker-connections', str(threads * 25)]
+    if config:
+        # Flags above still win over the config file's worker settings
+        cmd += ['--config', config]
+
+    process = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early: {process.stderr.read().decode()[-2000:]}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.25)
+
+    process.terminate()
+    raise RuntimeError('gunicorn did not become healthy within 60s')
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class LoadDriver:
+    """Closed-loop load generator: each client thread sends its next request as soon as the previous one returns"""
+
+    def __init__(self, base_url, concurrency, duration, pdf_ratio, unique_ratio, seed=0):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.duration = duration
+        self.pdf_ratio = pdf_ratio
+        self.unique_ratio = unique_ratio
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.samples = {'generate_diet': [], 'download_pdf': []}
+        self.errors = {'generate_diet': 0, 'download_pdf': 0}
+        self.last_results = []
+
+    def run(self, warmup=0):
+        if warmup:
+            self._run_phase(warmup, record=False)
+        started = time.perf_counter()
+        self._run_phase(self.duration, record=True)
+        return time.perf_counter() - started
+
+    def _run_phase(self, seconds, record):
+        stop_at = time.perf_counter() + seconds
+        threads = [
+            threading.Thread(target=self._client_loop, args=(stop_at, record, random.Random(self.seed + i)))
+            for i in range(self.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _client_loop(self, stop_at, record, rng):
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            with self.lock:
+                have_result = bool(self.last_results)
+
+            if have_result and rng.random() < self.pdf_ratio:
+                endpoint, ok, elapsed = self._download_pdf(session, rng)
+            else:
+                endpoint, ok, elapsed = self._generate_diet(session, rng)
+
+            if record:
+                with self.lock:
+                    self.samples[endpoint].append(elapsed)
+                    if not ok:
+                        self.errors[endpoint] += 1
+
+    def _generate_diet(self, session, rng):
+        profile = make_profile(rng, unique=rng.random() < self.unique_ratio)
+        started = time.perf_counter()
+        try:
+            response = session.post(f'{self.base_url}/generate_diet', json=profile, timeout=120)
+            body = response.json()
+            ok = response.ok and body.get('success', False)
+        except (requests.RequestException, ValueError):
+            ok, body = False, None
+        elapsed = time.perf_counter() - started
+
+        if ok:
+            with self.lock:
+                self.last_results.append((profile, body))
+                del self.last_results[:-20]
+
+        return 'generate_diet', ok, elapsed
+
+    def _download_pdf(self, session, rng):
+        with self.lock:
+            profile, result = rng.choice(self.last_results)
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                f'{self.base_url}/download_pdf', json={'user_data': profile, 'result': result}, timeout=120
+            )
+            ok = response.ok and response.headers.get('Content-Type') == 'application/pdf'
+        except requests.RequestException:
+            ok = False
+        return 'download_pdf', ok, time.perf_counter() - started
+
+    def summary(self, wall_time):
+        metrics = {}
+        for endpoint, samples in self.samples.items():
+            values = sorted(samples)
+            metrics[f'{endpoint}.requests'] = len(values)
+            metrics[f'{endpoint}.errors'] = self.errors[endpoint]
+            metrics[f'{endpoint}.throughput_rps'] = round(len(values) / wall_time, 3) if wall_time else 0
+            for pct in (50, 90, 95, 99):
+                metrics[f'{endpoint}.p{pct}_ms'] = round(percentile(values, pct) * 1000, 1)
+            metrics[f'{endpoint}.max_ms'] = round(values[-1] * 1000, 1) if values else 0
+        return metrics
+
+
+def fetch_upstream_stats(fake_env):
+    """Cumulative request counts seen by each fake service"""
+    stats = {}
+    for name, base in fake_env.items():
+        root = base.split('/fdc/v1')[0].split('/REST')[0]
+        try:
+            stats[name] = requests.get(f'{root}/__stats', timeout=2).json()
+        except requests.RequestException:
+            stats[name] = {}
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the diet planner under gunicorn against local fakes')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='realistic')
+    parser.add_argument('--worker-classes', default='sync,gthread')
+    parser.add_argument('--workers', default='2,4')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--config', help='gunicorn config file to start with (e.g. gunicorn.conf.py)')
+    parser.add_argument('--no-llm-limits', action='store_true',
+                        help="lift the app's Groq request/token rate limits so worker classes are compared on "
+                             "serving capacity rather than on the scheduler's per-worker throttle")
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--pdf-ratio', type=float, default=0.2, help='fraction of requests that download a PDF')
+    parser.add_argument('--unique-ratio', type=float, default=0.8,
+                        help='fraction of profiles that are unique (the rest can hit the response cache)')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='relative change treated as a regression')
+    parser.add_argument('--no-record', action='store_true', help='do not append results to the history file')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fake_env, stop_fakes = start_fake_services(
+        args.profile, ports={'groq': free_port(), 'usda': free_port(), 'rxnorm': free_port()}
+    )
+
+    regressions_found = False
+    try:
+        for worker_class in [c.strip() for c in args.worker_classes.split(',') if c.strip()]:
+            for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+                with tempfile.TemporaryDirectory() as tmp:
+                    env = {
+                        **os.environ,
+                        **fake_env,
+                        'GROQ_API_KEY': 'loadtest',
+                        'USDA_API_KEY': 'loadtest',
+                        'NUTRITION_CACHE_DB': os.path.join(tmp, 'nutrition_cache.db'),
+                        'BATCH_PROGRESS_DB': os.path.join(tmp, 'batch_progress.db'),
+                        'PLAN_STORE_DB': os.path.join(tmp, 'plan_store.db'),
+                        # Without --config nothing else tells the schedulers how many workers share the limits
+                        'GROQ_WORKER_COUNT': str(workers),
+                    }
+                    if args.no_llm_limits:
+                        env.update({'GROQ_RPM': '100000', 'GROQ_TPM': '100000000'})
+                    port = free_port()
+                    upstream_before = fetch_upstream_stats(fake_env)
+                    print(f"\n🚀 {worker_class} x{workers} ({args.profile} profile, {args.concurrency} clients)")
+
+                    try:
+                        process = start_gunicorn(worker_class, workers, args.threads, port, env, args.config)
+                    except RuntimeError as e:
+                        print(f"⚠️ Skipping {worker_class} x{workers}: {e}")
+                        continue
+
+                    try:
+                        driver = LoadDriver(
+                            f'http://127.0.0.1:{port}', args.concurrency, args.duration,
+                            args.pdf_ratio, args.unique_ratio
+                        )
+                        wall_time = driver.run(args.warmup)
+                        metrics = driver.summary(wall_time)
+                        upstream_after = fetch_upstream_stats(fake_env)
+                    finally:
+                        stop_gunicorn(process)
+
+                config = {
+                    'profile': args.profile,
+                    'worker_class': worker_class,
+                    'workers': workers,
+                    'threads': args.threads if worker_class == 'gthread' else 1,
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'pdf_ratio': args.pdf_ratio,
+                    'unique_ratio': args.unique_ratio
+                }
+                if args.config:
+                    config['config'] = os.path.basename(args.config)
+                if args.no_llm_limits:
+                    config['llm_limits'] = False
+                config_key = '|'.join(f"{k}={config[k]}" for k in sorted(config) if k != 'duration')
+
+                for endpoint in ('generate_diet', 'download_pdf'):
+                    print(
+                        f"  {endpoint:14s} {metrics[f'{endpoint}.throughput_rps']:7.2f} req/s  "
+                        f"p50 {metrics[f'{endpoint}.p50_ms']:8.1f} ms  "
+                        f"p95 {metrics[f'{endpoint}.p95_ms']:8.1f} ms  "
+                        f"p99 {metrics[f'{endpoint}.p99_ms']:8.1f} ms  "
+                        f"errors {metrics[f'{endpoint}.errors']}"
+                    )
+
+                previous = find_previous('loadtest', config_key)
+                if previous:
+                    regressions = compare_metrics(
+                        previous['metrics'],
+                        {k: v for k, v in metrics.items() if k.endswith(('_ms', '_rps'))},
+                        args.tolerance,
+                        higher_is_better={k for k in metrics if k.endswith('_rps')}
+                    )
+                    for regression in regressions:
+                        print(f"  ❌ Regression vs {previous['commit']}: {regression}")
+                    regressions_found = regressions_found or bool(regressions)
+
+                if not args.no_record:
+                    # Upstream calls made during this configuration only (includes warmup)
+                    metrics['upstream_requests'] = {
+                        service: {
+                            route: count - upstream_before.get(service, {}).get(route, 0)
+                            for route, count in counts.items()
+                        }
+                        for service, counts in upstream_after.items()
+                    }
+                    record_run('loadtest', config_key, config, metrics)
+    finally:
+        stop_fakes()
+
+    if regressions_found and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
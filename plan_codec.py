@@ -0,0 +1,233 @@
+"""
+Dictionary-compressed in-memory cache for generated plans.
+
+Cached plans are 8-12 KB of text that mostly repeat the same section headers,
+field labels and disclaimers, which per-entry compression cannot exploit on its
+own. A compression dictionary trained on sample plans carries that shared
+structure, so each entry only stores what is specific to it.
+
+zstandard's dictionary trainer is used when the package is installed; without
+it the cache uses zlib with a preset dictionary (zdict) built from the text
+segments the samples have in common. The dictionary is seeded at startup (from
+recently stored plans, or the output format scaffolding) and retrained once on
+the first PLAN_DICT_TRAIN_SAMPLES plans this worker caches.
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+# zstandard is optional; zlib (with a preset dictionary) is used without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# zlib only looks back 32 KB, so a larger zdict would not be used
+PLAN_DICT_BYTES = int(os.environ.get('PLAN_DICT_BYTES', 32 * 1024))
+PLAN_DICT_TRAIN_SAMPLES = int(os.environ.get('PLAN_DICT_TRAIN_SAMPLES', 200))
+PLAN_COMPRESSION_LEVEL = int(os.environ.get('PLAN_COMPRESSION_LEVEL', 6))
+# zstandard's trainer needs a reasonable number of samples; fewer use the segment dictionary
+ZSTD_MIN_TRAIN_SAMPLES = 20
+
+# Split serialized plans after each newline, literal or JSON-escaped
+SEGMENT_BOUNDARY = re.compile(rb'(?<=\\n)|(?<=\n)')
+
+
+def serialize(value):
+    return json.dumps(value, ensure_ascii=False).encode()
+
+
+def train_dictionary(samples, size=None):
+    """Compression dictionary (bytes) from sample serialized plans"""
+    size = size or PLAN_DICT_BYTES
+    samples = [sample for sample in samples if sample]
+    if not samples:
+        return b''
+    if zstandard and len(samples) >= ZSTD_MIN_TRAIN_SAMPLES:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as e:
+            print(f"⚠️ zstd dictionary training failed, using segment dictionary: {e}")
+
+    # Segments shared by several samples; with a single sample (the format scaffolding) keep everything
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(segment for segment in SEGMENT_BOUNDARY.split(sample) if len(segment) > 3))
+    min_count = 2 if len(samples) > 1 else 1
+    common = sorted((segment for segment, n in counts.items() if n >= min_count),
+                    key=lambda segment: (counts[segment] * len(segment), segment), reverse=True)
+
+    chosen, used = [], 0
+    for segment in common:
+        if used + len(segment) > size:
+            continue
+        chosen.append(segment)
+        used += len(segment)
+    # The most valuable segments go last, where matches are cheapest to reference
+    return b''.join(reversed(chosen))
+
+
+class PlanCodec:
+    """Compress/decompress with a fixed dictionary (zstd when available, else zlib)"""
+
+    def __init__(self, dictionary=b'', level=None):
+        self.dictionary = dictionary or b''
+        self.level = PLAN_COMPRESSION_LEVEL if level is None else level
+        self.name = 'zstd' if zstandard else 'zlib'
+        if zstandard:
+            self.zstd_dict = zstandard.ZstdCompressionDict(self.dictionary) if self.dictionary else None
+            if self.zstd_dict is not None:
+                self.zstd_dict.precompute_compress(level=self.level)
+            # zstd (de)compressor objects must not be shared between threads
+            self.local = threading.local()
+
+    def _zstd(self):
+        if not hasattr(self.local, 'compressor'):
+            self.local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.zstd_dict)
+            self.local.decompressor = zstandard.ZstdDecompressor(dict_data=self.zstd_dict)
+        return self.local.compressor, self.local.decompressor
+
+    def compress(self, data):
+        if zstandard:
+            return self._zstd()[0].compress(data)
+        if self.dictionary:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY,
+                                          zdict=self.dictionary)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        if zstandard:
+            return self._zstd()[1].decompress(data)
+        if self.dictionary:
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class CompressedPlanCache:
+    """Dict-like cache storing each value as dictionary-compressed JSON; values are decoded on every read"""
+
+    def __init__(self, seed_samples=(), train_samples=None):
+        self.train_samples = PLAN_DICT_TRAIN_SAMPLES if train_samples is None else train_samples
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (compressed bytes, serialized size)
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.samples = []
+        self.retrained = False
+        self.codec = PlanCodec(train_dictionary(list(seed_samples)))
+        self.seeded_from = len(seed_samples)
+        self.stats = {'hits': 0, 'misses': 0, 'encodes': 0, 'decode_seconds': 0.0, 'encode_seconds': 0.0}
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            codec = self.codec
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+        started = time.perf_counter()
+        value = json.loads(codec.decompress(entry[0]))
+        with self.lock:
+            self.stats['hits'] += 1
+            self.stats['decode_seconds'] += time.perf_counter() - started
+        return value
+
+    def __setitem__(self, key, value):
+        raw = serialize(value)
+        with self.lock:
+            codec = self.codec
+        started = time.perf_counter()
+        compressed = codec.compress(raw)
+        elapsed = time.perf_counter() - started
+
+        retrain = False
+        with self.lock:
+            if codec is not self.codec:
+                # Retrained meanwhile; this entry has to use the new dictionary
+                compressed = self.codec.compress(raw)
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.raw_bytes -= old[1]
+                self.stored_bytes -= len(old[0])
+            self.entries[key] = (compressed, len(raw))
+            self.raw_bytes += len(raw)
+            self.stored_bytes += len(compressed)
+            self.stats['encodes'] += 1
+            self.stats['encode_seconds'] += elapsed
+            if not self.retrained and self.train_samples:
+                self.samples.append(raw)
+                retrain = len(self.samples) >= self.train_samples
+        if retrain:
+            threading.Thread(target=self.retrain, name='plan-dict-retrain', daemon=True).start()
+
+    def retrain(self):
+        """Train a dictionary on the plans cached so far and re-encode every entry with it.
+        Training and re-encoding run outside the lock; only entries written meanwhile are redone under it."""
+        with self.lock:
+            if not self.samples:
+                return
+            samples, self.samples = self.samples, []
+            self.retrained = True
+            old_codec = self.codec
+            snapshot = dict(self.entries)
+        started = time.perf_counter()
+        codec = PlanCodec(train_dictionary(samples))
+        recoded = {key: (codec.compress(old_codec.decompress(compressed)), size)
+                   for key, (compressed, size) in snapshot.items()}
+
+        with self.lock:
+            for key, entry in self.entries.items():
+                if snapshot.get(key) is not entry:
+                    recoded[key] = (codec.compress(old_codec.decompress(entry[0])), entry[1])
+            self.entries = {key: recoded[key] for key in self.entries}
+            self.codec = codec
+            stored_before, self.stored_bytes = self.stored_bytes, sum(len(c) for c, _ in self.entries.values())
+            stored = self.stored_bytes
+        print(f"🗜️ Plan cache dictionary retrained on {len(samples)} plans "
+              f"({stored_before} -> {stored} bytes, {(time.perf_counter() - started) * 1000:.0f}ms)")
+
+    def get_stats(self):
+        with self.lock:
+            entries = len(self.entries)
+            raw, stored = self.raw_bytes, self.stored_bytes
+            dictionary = len(self.codec.dictionary)
+            stats = dict(self.stats)
+        saved = raw - stored - dictionary
+        return {
+            'entries': entries,
+            'codec': self.codec.name,
+            'dictionary_bytes': dictionary,
+            'dictionary_trained_on': 'cached_plans' if self.retrained else f'{self.seeded_from}_seed_samples',
+            'raw_bytes': raw,
+            'stored_bytes': stored,
+            'saved_bytes': saved,
+            'compression_ratio': round(raw / stored, 2) if stored else None,
+            'plans_per_mb': round(entries / (stored + dictionary) * 1024 * 1024) if entries else None,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'avg_decode_ms': round(stats['decode_seconds'] / stats['hits'] * 1000, 3) if stats['hits'] else None,
+            'avg_encode_ms': round(stats['encode_seconds'] / stats['encodes'] * 1000, 3) if stats['encodes'] else None
+        }
@@ -0,0 +1,154 @@
+"""
+Section-level caching for generated plans.
+
+Each section of a plan depends on a subset of the profile fields (see
+SECTION_DEPENDENCIES), so when a user edits e.g. their budget or cuisines the
+clinical assessment and drug-nutrient sections can be reused and only the
+affected sections are sent back to the LLM.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from prompts import SECTION_NAMES, SECTION_MARKERS
+
+
+SECTION_REGEN_ENABLED = os.environ.get('SECTION_REGEN_ENABLED', 'true').lower() == 'true'
+SECTION_CACHE_MAX_ENTRIES = int(os.environ.get('SECTION_CACHE_MAX_ENTRIES', 20000))
+
+MEDICAL_FIELDS = ('diagnosis', 'preexisting', 'medicines', 'allergies', 'additional-health')
+# Inputs to the calorie target, which several sections quote
+BODY_FIELDS = ('height', 'weight', 'age', 'gender', 'exercise', 'diet-goal')
+PREFERENCE_FIELDS = ('budget', 'cuisines', 'food-preference')
+FASTING_FIELDS = ('fasting', 'fasting-details')
+
+# Profile fields each section is written from; a section is reused only if all of them are unchanged
+SECTION_DEPENDENCIES = {
+    'clinical_assessment': MEDICAL_FIELDS + BODY_FIELDS + ('diet-type',),
+    'macronutrients': MEDICAL_FIELDS + BODY_FIELDS + ('diet-type',),
+    'meal_plan': MEDICAL_FIELDS + BODY_FIELDS + ('diet-type',) + PREFERENCE_FIELDS + FASTING_FIELDS,
+    'foods_to_avoid': MEDICAL_FIELDS + ('diet-type',),
+    'therapeutic_foods': MEDICAL_FIELDS + ('diet-type',) + PREFERENCE_FIELDS,
+    'meal_timing': MEDICAL_FIELDS + ('exercise',) + FASTING_FIELDS,
+    'hydration': MEDICAL_FIELDS + BODY_FIELDS,
+    'monitoring': MEDICAL_FIELDS + ('diet-goal',),
+    'disclaimers': MEDICAL_FIELDS,
+}
+
+# Output tokens to allow per regenerated section (the full plan gets 2500)
+SECTION_TOKEN_BUDGET = {
+    'clinical_assessment': 600,
+    'macronutrients': 250,
+    'meal_plan': 900,
+    'foods_to_avoid': 200,
+    'therapeutic_foods': 200,
+    'meal_timing': 200,
+    'hydration': 150,
+    'monitoring': 200,
+    'disclaimers': 150,
+}
+
+
+def normalize_field(value):
+    """Comparable form of a profile value: trimmed lowercase text, sorted lists"""
+    if isinstance(value, (list, tuple)):
+        return sorted(normalize_field(item) for item in value)
+    if isinstance(value, str):
+        return value.lower().strip()
+    return value
+
+
+def section_token_budget(section_names):
+    return min(2500, sum(SECTION_TOKEN_BUDGET[name] for name in section_names))
+
+
+def split_plan_sections(plan_text, section_names=None):
+    """
+    {name: text} for the given sections (all by default), each running from its header line to the next header.
+    Returns None unless every section is present, in plan order.
+    """
+    section_names = SECTION_NAMES if section_names is None else [n for n in SECTION_NAMES if n in section_names]
+    if not plan_text:
+        return None
+
+    starts = []
+    position = 0
+    for name in section_names:
+        index = plan_text.find(SECTION_MARKERS[name], position)
+        if index == -1:
+            return None
+        line_start = plan_text.rfind('\n', 0, index) + 1
+        starts.append((name, line_start))
+        position = index + len(SECTION_MARKERS[name])
+
+    sections = {}
+    for i, (name, start) in enumerate(starts):
+        end = starts[i + 1][1] if i + 1 < len(starts) else len(plan_text)
+        sections[name] = plan_text[start:end].strip()
+    return sections
+
+
+def merge_plan_sections(kept_sections, new_sections):
+    """Full plan text from reused and regenerated sections, in plan order"""
+    return '\n\n'.join(
+        kept_sections.get(name) or new_sections[name] for name in SECTION_NAMES
+    )
+
+
+class SectionCache:
+    """Plan sections keyed by the values of the profile fields (and calorie target) they depend on"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or SECTION_CACHE_MAX_ENTRIES
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = {'sections_reused': 0, 'sections_regenerated': 0, 'partial_regenerations': 0}
+
+    def section_key(self, name, mapped_data, daily_calories):
+        key_data = {field: normalize_field(mapped_data.get(field)) for field in SECTION_DEPENDENCIES[name]}
+        key_data['section'] = name
+        if 'weight' in SECTION_DEPENDENCIES[name]:
+            key_data['daily_calories'] = daily_calories
+        return hashlib.md5(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, mapped_data, daily_calories, exclude=()):
+        """Cached sections still valid for this profile, minus any the caller wants rewritten"""
+        found = {}
+        with self.lock:
+            for name in SECTION_NAMES:
+                if name in exclude:
+                    continue
+                text = self.entries.get(self.section_key(name, mapped_data, daily_calories))
+                if text is not None:
+                    found[name] = text
+        return found
+
+    def store(self, mapped_data, daily_calories, plan_text):
+        """Cache every section of a complete plan; returns False if the plan could not be split"""
+        sections = split_plan_sections(plan_text)
+        if sections is None:
+            return False
+        self.store_sections(mapped_data, daily_calories, sections)
+        return True
+
+    def store_sections(self, mapped_data, daily_calories, sections):
+        """Cache individual sections ({name: text}) written for this profile"""
+        with self.lock:
+            for name, text in sections.items():
+                key = self.section_key(name, mapped_data, daily_calories)
+                self.entries.pop(key, None)
+                while len(self.entries) >= self.max_entries:
+                    # Dict order is insertion order, so this evicts the oldest sections first
+                    del self.entries[next(iter(self.entries))]
+                self.entries[key] = text
+
+    def record(self, reused, regenerated):
+        with self.lock:
+            self.stats['sections_reused'] += reused
+            self.stats['sections_regenerated'] += regenerated
+            self.stats['partial_regenerations'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'enabled': SECTION_REGEN_ENABLED}
@@ -0,0 +1,107 @@
+"""
+Server-side store of generated plans, keyed by a hash of the plan content.
+
+/generate_diet returns a plan_id so clients can fetch the plan (GET /plans/<id>)
+or its PDF by ID instead of posting the whole result back. Results are kept
+gzip-compressed, which is also what most clients ask to receive.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+PLAN_STORE_TTL_DAYS = float(os.environ.get('PLAN_STORE_TTL_DAYS', 30))
+# Old plans are purged every this many saves
+PLAN_STORE_PURGE_EVERY = int(os.environ.get('PLAN_STORE_PURGE_EVERY', 500))
+
+# Fields that make up a plan's identity; timestamps and per-request metadata are left out
+PLAN_ID_FIELDS = ('diet_plan', 'bmr', 'bmi', 'bmi_category', 'daily_calories')
+
+
+def plan_id_for(result):
+    content = {field: result.get(field) for field in PLAN_ID_FIELDS}
+    # Cached responses omit the risk fields, so normalize them to get the same ID for the same plan
+    content['high_risk'] = bool(result.get('high_risk'))
+    content['risk_condition'] = result.get('risk_condition') or None
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:24]
+
+
+class PlanStore:
+    """SQLite store of generated results (gzip-compressed JSON) by content-hash plan ID"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.environ.get('PLAN_STORE_DB', 'plan_store.db')
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.saves = 0
+
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS plans (
+                plan_id TEXT PRIMARY KEY,
+                result_gzip BLOB NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                created_at INTEGER NOT NULL,
+                created_date TEXT
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_created ON plans (created_at)")
+        self.conn.commit()
+
+    def save(self, result):
+        """Store a successful result and return its plan ID (identical plans share one row)"""
+        plan_id = plan_id_for(result)
+        raw = json.dumps({**result, 'plan_id': plan_id}).encode()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO plans VALUES (?, ?, ?, ?, ?)",
+                (plan_id, gzip.compress(raw, compresslevel=6), len(raw), int(time.time()),
+                 datetime.now().isoformat())
+            )
+            self.conn.commit()
+            self.saves += 1
+            if self.saves % PLAN_STORE_PURGE_EVERY == 0:
+                self._purge()
+        return plan_id
+
+    def exists(self, plan_id):
+        """Whether a result is stored under plan_id, without reading it"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM plans WHERE plan_id = ?", (plan_id,)).fetchone() is not None
+
+    def get_compressed(self, plan_id):
+        """Stored gzip bytes of a result, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT result_gzip FROM plans WHERE plan_id = ?", (plan_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, plan_id):
+        """Stored result dict, or None"""
+        compressed = self.get_compressed(plan_id)
+        return json.loads(gzip.decompress(compressed)) if compressed is not None else None
+
+    def recent(self, limit):
+        """The most recently stored results, newest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT result_gzip FROM plans ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(gzip.decompress(row[0])) for row in rows]
+
+    def _purge(self):
+        cutoff = int(time.time() - PLAN_STORE_TTL_DAYS * 24 * 3600)
+        deleted = self.conn.execute("DELETE FROM plans WHERE created_at < ?", (cutoff,)).rowcount
+        self.conn.commit()
+        if deleted:
+            print(f"🧹 Purged {deleted} stored plans older than {PLAN_STORE_TTL_DAYS:g} days")
+
+    def get_stats(self):
+        with self.lock:
+            count, raw, stored = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(result_gzip)), 0) FROM plans"
+            ).fetchone()
+        return {'plans': count, 'raw_bytes': raw, 'stored_bytes': stored}
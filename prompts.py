@@ -1,9 +1,144 @@
+# Sections of the plan in output order: (name, header marker, template with {calories})
+OUTPUT_SECTIONS = [
+    ('clinical_assessment', '🔬 CLINICAL ASSESSMENT', """\
+**🔬 CLINICAL ASSESSMENT:**
+
+*Medical Terminology Interpretation:*
+[If any medical terms appear misspelled, clarify: "Interpreting '[original text]' as '[corrected term]'"]
+
+*Medical Nutrition Analysis:*
+[Analyze any medical conditions mentioned and their nutritional implications]
+
+*Drug-Nutrient Considerations:*
+[Identify any food-medication interactions and timing recommendations, noting any spelling corrections made]
+
+*BMI & Goal Strategy:*
+[Determine if weight management is needed and appropriate approach]
+
+*Special Dietary Needs:*
+[Address any allergies, restrictions, or cultural dietary requirements]"""),
+    ('macronutrients', '📊 PERSONALIZED MACRONUTRIENT PLAN', """\
+**📊 PERSONALIZED MACRONUTRIENT PLAN:**
+
+Based on your analysis, determine optimal distribution:
+- **Protein:** [X]g ([X]% of calories) - [Reasoning for this amount]
+- **Carbohydrates:** [X]g ([X]% of calories) - [Reasoning for this amount]
+- **Fats:** [X]g ([X]% of calories) - [Reasoning for this amount]"""),
+    ('meal_plan', '🍽️ DAILY MEAL PLAN', """\
+**🍽️ DAILY MEAL PLAN ({calories} calories):**
+
+**BREAKFAST ([X] calories):**
+*Meal:* [Specific meal with exact portions]
+*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
+*Medical Benefits:* [Why this meal supports their health conditions]
+*Timing Notes:* [Any medication timing considerations]
+
+**LUNCH ([X] calories):**
+*Meal:* [Specific meal with exact portions]
+*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
+*Medical Benefits:* [Why this meal supports their health conditions]
+*Timing Notes:* [Any medication timing considerations]
+
+**DINNER ([X] calories):**
+*Meal:* [Specific meal with exact portions]
+*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
+*Medical Benefits:* [Why this meal supports their health conditions]
+*Timing Notes:* [Any medication timing considerations]"""),
+    ('foods_to_avoid', '🚫 FOODS TO STRICTLY AVOID', """\
+**🚫 FOODS TO STRICTLY AVOID:**
+[List specific foods to avoid based on medical conditions, medications, and allergies]"""),
+    ('therapeutic_foods', '✅ THERAPEUTIC FOODS TO EMPHASIZE', """\
+**✅ THERAPEUTIC FOODS TO EMPHASIZE:**
+[List foods that specifically benefit their medical conditions]"""),
+    ('meal_timing', '⏰ MEAL TIMING STRATEGY', """\
+**⏰ MEAL TIMING STRATEGY:**
+[Specific timing recommendations based on medications, fasting schedule, and medical needs]"""),
+    ('hydration', '💧 HYDRATION PLAN', """\
+**💧 HYDRATION PLAN:**
+[Water intake recommendations considering medical conditions and medications]"""),
+    ('monitoring', '🔄 MONITORING & ADJUSTMENTS', """\
+**🔄 MONITORING & ADJUSTMENTS:**
+[What to watch for and when to consult healthcare provider]"""),
+    ('disclaimers', '⚠️ IMPORTANT MEDICAL DISCLAIMERS', """\
+**⚠️ IMPORTANT MEDICAL DISCLAIMERS:**
+- This plan is based on the information provided
+- Consult your healthcare provider before implementing any dietary changes
+- Monitor for any adverse reactions, especially with [specific conditions mentioned]
+- Regular follow-up recommended for [specific monitoring needs based on conditions]"""),
+]
+SECTION_NAMES = [name for name, marker, template in OUTPUT_SECTIONS]
+SECTION_MARKERS = {name: marker for name, marker, template in OUTPUT_SECTIONS}
+
+
 def build_intelligent_diet_prompt(data, calories):
     """
     LLM-driven prompt that provides ALL user data and lets the AI make intelligent decisions
     Rather than hardcoding medical logic, we trust the LLM's medical knowledge
     """
 
+    prompt = f"""
+You are a SENIOR CLINICAL NUTRITIONIST with 20+ years of experience. You have deep knowledge of:
+- Medical nutrition therapy for ALL conditions
+- Drug-nutrient interactions for ALL medications
+- Cultural and dietary preferences
+- Exercise physiology and nutrition
+- BMI-based nutritional strategies
+
+**IMPORTANT: TYPO AND SPELLING TOLERANCE**
+- Users may have typos or misspellings in medical conditions, medications, or other information
+- Use your medical knowledge to interpret likely meanings (e.g., "diabetis" = "diabetes", "hypertenion" = "hypertension")
+- For medications, consider common misspellings (e.g., "metformin" vs "metformin", "lisinopril" vs "lisiniprol")
+- If uncertain about a term, mention both the original text and your interpretation
+- Always prioritize safety - if a term is completely unclear, recommend medical consultation
+
+{format_patient_profile(data, calories)}
+
+**YOUR EXPERT ANALYSIS REQUIRED:**
+═══════════════════════════════════════════════════════════════════════════════════
+
+Using your extensive medical and nutritional knowledge, please:
+
+1. **INTERPRET & ANALYZE** the complete patient profile above (correcting any obvious typos or misspellings)
+2. **IDENTIFY** any medical conditions that require specific nutritional interventions
+3. **RECOGNIZE** potential drug-nutrient interactions from medications listed (even if misspelled)
+4. **DETERMINE** appropriate macronutrient distribution based on BMI, goals, and medical needs
+5. **CONSIDER** cultural and personal preferences while maintaining medical safety
+6. **CREATE** a comprehensive, safe, and personalized nutrition plan
+
+**CRITICAL REQUIREMENTS:**
+- Interpret misspelled medical conditions and medications using your clinical knowledge
+- If ANY medical condition is mentioned (even with typos), apply evidence-based medical nutrition therapy
+- For ANY medication listed (even misspelled), consider known food-drug interactions
+- Respect ALL dietary restrictions and allergies mentioned
+- If a term is unclear or potentially dangerous due to ambiguity, note this and recommend medical consultation
+- Adapt meal timing if fasting schedule is specified
+- Stay within the specified budget range
+- Include foods from preferred cuisines when medically appropriate
+
+**MANDATORY OUTPUT FORMAT:**
+═══════════════════════════════════════════════════════════════════════════════════
+
+{format_output_sections(calories)}
+
+═══════════════════════════════════════════════════════════════════════════════════
+
+**CRITICAL INSTRUCTIONS FOR CONSISTENCY:**
+1. Interpret obvious typos and misspellings using medical knowledge before analysis
+2. Base ALL recommendations on established medical nutrition therapy principles
+3. If unsure about a misspelled term that could affect safety, note the ambiguity and recommend medical consultation
+4. Always provide the exact calorie and macronutrient breakdown requested
+5. Include specific portion sizes (grams, cups, pieces)
+6. Maintain the exact format structure above
+7. Be thorough but concise in explanations
+8. Prioritize SAFETY over preferences when medical conditions are present
+9. When correcting terminology, briefly mention: "Interpreting '[original]' as '[corrected]'"
+"""
+
+    return prompt
+
+
+def format_patient_profile(data, calories):
+    """Patient profile block shared by the full and section regeneration prompts"""
     # Basic calculations for reference
     try:
         weight = float(data.get('weight', 70))
@@ -41,22 +176,7 @@ def build_intelligent_diet_prompt(data, calories):
         }
     }
 
-    prompt = f"""
-You are a SENIOR CLINICAL NUTRITIONIST with 20+ years of experience. You have deep knowledge of:
-- Medical nutrition therapy for ALL conditions
-- Drug-nutrient interactions for ALL medications
-- Cultural and dietary preferences
-- Exercise physiology and nutrition
-- BMI-based nutritional strategies
-
-**IMPORTANT: TYPO AND SPELLING TOLERANCE**
-- Users may have typos or misspellings in medical conditions, medications, or other information
-- Use your medical knowledge to interpret likely meanings (e.g., "diabetis" = "diabetes", "hypertenion" = "hypertension")
-- For medications, consider common misspellings (e.g., "metformin" vs "metformin", "lisinopril" vs "lisiniprol")
-- If uncertain about a term, mention both the original text and your interpretation
-- Always prioritize safety - if a term is completely unclear, recommend medical consultation
-
-**PATIENT COMPLETE PROFILE:**
+    return f"""**PATIENT COMPLETE PROFILE:**
 ═══════════════════════════════════════════════════════════════════════════════════
 
 👤 **BASIC INFORMATION:**
@@ -83,110 +203,98 @@ You are a SENIOR CLINICAL NUTRITIONIST with 20+ years of experience. You have de
 • Fasting Schedule: {user_profile['lifestyle_info']['fasting_schedule']}
 • Fasting Details: {user_profile['lifestyle_info']['fasting_details']}
 
-🎯 **TARGET DAILY CALORIES: {calories}**
+🎯 **TARGET DAILY CALORIES: {calories}**"""
 
-**YOUR EXPERT ANALYSIS REQUIRED:**
-═══════════════════════════════════════════════════════════════════════════════════
 
-Using your extensive medical and nutritional knowledge, please:
+def format_output_sections(calories, names=None):
+    """Output format templates for the given sections (all by default), in plan order"""
+    return '\n\n'.join(
+        template.format(calories=calories)
+        for name, marker, template in OUTPUT_SECTIONS
+        if names is None or name in names
+    )
 
-1. **INTERPRET & ANALYZE** the complete patient profile above (correcting any obvious typos or misspellings)
-2. **IDENTIFY** any medical conditions that require specific nutritional interventions
-3. **RECOGNIZE** potential drug-nutrient interactions from medications listed (even if misspelled)
-4. **DETERMINE** appropriate macronutrient distribution based on BMI, goals, and medical needs
-5. **CONSIDER** cultural and personal preferences while maintaining medical safety
-6. **CREATE** a comprehensive, safe, and personalized nutrition plan
 
-**CRITICAL REQUIREMENTS:**
-- Interpret misspelled medical conditions and medications using your clinical knowledge
-- If ANY medical condition is mentioned (even with typos), apply evidence-based medical nutrition therapy
-- For ANY medication listed (even misspelled), consider known food-drug interactions
-- Respect ALL dietary restrictions and allergies mentioned
-- If a term is unclear or potentially dangerous due to ambiguity, note this and recommend medical consultation
-- Adapt meal timing if fasting schedule is specified
-- Stay within the specified budget range
-- Include foods from preferred cuisines when medically appropriate
+def build_section_regeneration_prompt(data, calories, kept_sections, section_names):
+    """
+    Prompt that rewrites only `section_names` of an existing plan after a profile edit.
+    The unchanged sections ({name: text}) are included so the rewritten ones stay consistent with them;
+    with no kept sections it simply writes `section_names` from the profile.
+    """
+    kept = '\n\n'.join(kept_sections[name] for name in SECTION_NAMES if name in kept_sections)
+    headers = ', '.join(SECTION_MARKERS[name] for name in section_names)
 
-**MANDATORY OUTPUT FORMAT:**
+    if kept:
+        task = "updating an existing nutrition plan after the patient edited their profile"
+        kept_block = f"""**FINAL SECTIONS OF THE CURRENT PLAN (already up to date - do not repeat them):**
 ═══════════════════════════════════════════════════════════════════════════════════
 
-**🔬 CLINICAL ASSESSMENT:**
-
-*Medical Terminology Interpretation:*
-[If any medical terms appear misspelled, clarify: "Interpreting '[original text]' as '[corrected term]'"]
+{kept}
 
-*Medical Nutrition Analysis:*
-[Analyze any medical conditions mentioned and their nutritional implications]
+**SECTIONS TO REWRITE FOR THE UPDATED PROFILE:** {headers}"""
+    else:
+        task = "writing part of a nutrition plan for this patient"
+        kept_block = f"**SECTIONS TO WRITE:** {headers}"
 
-*Drug-Nutrient Considerations:*
-[Identify any food-medication interactions and timing recommendations, noting any spelling corrections made]
+    prompt = f"""
+You are a SENIOR CLINICAL NUTRITIONIST {task}.
+Interpret any typos or misspellings in conditions and medications using your clinical knowledge.
 
-*BMI & Goal Strategy:*
-[Determine if weight management is needed and appropriate approach]
+{format_patient_profile(data, calories)}
 
-*Special Dietary Needs:*
-[Address any allergies, restrictions, or cultural dietary requirements]
+{kept_block}
+═══════════════════════════════════════════════════════════════════════════════════
 
-**📊 PERSONALIZED MACRONUTRIENT PLAN:**
+{format_output_sections(calories, section_names)}
 
-Based on your analysis, determine optimal distribution:
-- **Protein:** [X]g ([X]% of calories) - [Reasoning for this amount]
-- **Carbohydrates:** [X]g ([X]% of calories) - [Reasoning for this amount]
-- **Fats:** [X]g ([X]% of calories) - [Reasoning for this amount]
+═══════════════════════════════════════════════════════════════════════════════════
 
-**🍽️ DAILY MEAL PLAN ({calories} calories):**
+**CRITICAL INSTRUCTIONS:**
+1. Output ONLY the sections above, in that order, with exactly those headers
+2. Respect every allergy, restriction and drug-nutrient interaction in the profile and in any final sections
+3. Stay within the specified budget range and include foods from preferred cuisines when medically appropriate
+4. Always provide the exact calorie and macronutrient numbers requested
+5. Include specific portion sizes (grams, cups, pieces)
+6. Prioritize SAFETY over preferences when medical conditions are present
+"""
 
-**BREAKFAST ([X] calories):**
-*Meal:* [Specific meal with exact portions]
-*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
-*Medical Benefits:* [Why this meal supports their health conditions]
-*Timing Notes:* [Any medication timing considerations]
+    return prompt
 
-**LUNCH ([X] calories):**
-*Meal:* [Specific meal with exact portions]
-*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
-*Medical Benefits:* [Why this meal supports their health conditions]
-*Timing Notes:* [Any medication timing considerations]
+def build_weekly_day_prompt(data, calories, context_sections, day_label, day_focus, other_days):
+    """
+    Prompt for one day's meal plan of a multi-day plan. Days are generated concurrently, so variety comes
+    from giving each day its own focus and telling it what the other days are built around.
+    """
+    context = '\n\n'.join(context_sections[name] for name in SECTION_NAMES if name in context_sections)
 
-**DINNER ([X] calories):**
-*Meal:* [Specific meal with exact portions]
-*Key Nutrients:* [X]g protein, [X]g carbs, [X]g fats
-*Medical Benefits:* [Why this meal supports their health conditions]
-*Timing Notes:* [Any medication timing considerations]
+    prompt = f"""
+You are a SENIOR CLINICAL NUTRITIONIST writing {day_label} of a rotating multi-day meal plan for this patient.
 
-**🚫 FOODS TO STRICTLY AVOID:**
-[List specific foods to avoid based on medical conditions, medications, and allergies]
+{format_patient_profile(data, calories)}
 
-**✅ THERAPEUTIC FOODS TO EMPHASIZE:**
-[List foods that specifically benefit their medical conditions]
+**CLINICAL PLAN FOR THE WHOLE PLAN PERIOD (final - do not repeat it):**
+═══════════════════════════════════════════════════════════════════════════════════
 
-**⏰ MEAL TIMING STRATEGY:**
-[Specific timing recommendations based on medications, fasting schedule, and medical needs]
+{context}
 
-**💧 HYDRATION PLAN:**
-[Water intake recommendations considering medical conditions and medications]
+**VARIETY FOR {day_label.upper()}:**
+- Build this day around: {day_focus}
+- The other days are built around: {other_days}
+- Do not reuse main dishes typical of the other days
 
-**🔄 MONITORING & ADJUSTMENTS:**
-[What to watch for and when to consult healthcare provider]
+**SECTIONS TO WRITE:** {SECTION_MARKERS['meal_plan']}
+═══════════════════════════════════════════════════════════════════════════════════
 
-**⚠️ IMPORTANT MEDICAL DISCLAIMERS:**
-- This plan is based on the information provided
-- Consult your healthcare provider before implementing any dietary changes
-- Monitor for any adverse reactions, especially with [specific conditions mentioned]
-- Regular follow-up recommended for [specific monitoring needs based on conditions]
+{format_output_sections(calories, ['meal_plan'])}
 
 ═══════════════════════════════════════════════════════════════════════════════════
 
-**CRITICAL INSTRUCTIONS FOR CONSISTENCY:**
-1. Interpret obvious typos and misspellings using medical knowledge before analysis
-2. Base ALL recommendations on established medical nutrition therapy principles
-3. If unsure about a misspelled term that could affect safety, note the ambiguity and recommend medical consultation
-4. Always provide the exact calorie and macronutrient breakdown requested
-5. Include specific portion sizes (grams, cups, pieces)
-6. Maintain the exact format structure above
-7. Be thorough but concise in explanations
-8. Prioritize SAFETY over preferences when medical conditions are present
-9. When correcting terminology, briefly mention: "Interpreting '[original]' as '[corrected]'"
+**CRITICAL INSTRUCTIONS:**
+1. Output ONLY the daily meal plan section above, with exactly that header
+2. Follow the macronutrient plan and respect every allergy, restriction and drug-nutrient interaction above
+3. Meal calories must add up to {calories}
+4. Include specific portion sizes (grams, cups, pieces)
+5. If the day's focus conflicts with an allergy or restriction, substitute a safe alternative
 """
 
     return prompt
@@ -0,0 +1,38 @@
+import json
+import os
+
+# Importing app must not build the Groq client or open the caches
+os.environ.setdefault('DEFER_WORKER_INIT', 'true')
+
+import app
+from batch import BatchPlanGenerator, BatchProgressStore, parse_batch_profiles
+
+
+class EchoPlanner(app.IntelligentDietPlanner):
+    """The real profile mapping and cache keys, without the LLM"""
+
+    def __init__(self):
+        pass
+
+    def generate_intelligent_diet_plan(self, user_data, batch=False):
+        return {'success': True, 'diet_plan': f"plan for {user_data.get('id')}"}
+
+
+def test_malformed_row_fails_alone(tmp_path):
+    body = '\n'.join(json.dumps(row) for row in [
+        {'id': 'a', 'age': '40', 'diagnosis': 'hypertension'},
+        {'id': 'b', 'age': '50', 'diagnosis': None},
+        {'id': 'c', 'age': '60', 'medicines': 42},
+    ]) + '\nnot json\n'
+    generator = BatchPlanGenerator(EchoPlanner(), BatchProgressStore(str(tmp_path / 'progress.db')))
+
+    events = list(generator.stream(parse_batch_profiles(body, 'application/x-ndjson')))
+
+    items = {event['index']: event for event in events if event['type'] == 'item'}
+    assert sorted(items) == [0, 1, 2, 3]
+    assert items[0]['success'] and items[0]['result']['diet_plan'] == 'plan for a'
+    for index in (1, 2, 3):
+        assert items[index]['success'] is False
+        assert items[index]['error']
+    assert events[-1]['type'] == 'summary'
+    assert events[-1]['succeeded'] == 1 and events[-1]['failed'] == 3
@@ -0,0 +1,40 @@
+import itertools
+
+from local_planner import (LOCAL_PLANNER_MACRO_TOLERANCE, LOCAL_PLANNER_TOLERANCE, DIET_SOURCES,
+                           LocalMealPlanner)
+
+NORMAL_BMI = {'category': 'Normal weight', 'advice': ''}
+
+
+def test_served_plans_hit_every_target():
+    planner = LocalMealPlanner(enabled=True)
+    served = 0
+    for calories, diet, goal, cuisines in itertools.product(
+            (1600, 2200, 2800), DIET_SOURCES, ('balanced', 'lose_fat', 'gain_muscle'),
+            (['indian'], ['asian'], ['latin'], ['any'])):
+        profile = {'diet-type': diet, 'diet-goal': goal, 'cuisines': cuisines, 'allergies': '', 'weight': '70'}
+        result = planner.plan(profile, calories, 22.0, NORMAL_BMI)
+        if result is None:
+            continue
+        served += 1
+        totals, targets = result[1]['totals'], result[1]['targets']
+        assert abs(totals['calories'] - calories) <= calories * LOCAL_PLANNER_TOLERANCE
+        for key in ('protein', 'carbs', 'fat'):
+            assert abs(totals[key] - targets[key]) <= targets[key] * LOCAL_PLANNER_MACRO_TOLERANCE + 1
+    assert served
+
+
+def test_unreachable_protein_goes_to_the_llm():
+    planner = LocalMealPlanner(enabled=True)
+    profile = {'diet-type': 'vegetarian', 'diet-goal': 'gain_muscle', 'cuisines': ['indian'],
+               'allergies': 'peanuts, milk', 'weight': '70'}
+
+    assert planner.plan(profile, 2160, 22.0, NORMAL_BMI) is None
+    assert planner.get_stats()['declined'] == {'macro_target_unreachable': 1}
+
+
+def test_form_cuisines_use_catalog_foods():
+    planner = LocalMealPlanner(enabled=True)
+    assert planner.eligibility({'diet-type': 'vegan', 'cuisines': ['korean']}, 'Normal weight') == \
+        (False, 'cuisine_not_covered')
+    assert planner._catalog_cuisines({'cuisines': ['latin', 'japanese']}) == ({'mexican', 'japanese'}, True)
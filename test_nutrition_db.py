@@ -0,0 +1,42 @@
+import pytest
+
+from nutrition_db import NutritionDatabaseIntegration
+from perf.fakes import start_fake_services
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh cache file talking to the fake RxNav"""
+    env, stop = start_fake_services('fast', ports={'groq': 0, 'usda': 0, 'rxnorm': 0})
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv('NUTRITION_CACHE_DB', str(tmp_path / 'nutrition.db'))
+    yield NutritionDatabaseIntegration('test-key')
+    stop()
+
+
+def test_unresolved_drug_pairs_are_unchecked(db):
+    result = db.get_drug_drug_interactions(['warfarin', 'zzqxplorin', 'aspirin', 'Warfarin 5mg'])
+
+    assert result['unresolved_medications'] == ['zzqxplorin']
+    assert result['pairs_checked'] == 1
+    assert sorted(map(sorted, result['unchecked_pairs'])) == [['aspirin', 'zzqxplorin'],
+                                                               ['warfarin', 'zzqxplorin']]
+
+
+def test_misspelled_first_lookup_keeps_built_in_guidance(db):
+    misspelled = db.get_drug_food_guidance('warfrin')
+    correct = db.get_drug_food_guidance('Warfarin')
+
+    assert misspelled['medication'] == 'warfrin' and correct['medication'] == 'Warfarin'
+    assert 'Evidence-based guidance for warfarin' in misspelled['special_considerations']
+    assert 'Limit alcohol consumption' in misspelled['food_restrictions']
+    for category in ('food_restrictions', 'timing_recommendations', 'special_considerations'):
+        assert correct[category] == misspelled[category]
+
+
+def test_distant_approximate_match_is_unresolved(db):
+    # The fake's best candidate for 'aspirol' is aspirin, 71% alike
+    assert db._resolve_rxcui('aspirol') is None
+    assert db._resolve_rxcui('metformine') == '6809'
+    assert db.get_drug_resolution_stats()['unresolved'] == 1
@@ -0,0 +1,189 @@
+"""
+Multi-day (weekly) plan generation.
+
+The clinical sections (assessment, macronutrients, foods to avoid, ...) are
+written once, then every day's meal plan is requested concurrently through
+the LLM scheduler. Each day gets its own cuisine/protein/grain focus and is
+told what the other days use, so the days vary even though none of them sees
+the others' output. Wall time is one core completion plus one day's meals.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from prompts import (build_section_regeneration_prompt, build_weekly_day_prompt, validate_response_format,
+                     flag_high_risk_case, SECTION_NAMES)
+from plan_sections import split_plan_sections, section_token_budget, SECTION_TOKEN_BUDGET
+from nutrition_verifier import MEAL_LINE
+import flight_recorder
+
+
+WEEKLY_MAX_DAYS = int(os.environ.get('WEEKLY_MAX_DAYS', 7))
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+CORE_SECTIONS = [name for name in SECTION_NAMES if name != 'meal_plan']
+# Clinical context each day's meal plan is written against
+DAY_CONTEXT_SECTIONS = ('clinical_assessment', 'macronutrients', 'foods_to_avoid', 'meal_timing')
+
+PROTEIN_ROTATION = {
+    'vegan': ['lentils', 'chickpeas', 'tofu', 'black beans', 'tempeh', 'kidney beans', 'edamame'],
+    'vegetarian': ['paneer', 'lentils', 'Greek yogurt', 'chickpeas', 'tofu', 'kidney beans', 'cottage cheese'],
+    'eggetarian': ['eggs', 'lentils', 'paneer', 'chickpeas', 'Greek yogurt', 'tofu', 'kidney beans'],
+    'non-vegetarian': ['chicken', 'fish', 'lentils', 'eggs', 'turkey', 'chickpeas', 'lean beef'],
+}
+GRAIN_ROTATION = ['oats', 'brown rice', 'quinoa', 'whole wheat', 'millet', 'barley', 'sweet potato']
+DEFAULT_CUISINES = ['home-style']
+
+
+def day_focuses(mapped_data, days):
+    """One 'cuisine, protein, grain' focus per day, rotating through the patient's preferences"""
+    cuisines = [c for c in mapped_data.get('cuisines') or [] if c] or DEFAULT_CUISINES
+    proteins = PROTEIN_ROTATION.get(str(mapped_data.get('diet-type', '')).lower(), PROTEIN_ROTATION['vegetarian'])
+    return [
+        f"{cuisines[day % len(cuisines)]} cuisine, {proteins[day % len(proteins)]} as the main protein, "
+        f"{GRAIN_ROTATION[day % len(GRAIN_ROTATION)]} as the main carbohydrate"
+        for day in range(days)
+    ]
+
+
+def repeated_meals(day_plans):
+    """Meal descriptions that appear on more than one day"""
+    seen = {}
+    for day in day_plans:
+        for line in MEAL_LINE.findall(day['meal_plan']):
+            seen.setdefault(line.strip().lower(), set()).add(day['day'])
+    return sorted(meal for meal, days in seen.items() if len(days) > 1)
+
+
+class WeeklyPlanGenerator:
+    """Core sections once, then one concurrent meal-plan completion per day"""
+
+    def __init__(self, planner, max_days=None):
+        self.planner = planner
+        self.max_days = max_days or WEEKLY_MAX_DAYS
+
+    def generate(self, user_data, days=7, deadline=None):
+        """Weekly plan result; every completion shares `deadline` and days that miss it are reported as failed"""
+        started = time.perf_counter()
+        try:
+            days = max(1, min(int(days), self.max_days))
+            planner = self.planner
+            mapped_data, bmr, bmi, bmi_info, daily_calories = planner.prepare_profile(user_data)
+            is_high_risk, risk_condition = flag_high_risk_case(mapped_data)
+            route = planner.router.route(mapped_data, is_high_risk)
+
+            # Clinical sections: reuse them from an earlier plan for this profile when possible
+            core = {}
+            if not is_high_risk:
+                core = planner.section_cache.lookup(mapped_data, daily_calories, exclude=('meal_plan',))
+            missing = [name for name in CORE_SECTIONS if name not in core]
+            models = set()
+            if missing:
+                prompt = build_section_regeneration_prompt(mapped_data, daily_calories, core, missing)
+                content, llm_info = planner._complete_plan(
+                    planner._enhance_prompt(prompt, mapped_data, deadline), route, is_high_risk, False,
+                    max_tokens=section_token_budget(missing), deadline=deadline
+                )
+                written = split_plan_sections(content, missing)
+                if written is None:
+                    return {'success': False, 'error': 'Clinical sections of the weekly plan were incomplete',
+                            'error_type': 'generation_error'}
+                core.update(written)
+                models.add(llm_info['model'])
+                if not is_high_risk:
+                    planner.section_cache.store_sections(mapped_data, daily_calories, written)
+            reused = [name for name in CORE_SECTIONS if name not in missing]
+            print(f"📅 Weekly plan: {len(reused)} clinical sections reused, generating {days} days concurrently")
+
+            context = {name: core[name] for name in DAY_CONTEXT_SECTIONS}
+            focuses = day_focuses(mapped_data, days)
+
+            def generate_day(day):
+                label = f"Day {day + 1} ({WEEKDAYS[day % 7]})"
+                others = '; '.join(f"Day {other + 1}: {focus}" for other, focus in enumerate(focuses) if other != day)
+                prompt = build_weekly_day_prompt(mapped_data, daily_calories, context, label, focuses[day], others)
+                with flight_recorder.stage('weekly_day', day=day + 1):
+                    content, llm_info = planner._complete_plan(
+                        prompt, route, is_high_risk, False, max_tokens=SECTION_TOKEN_BUDGET['meal_plan'],
+                        deadline=deadline
+                    )
+                section = split_plan_sections(content, ['meal_plan'])
+                if section is None:
+                    raise ValueError(f"{label} meal plan was incomplete")
+                # Keep the meals, drop the per-day "DAILY MEAL PLAN" header line
+                meals = section['meal_plan'].split('\n', 1)[1].strip() if '\n' in section['meal_plan'] else ''
+                return {'day': day + 1, 'label': label, 'focus': focuses[day], 'meal_plan': meals,
+                        'model': llm_info['model']}
+
+            # Days are queued on the shared LLM scheduler, which enforces the rate limits
+            day_plans, failed_days = [], []
+            with ThreadPoolExecutor(max_workers=days) as executor:
+                futures = [flight_recorder.run_in_context(executor, generate_day, day) for day in range(days)]
+                for day, future in enumerate(futures):
+                    try:
+                        day_plans.append(future.result())
+                    except Exception as e:
+                        failed_days.append({'day': day + 1, 'error': str(e)})
+
+            if not day_plans:
+                return {'success': False, 'error': failed_days[0]['error'] if failed_days else 'No days generated',
+                        'error_type': 'generation_error'}
+            models.update(day['model'] for day in day_plans)
+
+            if planner.nutrition_db and planner.verifier.enabled:
+                for day in day_plans:
+                    try:
+                        day['nutrition_verification'] = planner.verifier.verify(day['meal_plan'], daily_calories,
+                                                                                deadline=deadline)
+                    except Exception as e:
+                        print(f"⚠️ Warning: Nutrition verification failed for day {day['day']}: {e}")
+
+            diet_plan_content = self.merge(core, day_plans, daily_calories)
+            validation = validate_response_format(diet_plan_content)
+            result = {
+                'success': True,
+                'bmr': int(bmr),
+                'bmi': bmi,
+                'bmi_category': bmi_info['category'],
+                'bmi_advice': bmi_info['advice'],
+                'daily_calories': daily_calories,
+                'calorie_adjustment': f"{int((bmi_info['calorie_adjustment'] - 1) * 100):+d}% based on BMI",
+                'diet_plan': diet_plan_content,
+                'days': day_plans,
+                'plan_days': days,
+                'failed_days': failed_days,
+                'repeated_meals': repeated_meals(day_plans),
+                'high_risk': is_high_risk,
+                'risk_condition': risk_condition if is_high_risk else None,
+                'validation': validation,
+                'generated_at': datetime.now().isoformat(),
+                'approach': 'weekly_fan_out',
+                'nutrition_db_used': planner.nutrition_db is not None,
+                'model': ', '.join(sorted(models)),
+                'model_tier': route['tier'],
+                'reused_sections': reused,
+                'elapsed_seconds': round(time.perf_counter() - started, 2)
+            }
+            if is_high_risk:
+                result['medical_warning'] = (f"High-risk condition detected: {risk_condition}. "
+                                             f"Please consult healthcare provider before implementing this plan.")
+            if failed_days:
+                result['format_warning'] = f"{len(failed_days)} of {days} days could not be generated"
+            return result
+
+        except Exception as e:
+            print(f"Error in weekly plan generation: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'error_type': 'generation_error'
+            }
+
+    def merge(self, core, day_plans, daily_calories):
+        """One document: the clinical sections with a day-by-day meal plan in place of the single day"""
+        days = '\n\n'.join(
+            f"**📅 {day['label'].upper()} - {day['focus']}:**\n\n{day['meal_plan']}" for day in day_plans
+        )
+        meal_plan = f"**🍽️ DAILY MEAL PLAN - {len(day_plans)}-DAY ROTATION ({daily_calories} calories/day):**\n\n{days}"
+        return '\n\n'.join(meal_plan if name == 'meal_plan' else core[name] for name in SECTION_NAMES)